@@ -0,0 +1,402 @@
+"""
+Occupancy and revenue rollups for GET /api/admin/analytics.
+
+Every booking contributes to hourly and daily buckets per (location, floor):
+``bookings`` and ``revenue`` in the bucket its window starts in, and
+``occupied_minutes`` (slot-minutes) in every bucket its window overlaps.
+Cancelled bookings keep their count and revenue, as in the dashboard stats, but
+stop occupying. ``RollupStore.record(before, after)`` turns a booking write into
+the difference of the two contributions and buffers it; a background thread
+applies the buffer with one unordered bulk_write of $inc upserts, so ranges are
+read from a few small documents instead of scanning bookings. Deltas a flush
+could not write go back into the buffer, and the buffer is flushed once more
+when the process exits.
+
+``RollupStore.backfill`` rebuilds everything from bookings and archived bookings
+with one aggregation per batch of start dates, into a side collection that
+replaces the live one when done. It usually runs in its own process, so it
+announces itself with a marker document: while the marker says it is running,
+every worker holds its booking writes instead of flushing them into rollups
+that are about to be replaced. Once it is done, each held write is replayed on
+the rebuilt rollups, counting only what its batch's aggregation could not have
+seen (a side of the write whose start falls in a batch aggregated before it).
+"""
+
+import atexit
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from stats import as_amount
+
+GRANULARITIES = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+
+ROLLUP_FIELDS = ('bookings', 'revenue', 'occupied_minutes')
+
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+
+BACKFILL_ID = 'backfill'
+# How often an unbuffered store (ANALYTICS_FLUSH_SECONDS=0) re-reads the backfill marker
+HOLD_CHECK_SECONDS = 5
+# A running marker not touched for this long belongs to a backfill that died
+BACKFILL_STALE = timedelta(minutes=10)
+
+
+def bucket_start(value, granularity):
+    if granularity == 'day':
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_id(granularity, location, floor, bucket):
+    return f'{granularity}|{location}|{floor}|{bucket.isoformat()}'
+
+
+def contributions(booking):
+    """{(granularity, location, floor, bucket): counters} for one booking (empty for legacy string windows)."""
+    start, end = booking.get('start_at'), booking.get('end_at')
+    if not isinstance(start, datetime) or not isinstance(end, datetime) or end <= start:
+        return {}
+    location, floor = booking.get('location'), booking.get('floor') or 1
+    counters = {}
+    for granularity, step in GRANULARITIES.items():
+        bucket = bucket_start(start, granularity)
+        counters[(granularity, location, floor, bucket)] = {
+            'bookings': 1,
+            'revenue': as_amount(booking.get('amount')),
+        }
+        if booking.get('status') == 'cancelled':
+            continue
+        while bucket < end:
+            following = bucket + step
+            minutes = int((min(end, following) - max(start, bucket)).total_seconds() // 60)
+            counters.setdefault((granularity, location, floor, bucket), {})['occupied_minutes'] = minutes
+            bucket = following
+    return counters
+
+
+def backfill_pipeline(start, end, archive_name=None):
+    """Hourly rollups of the bookings starting in [start, end) (and archived ones, when named)."""
+    match = {'$match': {'start_at': {'$gte': start, '$lt': end}, 'end_at': {'$type': 'date'}}}
+    fields = {'$project': {
+        'location': 1, 'floor': {'$ifNull': ['$floor', 1]}, 'amount': 1, 'status': 1, 'start_at': 1, 'end_at': 1,
+    }}
+    archived = [{'$unionWith': {'coll': archive_name, 'pipeline': [match, fields]}}] if archive_name else []
+    first_hour = {'$subtract': ['$start_at', {'$mod': [{'$toLong': '$start_at'}, HOUR_MS]}]}
+    hours = {'$toInt': {'$ceil': {'$divide': [{'$subtract': ['$end_at', '$first_hour']}, HOUR_MS]}}}
+    bucket_end = {'$add': ['$bucket', HOUR_MS]}
+    overlap_ms = {'$subtract': [{'$min': ['$end_at', bucket_end]}, {'$max': ['$start_at', '$bucket']}]}
+    starts_here = {'$eq': ['$offset', 0]}
+    return [
+        match,
+        fields,
+        *archived,
+        {'$match': {'$expr': {'$gt': ['$end_at', '$start_at']}}},
+        {'$set': {'first_hour': first_hour}},
+        {'$set': {'offset': {'$range': [0, hours]}}},
+        {'$unwind': '$offset'},
+        {'$set': {'bucket': {'$add': ['$first_hour', {'$multiply': ['$offset', HOUR_MS]}]}}},
+        {'$group': {
+            '_id': {'location': '$location', 'floor': '$floor', 'bucket': '$bucket'},
+            'bookings': {'$sum': {'$cond': [starts_here, 1, 0]}},
+            # $sum skips non-numeric amounts, as as_amount does
+            'revenue': {'$sum': {'$cond': [starts_here, '$amount', 0]}},
+            'occupied_minutes': {'$sum': {'$cond': [
+                {'$eq': ['$status', 'cancelled']}, 0, {'$floor': {'$divide': [overlap_ms, 60000]}}
+            ]}},
+        }},
+    ]
+
+
+def _add_contributions(deltas, booking, sign):
+    for key, counters in contributions(booking).items():
+        bucket = deltas.setdefault(key, {})
+        for field, value in counters.items():
+            bucket[field] = bucket.get(field, 0) + sign * value
+
+
+def replay(held, batches):
+    """
+    Deltas for booking writes held during a backfill: [(at, before, after)] against the rebuilt rollups.
+    A side is counted only when its batch was aggregated before the write (or by no batch at all);
+    otherwise the aggregation already read the booking as the write left it.
+    """
+    def counted(booking, at):
+        start = booking.get('start_at')
+        for batch in batches:
+            if isinstance(start, datetime) and batch['start'] <= start < batch['end']:
+                return batch['aggregated_at'] < at
+        return True
+
+    deltas = {}
+    for at, before, after in held:
+        for booking, sign in ((before, -1), (after, 1)):
+            if booking and counted(booking, at):
+                _add_contributions(deltas, booking, sign)
+    return deltas
+
+
+def _rollup_update(key, counters):
+    granularity, location, floor, bucket = key
+    return UpdateOne(
+        {'_id': rollup_id(granularity, location, floor, bucket)},
+        {
+            '$inc': counters,
+            '$setOnInsert': {'granularity': granularity, 'location': location, 'floor': floor, 'bucket': bucket},
+        },
+        upsert=True
+    )
+
+
+class RollupStore:
+    def __init__(self, rollups, bookings, archive=None, flush_seconds=5, backfill_batch_days=30, logger=None):
+        self.rollups = rollups
+        self.bookings = bookings
+        self.archive = archive
+        self.flush_seconds = flush_seconds
+        self.backfill_batch_days = backfill_batch_days
+        self.logger = logger
+        # One marker document while (and after) a backfill runs
+        self.backfills = rollups.database[f'{rollups.name}_backfill']
+        self._pending = {}
+        # [(at, before, after)] booking writes held while a backfill runs; None otherwise
+        self._held = None
+        self._hold_checked = float('-inf')
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        if self.buffered:
+            # The flush thread is a daemon: write what it has not flushed yet on the way out
+            # (a gunicorn worker recycled by max_requests or a restart exits through sys.exit)
+            atexit.register(self.close)
+
+    @property
+    def buffered(self):
+        return self.flush_seconds > 0
+
+    @property
+    def hold_check_seconds(self):
+        """Longest a worker takes to notice a backfill starting or ending."""
+        return self.flush_seconds or HOLD_CHECK_SECONDS
+
+    def record(self, before, after):
+        """Apply a booking write: ``before`` and ``after`` are the booking documents (None when absent)."""
+        if not self.buffered:
+            self._check_hold()
+        with self._lock:
+            if self._held is not None:
+                self._held.append((datetime.utcnow(), before, after))
+                return
+        deltas = {}
+        for booking, sign in ((before, -1), (after, 1)):
+            if booking:
+                _add_contributions(deltas, booking, sign)
+        self._merge(deltas)
+        if not self.buffered:
+            self.flush()
+
+    def _merge(self, deltas):
+        with self._lock:
+            self._merge_locked(deltas)
+
+    def _merge_locked(self, deltas):
+        for key, counters in deltas.items():
+            pending = self._pending.setdefault(key, {})
+            for field, value in counters.items():
+                pending[field] = pending.get(field, 0) + value
+
+    def _check_hold(self):
+        """Start holding booking writes when a backfill is running; replay them once it has finished."""
+        now = time.monotonic()
+        if now - self._hold_checked < self.hold_check_seconds:
+            return
+        self._hold_checked = now
+        marker = self.backfills.find_one({'_id': BACKFILL_ID}) or {}
+        running = marker.get('state') == 'running' and marker['heartbeat_at'] > datetime.utcnow() - BACKFILL_STALE
+        with self._lock:
+            if running and self._held is None:
+                self._held = []
+            elif not running and self._held is not None:
+                held, self._held = self._held, None
+                # A failed or abandoned backfill left the old rollups in place: the writes count in full
+                batches = marker.get('batches', []) if marker.get('state') == 'done' else []
+                self._merge_locked(replay(held, batches))
+
+    def flush(self):
+        """Write the buffered deltas in one unordered bulk_write. Returns the number of buckets written."""
+        self._check_hold()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        keys = []
+        ops = []
+        for key, counters in pending.items():
+            counters = {field: value for field, value in counters.items() if value}
+            if counters:
+                keys.append(key)
+                ops.append(_rollup_update(key, counters))
+        if not ops:
+            return 0
+        try:
+            self.rollups.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            # Unordered: everything but the failed updates went through, so only those go back
+            # ($inc is not idempotent; re-sending applied ones would double count)
+            failed = {error['index'] for error in e.details.get('writeErrors', [])}
+            self._merge({keys[i]: pending[keys[i]] for i in failed})
+            raise
+        except Exception:
+            # Connection errors: the batch is kept for the next flush rather than lost
+            self._merge(pending)
+            raise
+        return len(ops)
+
+    def read(self, granularity, start, end, location=None, floor=None):
+        """Rollup documents of ``granularity`` with buckets in [start, end), oldest first."""
+        query = {'granularity': granularity, 'bucket': {'$gte': start, '$lt': end}}
+        if location:
+            query['location'] = location
+        if floor is not None:
+            query['floor'] = floor
+        return list(self.rollups.find(query, {'_id': 0}).sort('bucket', ASCENDING))
+
+    def backfill(self, batch_days=None, hold_wait=None):
+        """
+        Rebuild all rollups from bookings (and the archive). Returns (bookings batches, rollup documents).
+        Workers hold their booking writes from ``hold_wait`` seconds (long enough for all of them to notice
+        the marker) before the first aggregation until the rebuilt rollups are in place.
+        """
+        now = datetime.utcnow()
+        self.backfills.replace_one({'_id': BACKFILL_ID},
+                                   {'state': 'running', 'started_at': now, 'heartbeat_at': now}, upsert=True)
+        try:
+            time.sleep(2 * self.hold_check_seconds if hold_wait is None else hold_wait)
+            batches, documents, aggregated = self._rebuild(timedelta(days=batch_days or self.backfill_batch_days))
+        except BaseException:
+            self.backfills.update_one({'_id': BACKFILL_ID},
+                                      {'$set': {'state': 'failed', 'finished_at': datetime.utcnow()}})
+            raise
+        self.backfills.update_one({'_id': BACKFILL_ID}, {'$set': {
+            'state': 'done', 'finished_at': datetime.utcnow(), 'batches': aggregated,
+        }})
+        return batches, documents
+
+    def _heartbeat(self):
+        self.backfills.update_one({'_id': BACKFILL_ID}, {'$set': {'heartbeat_at': datetime.utcnow()}})
+
+    def _rebuild(self, batch):
+        bounds = []
+        for collection in (self.bookings, self.archive):
+            if collection is None:
+                continue
+            bounds += list(collection.aggregate([
+                {'$match': {'start_at': {'$type': 'date'}}},
+                {'$group': {'_id': None, 'first': {'$min': '$start_at'}, 'last': {'$max': '$start_at'}}},
+            ]))
+
+        # Windows starting in one batch can reach into the next batch's buckets, so hourly
+        # results are accumulated with $inc into a side collection that replaces the live one
+        rebuild = self.rollups.database[f'{self.rollups.name}_rebuild']
+        rebuild.drop()
+        batches = 0
+        # [{start, end, aggregated_at}] for replaying the writes held meanwhile
+        aggregated = []
+        if bounds:
+            cursor = bucket_start(min(b['first'] for b in bounds), 'day')
+            last = max(b['last'] for b in bounds)
+            archive_name = self.archive.name if self.archive is not None else None
+            while cursor <= last:
+                self._heartbeat()
+                aggregated.append({'start': cursor, 'end': cursor + batch, 'aggregated_at': datetime.utcnow()})
+                rows = self.bookings.aggregate(backfill_pipeline(cursor, cursor + batch, archive_name))
+                ops = []
+                for row in rows:
+                    counters = {field: row[field] for field in ROLLUP_FIELDS if row.get(field)}
+                    if counters:
+                        key = row['_id']
+                        ops.append(_rollup_update(('hour', key.get('location'), key.get('floor'), key['bucket']),
+                                                  counters))
+                if ops:
+                    rebuild.bulk_write(ops, ordered=False)
+                cursor += batch
+                batches += 1
+
+        # Daily buckets are the sums of their hours
+        self._heartbeat()
+        days = rebuild.aggregate([
+            {'$match': {'granularity': 'hour'}},
+            {'$group': {
+                '_id': {
+                    'location': '$location', 'floor': '$floor',
+                    'bucket': {'$subtract': ['$bucket', {'$mod': [{'$toLong': '$bucket'}, DAY_MS]}]},
+                },
+                **{field: {'$sum': f'${field}'} for field in ROLLUP_FIELDS},
+            }},
+        ])
+        inserts = []
+        for row in days:
+            key = row['_id']
+            inserts.append(InsertOne({
+                '_id': rollup_id('day', key.get('location'), key.get('floor'), key['bucket']),
+                'granularity': 'day', 'location': key.get('location'), 'floor': key.get('floor'),
+                'bucket': key['bucket'], **{field: row[field] for field in ROLLUP_FIELDS},
+            }))
+        if inserts:
+            rebuild.bulk_write(inserts, ordered=False)
+
+        documents = rebuild.count_documents({})
+        if documents:
+            rebuild.rename(self.rollups.name, dropTarget=True)
+        else:
+            self.rollups.delete_many({})
+        return batches, documents, aggregated
+
+    def start(self):
+        """Start the flush thread once per process (safe to call on every request)."""
+        if not self.buffered:
+            return
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            # Threads do not survive a fork, so a forked worker starts its own
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='analytics-rollups', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        """Stop the flush thread and write whatever is still buffered (registered with atexit)."""
+        self.stop()
+        thread = self._thread
+        if thread and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout=self.flush_seconds)
+        # Read the backfill marker afresh, so writes held for a finished backfill are flushed too
+        self._hold_checked = float('-inf')
+        try:
+            self.flush()
+        except Exception as e:
+            if self.logger:
+                self.logger.warning('Analytics rollups lost on exit: %s', e)
+        if self._held and self.logger:
+            self.logger.warning('%d booking writes held for a running analytics backfill lost on exit',
+                                len(self._held))
+
+    def _run(self):
+        while not self._stop.wait(self.flush_seconds):
+            try:
+                self.flush()
+            except Exception as e:
+                # Keep the thread alive across transient DB errors; the deltas stay buffered
+                if self.logger:
+                    self.logger.warning('Analytics rollup flush failed: %s', e)
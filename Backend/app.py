@@ -1,19 +1,52 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt, get_jwt_identity
 from datetime import datetime, timedelta
+from functools import wraps
 import os
-from pymongo import MongoClient
+from werkzeug.middleware.proxy_fix import ProxyFix
+from pymongo import DeleteOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
 from bson import ObjectId
+import csv
+import io
+import itertools
 import json
+import math
+import threading
+from bson.errors import InvalidId
+from config import Config
+from connection import connect, read_heavy_preference
+from instrumentation import CommandMetrics, Instrumentation
+from expiry import ExpiryWorker
+from indexes import ensure_indexes
+from bootstrap import ensure_seeded, run_migrations, seed_locations, seed_slots
+from locations import LocationDirectory, location_document
+from passwords import HashingBusy, PasswordHasher
+from availability import AvailabilityIndex, overlapping
+from batch import contiguous_runs, operations, parse_booking_operation, parse_slot_operation, slot_update
+from caching import SLOTS_VERSION_ID, SlotListingCache, TTLCache
+from events import ChangeStreamRelay, SlotChangeFeed
+from stats import STATS_ID, StatsStore, as_amount, booking_increments
+from pricing import PricingEngine
+from analytics import GRANULARITIES, RollupStore, bucket_start
+from ratelimit import LoadShedder, MemoryBackend, MongoBackend, RateLimiter
+from serialization import FastJSONProvider
+from flows import Call, Mongo, run as run_flow
+from waitlist import Waitlist
 
 app = Flask(__name__)
+# Serializes ObjectId/datetime itself, with orjson when installed
+app.json = FastJSONProvider(app)
+app.json.encoder = Config.JSON_ENCODER
 app.config['JWT_SECRET_KEY'] = os.getenv("JWT_SECRET_KEY", "dev-secret")
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
 
 jwt = JWTManager(app)
-CORS(app)
+if Config.TRUSTED_PROXY_COUNT:
+    # remote_addr becomes the client the trusted proxies forwarded for, not the last proxy
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=Config.TRUSTED_PROXY_COUNT, x_proto=Config.TRUSTED_PROXY_COUNT)
+CORS(app, expose_headers=['X-Next-Cursor', 'Server-Timing', 'X-Profile-Status', 'Retry-After'])
 
 # MongoDB connection
 MONGODB_URI = os.getenv("MONGODB_URI")
@@ -22,13 +55,149 @@ DATABASE_NAME = os.getenv("DATABASE_NAME", "parking_system")
 if not MONGODB_URI:
     raise RuntimeError("MONGODB_URI environment variable not set")
 
-client = MongoClient(MONGODB_URI)
-db = client[DATABASE_NAME]
+# MongoDB commands and time, in total and per request
+command_metrics = CommandMetrics()
+
+# Moving average of MongoDB command latency; sheddable routes answer 429 while it is over budget
+load_shedder = LoadShedder(Config.LOAD_SHED_DB_LATENCY_MS, window_seconds=Config.LOAD_SHED_WINDOW_SECONDS)
+
+# One pool per worker process, opened on first use after gunicorn forks
+mongo = connect(MONGODB_URI, DATABASE_NAME, listeners=[command_metrics, load_shedder])
+db = mongo.handle()
 
 # Collections
 users_collection = db['users']
 bookings_collection = db['bookings']
 parking_slots_collection = db['parking_slots']
+meta_collection = db['meta']
+locations_collection = db['locations']
+# Completed/cancelled bookings past Config.BOOKING_ARCHIVE_AFTER_DAYS (same document shape)
+bookings_archive_collection = db['bookings_archive']
+
+# Reporting reads (admin stats, export) may go to secondaries; the stats $unionWith follows
+# the bookings aggregation's read preference
+reporting_bookings_collection = mongo.collection('bookings', read_heavy_preference())
+reporting_archive_collection = mongo.collection('bookings_archive', read_heavy_preference())
+
+# The collections the route flows (flows.py) name; asgi_app.py maps the same names to Motor
+flow_collections = {
+    'users': users_collection,
+    'bookings': bookings_collection,
+    'parking_slots': parking_slots_collection,
+    'counters': db['counters'],
+    'stats': db['stats'],
+}
+
+def _run(flow):
+    """Run a route flow on the sync client, in this thread."""
+    return run_flow(flow, flow_collections)
+
+# Location documents, and which of them this worker serves (Config.LOCATIONS_SERVED)
+location_directory = LocationDirectory(locations_collection, served=Config.LOCATIONS_SERVED,
+                                       ttl_seconds=Config.LOCATIONS_CACHE_SECONDS)
+
+# In-memory mirror of slot reservations for fast window queries (served locations only)
+availability_index = AvailabilityIndex()
+
+# Serialized slot listings, invalidated by a shared version counter
+slot_listing_cache = SlotListingCache(max_entries=Config.SLOT_CACHE_SIZE)
+
+# Slot status deltas pushed to /api/parking-slots/stream subscribers
+slot_feed = SlotChangeFeed(backlog=Config.SLOT_STREAM_BACKLOG)
+slot_change_relay = ChangeStreamRelay(parking_slots_collection, slot_feed, app.logger)
+
+# Admin dashboard figures (optionally materialized and maintained incrementally)
+stats_store = StatsStore(db['stats'], bookings_collection, parking_slots_collection, bookings_archive_collection,
+                         counters=db['counters'])
+reporting_stats = StatsStore(db['stats'], reporting_bookings_collection, parking_slots_collection,
+                             bookings_archive_collection)
+
+# Hourly/daily occupancy and revenue per (location, floor), fed by booking writes
+analytics_rollups = RollupStore(db['analytics'], bookings_collection, bookings_archive_collection,
+                                flush_seconds=Config.ANALYTICS_FLUSH_SECONDS,
+                                backfill_batch_days=Config.ANALYTICS_BACKFILL_BATCH_DAYS, logger=app.logger)
+
+# Route timing, Server-Timing headers, /api/metrics and opt-in X-Profile
+instrumentation = Instrumentation(command_metrics, profile_enabled=Config.PROFILE_REQUESTS,
+                                  profile_limit=Config.PROFILE_TOP_N)
+instrumentation.init_app(app)
+instrumentation.gauge('parking_mongo_pool', 'MongoDB connection pool counters for this worker.',
+                      lambda: mongo.pool_stats(), label='stat')
+instrumentation.gauge('parking_slot_reconcile', 'Slot reconciliation runs and documents scanned/touched.',
+                      lambda: slot_sync_metrics, label='stat')
+instrumentation.gauge('parking_rate_limited', 'Requests rejected by each rate limit budget.',
+                      lambda: dict(rate_limiter.rejected), label='budget')
+instrumentation.gauge('parking_load_shed', 'MongoDB latency moving average (ms) and requests shed.',
+                      lambda: {'db_latency_ms': round(load_shedder.latency_ms(), 3), 'shed': load_shedder.shed},
+                      label='stat')
+instrumentation.gauge('parking_waitlist', 'Waitlist queues and entries held by this worker, and promotions made.',
+                      lambda: waitlist.stats(), label='stat')
+
+# Password hashing runs on a bounded per-worker thread pool
+password_hasher = PasswordHasher(
+    scheme=Config.PASSWORD_HASH_SCHEME,
+    cost=Config.PASSWORD_HASH_COST,
+    workers=Config.PASSWORD_HASH_WORKERS,
+    max_pending=Config.PASSWORD_HASH_MAX_PENDING
+)
+
+# Token buckets per (budget, user or client IP), per worker or shared through MongoDB
+rate_limiter = RateLimiter(
+    MongoBackend(db['rate_limits']) if Config.RATE_LIMIT_BACKEND == 'mongo'
+    else MemoryBackend(max_entries=Config.RATE_LIMIT_MAX_CLIENTS),
+    Config.RATE_LIMITS
+)
+
+# Booking prices from the versioned rate table in meta (compiled once per version per worker)
+pricing = PricingEngine(meta_collection, Config.PRICING_RATES, check_seconds=Config.PRICING_VERSION_CHECK_SECONDS)
+
+def _booking_stats_flow(booking, total_bookings=0, active_bookings=0, revenue=0):
+    """Apply a booking write to the materialized admin stats, when enabled."""
+    if Config.STATS_MATERIALIZED:
+        inc = booking_increments(booking.get('location'), booking.get('floor', 1),
+                                 total_bookings, active_bookings, revenue)
+        if inc:
+            # No upsert: until the document is built, the stats route rebuilds it from the collections
+            yield Mongo('stats', 'update_one', {'_id': STATS_ID}, {'$inc': inc})
+
+def _record_booking_stats(booking, total_bookings=0, active_bookings=0, revenue=0):
+    _run(_booking_stats_flow(booking, total_bookings, active_bookings, revenue))
+
+def _record_booking_stats_many(*changes):
+    """_record_booking_stats for several bookings in one write; each change is (booking, total, active, revenue)."""
+    if Config.STATS_MATERIALIZED:
+        stats_store.record_many([
+            (booking.get('location'), booking.get('floor', 1), total_bookings, active_bookings, revenue)
+            for booking, total_bookings, active_bookings, revenue in changes
+        ])
+
+def _slots_changed_flow(*changes):
+    """Invalidate cached listings in every worker and publish (location, slot_id, status, booked_by) deltas."""
+    yield Mongo('counters', 'update_one', {'_id': SLOTS_VERSION_ID}, {'$inc': {'value': 1}}, upsert=True)
+    if not slot_feed.external_source:
+        for location, slot_id, status, booked_by in changes:
+            slot_feed.publish(location, slot_id, status, booked_by)
+
+def _slots_changed(*changes):
+    _run(_slots_changed_flow(*changes))
+
+def _booking_analytics_flow(before, after):
+    """Apply a booking write to the analytics rollups (buffered deltas are written by the flush thread)."""
+    if analytics_rollups.buffered:
+        analytics_rollups.record(before, after)
+    else:
+        yield Call(analytics_rollups.record, before, after)
+
+def _misdirected(location):
+    """(body, 421) for a location this worker is not pinned to; the proxy in front routes by location."""
+    return {'error': f'Location {location} is served by another worker', 'location': location}, 421
+
+def _booking_key(booking_id, location=None):
+    """Filter for one booking; a ?location= hint lets a sharded cluster send the lookup to one shard."""
+    query = {'_id': ObjectId(booking_id)}
+    if location:
+        query['location'] = location
+    return query
 
 def _parse_booking_times(date_str: str, time_str: str, duration_hours: int):
     """Parse date, time, duration into start and end datetimes (UTC-naive for simplicity)."""
@@ -40,54 +209,204 @@ def _parse_booking_times(date_str: str, time_str: str, duration_hours: int):
     end_dt = start_dt + timedelta(hours=duration_hours)
     return start_dt, end_dt
 
-def reconcile_expired_and_slots(target_location: str | None = None):
+def _occupies(start_dt, end_dt, now_dt=None):
+    """Whether a booking window covers the current time (legacy non-datetime windows count as occupying)."""
+    if not isinstance(start_dt, datetime) or not isinstance(end_dt, datetime):
+        return True
+    now_dt = now_dt or datetime.utcnow()
+    return start_dt <= now_dt < end_dt
+
+def _serialize_booking(booking):
+    """Give a booking its JSON shape: 'YYYY-MM-DD HH:MM' windows (the JSON provider handles ids and created_at)."""
+    for field in ('start_at', 'end_at'):
+        if isinstance(booking.get(field), datetime):
+            # Same text as strftime("%Y-%m-%d %H:%M") for the naive UTC datetimes pymongo returns, twice as fast
+            booking[field] = booking[field].isoformat(' ', 'minutes')
+    return booking
+
+def _booking_projection(fields_param):
+    """Projection for a comma-separated ?fields= list (None returns every field)."""
+    if not fields_param:
+        return None
+    projection = {field.strip(): 1 for field in fields_param.split(',') if field.strip()}
+    projection['_id'] = 1
+    return projection
+
+def _json_chunks(cursor, separator=b',', chunk_size=500, terminated=False):
     """
-    - Mark active bookings whose end time has passed as completed and free their slots.
-    - Ensure slot.status reflects active bookings (booked/available) per location filter if provided.
+    Encode serialized bookings and yield them in chunks of ``chunk_size``, joined by ``separator``
+    or, when ``terminated`` (NDJSON), each followed by it.
     """
-    now_dt = datetime.utcnow()
+    chunk = []
+    first = True
+    for booking in cursor:
+        chunk.append(app.json.dumps_bytes(_serialize_booking(booking)))
+        if len(chunk) == chunk_size:
+            if terminated:
+                yield separator.join(chunk) + separator
+            else:
+                yield (b'' if first else separator) + separator.join(chunk)
+            first = False
+            chunk = []
+    if chunk:
+        if terminated:
+            yield separator.join(chunk) + separator
+        else:
+            yield (b'' if first else separator) + separator.join(chunk)
 
-    # 1) Expire bookings
-    active_cursor = bookings_collection.find({'status': 'active'})
-    for b in active_cursor:
+def _stream_json_array(cursor):
+    """Yield a JSON array of serialized bookings, a few hundred documents per chunk."""
+    yield b'['
+    yield from _json_chunks(cursor)
+    yield b']'
+
+EXPORT_CSV_COLUMNS = [
+    '_id', 'user_id', 'customer_name', 'vehicle_number', 'location', 'floor', 'slot',
+    'date', 'time', 'duration', 'amount', 'status', 'start_at', 'end_at', 'created_at'
+]
+
+def _stream_csv(cursor):
+    """Yield bookings as CSV rows, header first."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_CSV_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    for booking in cursor:
+        writer.writerow(_serialize_booking(booking))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    yield buffer.getvalue()
+
+def _backfill_times(query):
+    """Set start_at/end_at datetimes from date/time/duration on matching bookings that lack them."""
+    legacy = bookings_collection.find(
+        {**query, 'end_at': {'$not': {'$type': 'date'}}, 'window_error': {'$exists': False}},
+        {'date': 1, 'time': 1, 'duration': 1, 'status': 1}
+    )
+    ops = []
+    for b in legacy:
         try:
             start_dt, end_dt = _parse_booking_times(b['date'], b['time'], int(b['duration']))
-            if end_dt <= now_dt:
-                # mark completed and free slot
-                bookings_collection.update_one({'_id': b['_id']}, {'$set': {'status': 'completed'}})
-                parking_slots_collection.update_one(
-                    {'slot_id': b.get('slot'), 'location': b.get('location')},
-                    {'$set': {'status': 'available', 'booked_by': None}}
-                )
-        except Exception:
-            # On parse issues, skip
+        except (KeyError, TypeError, ValueError) as e:
+            # A text window would never expire and would hold its slot forever: flag the booking
+            # instead, and take an active one out of 'active' so reconciliation frees the slot
+            app.logger.warning('Booking %s has an unparseable date/time/duration: %r', b['_id'], e)
+            update = {'window_error': f'Unparseable date/time/duration: {e!r}'}
+            if b.get('status') == 'active':
+                update['status'] = 'needs_review'
+            ops.append(UpdateOne({'_id': b['_id']}, {'$set': update}))
             continue
+        ops.append(UpdateOne({'_id': b['_id']}, {'$set': {'start_at': start_dt, 'end_at': end_dt}}))
+        if len(ops) == 1000:
+            bookings_collection.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        bookings_collection.bulk_write(ops, ordered=False)
+
+def _backfill_booking_times():
+    """Store start_at/end_at as datetimes on active bookings created before they were native."""
+    _backfill_times({'status': 'active'})
+
+def _backfill_finished_booking_times():
+    """Same for completed and cancelled bookings, which are archived by end_at."""
+    _backfill_times({'status': {'$ne': 'active'}})
+
+def reconcile_expired_and_slots(target_location: str | None = None):
+    """
+    - Mark active bookings whose end time has passed as completed and free their slots.
+    - Ensure slot.status reflects active bookings (booked/available) per location filter if provided.
+
+    Full sweep, run once when the expiry worker starts; its incremental ticks
+    keep things in sync afterwards.
+    """
+    # 1) Expire bookings
+    expiry_worker.tick()
 
     # 2) Reconcile slot statuses to match active bookings
+    sync_slot_statuses(target_location)
+
+# Documents scanned/touched by slot reconciliation, cumulative and for the last run
+slot_sync_metrics = {'runs': 0, 'scanned': 0, 'touched': 0, 'last_scanned': 0, 'last_touched': 0}
+
+def sync_slot_statuses(target_location: str | None = None):
+    """
+    Make slot.status/booked_by/reservations match active bookings, writing only the slots that differ.
+    Changed slots are applied in one unordered bulk_write; returns the number of documents touched.
+    """
+    now_dt = datetime.utcnow()
     match = {'status': 'active'}
     if target_location:
         match['location'] = target_location
-    active = list(bookings_collection.find(match, {'slot': 1, 'location': 1, 'customer_name': 1}))
-    active_keys = {(a.get('location'), a.get('slot')) for a in active}
-    name_map = {(a.get('location'), a.get('slot')): a.get('customer_name') for a in active}
+    match = location_directory.scope(match)
+    active = bookings_collection.find(
+        match, {'slot': 1, 'location': 1, 'customer_name': 1, 'start_at': 1, 'end_at': 1}
+    )
+    name_map = {}
+    reservations_map = {}
+    for a in active:
+        key = (a.get('location'), a.get('slot'))
+        start_dt, end_dt = a.get('start_at'), a.get('end_at')
+        if not isinstance(start_dt, datetime) or not isinstance(end_dt, datetime):
+            name_map[key] = a.get('customer_name')
+            continue
+        if _occupies(start_dt, end_dt, now_dt):
+            name_map[key] = a.get('customer_name')
+        reservations_map.setdefault(key, []).append(
+            {'booking_id': a['_id'], 'start_at': start_dt, 'end_at': end_dt}
+        )
 
     slot_filter = {}
     if target_location:
         slot_filter['location'] = target_location
-    slots = list(parking_slots_collection.find(slot_filter, {'slot_id': 1, 'location': 1}))
+    slot_filter = location_directory.scope(slot_filter)
+    slots = list(parking_slots_collection.find(
+        slot_filter,
+        {'slot_id': 1, 'location': 1, 'floor': 1, 'status': 1, 'booked_by': 1, 'reservations': 1, 'closed': 1}
+    ))
+
+    ops = []
+    changes = []
+    freed = []
     for s in slots:
         key = (s.get('location'), s.get('slot_id'))
-        if key in active_keys:
-            parking_slots_collection.update_one(
-                {'_id': s['_id']},
-                {'$set': {'status': 'booked', 'booked_by': name_map.get(key)}}
-            )
+        # Closing is an admin's choice (with its own status); booked/available is derived only for open slots
+        if s.get('closed'):
+            desired = {}
+        elif key in name_map:
+            desired = {'status': 'booked', 'booked_by': name_map[key]}
         else:
-            parking_slots_collection.update_one(
-                {'_id': s['_id']},
-                {'$set': {'status': 'available', 'booked_by': None}}
+            desired = {'status': 'available', 'booked_by': None}
+        desired['reservations'] = sorted(reservations_map.get(key, []), key=lambda r: r['start_at'])
+        if any(s.get(field) != value for field, value in desired.items()):
+            ops.append(UpdateOne({'location': s.get('location'), '_id': s['_id']}, {'$set': desired}))
+            if 'status' in desired and (
+                s.get('status') != desired['status'] or s.get('booked_by') != desired['booked_by']
+            ):
+                changes.append((key[0], key[1], desired['status'], desired['booked_by']))
+            kept = {r['booking_id'] for r in desired['reservations']}
+            freed.extend(
+                {'location': key[0], 'floor': s.get('floor', 1), 'start_at': r.get('start_at'), 'end_at': r.get('end_at')}
+                for r in s.get('reservations') or [] if r.get('booking_id') not in kept
             )
 
+    touched = 0
+    if ops:
+        touched = parking_slots_collection.bulk_write(ops, ordered=False).modified_count
+    if touched:
+        _slots_changed(*changes)
+    if touched and freed:
+        # Windows of dropped reservations go to the waitlist once the index sees them free
+        _refresh_availability()
+        _promote_waitlist(*freed)
+
+    slot_sync_metrics['runs'] += 1
+    slot_sync_metrics['scanned'] += len(slots)
+    slot_sync_metrics['touched'] += touched
+    slot_sync_metrics['last_scanned'] = len(slots)
+    slot_sync_metrics['last_touched'] = touched
+    app.logger.info('Slot reconcile scanned %d slots, touched %d', len(slots), touched)
+    return touched
+
 # Initialize default data
 def initialize_data():
     # Create default admin user
@@ -95,7 +414,7 @@ def initialize_data():
     if not admin_user:
         users_collection.insert_one({
             'username': 'admin',
-            'password': generate_password_hash('admin123'),
+            'password': password_hasher.hash('admin123'),
             'role': 'admin',
             'created_at': datetime.utcnow()
         })
@@ -105,426 +424,1561 @@ def initialize_data():
     if not customer_user:
         users_collection.insert_one({
             'username': 'customer',
-            'password': generate_password_hash('customer123'),
+            'password': password_hasher.hash('customer123'),
             'role': 'customer',
             'created_at': datetime.utcnow()
         })
     
-    # Initialize/migrate parking slots to support multiple locations and floors (no zones in API)
-    rows = ['A', 'B', 'C', 'D']
-    nums = ['1', '2', '3']
-    locations = ['CityMall', 'TechPark', 'CentralOffice', 'Airport', 'Stadium']
-
-    existing_slots = list(parking_slots_collection.find({}))
-
-    if len(existing_slots) == 0:
-        # Fresh database: create slots for each location (2 floors × 12 per floor)
-        slots_to_create = []
-        for location in locations:
-            for floor in [1, 2]:
-                for row in rows:
-                    for num in nums:
-                        slots_to_create.append({
-                            'slot_id': f'F{floor}-{row}{num}',
-                            'location': location,
-                            'floor': floor,
-                            'status': 'available',
-                            'booked_by': None,
-                            'created_at': datetime.utcnow()
-                        })
-        if slots_to_create:
-            parking_slots_collection.insert_many(slots_to_create)
-    else:
-        # Migration path: add floor and location (default), remove zone usage
-        for slot in existing_slots:
-            slot_id = str(slot.get('slot_id', '')).strip()
-            updated_fields = {}
-
-            # Default floor=1 if missing
-            if 'floor' not in slot:
-                updated_fields['floor'] = 1
-
-            # Default location if missing
-            if 'location' not in slot:
-                updated_fields['location'] = 'CityMall'
-
-            # Normalize slot_id to include floor prefix
-            if slot_id and not slot_id.startswith('F'):
-                updated_fields['slot_id'] = f"F{updated_fields.get('floor', slot.get('floor', 1))}-{slot_id}"
-
-            if updated_fields:
-                parking_slots_collection.update_one({'_id': slot['_id']}, {'$set': updated_fields})
-
-        # Ensure all locations have full sets of slots (2 floors × 12 per floor)
-        for location in locations:
-            for floor in [1, 2]:
-                for row in rows:
-                    for num in nums:
-                        slot_id = f'F{floor}-{row}{num}'
-                        if parking_slots_collection.count_documents({'location': location, 'slot_id': slot_id}) == 0:
-                            parking_slots_collection.insert_one({
-                                'slot_id': slot_id,
-                                'location': location,
-                                'floor': floor,
-                                'status': 'available',
-                                'booked_by': None,
-                                'created_at': datetime.utcnow()
-                            })
+    # Migrations run once per database (recorded in meta.schema); locations and slots are seeded
+    # from Config.PARKING_LAYOUT only when the layout changes, so a warm boot is a few point reads
+    changed = run_migrations(meta_collection, SCHEMA_MIGRATIONS, app.logger)
+    # The unique (location, slot_id) index makes concurrent seeding from several workers safe
+    ensure_indexes(db, app.logger)
+    changed += ensure_seeded(meta_collection, parking_slots_collection, Config.PARKING_LAYOUT,
+                             locations=locations_collection)
+    location_directory.invalidate()
+    pricing.ensure_seeded()
 
+    if changed:
         # Reconcile slot statuses with active bookings (fix stale booked flags)
-        active_bookings = list(bookings_collection.find({'status': 'active'}))
-        booked_keys = set()
-        name_by_key = {}
-        for b in active_bookings:
-            key = (b.get('location'), b.get('slot'))
-            booked_keys.add(key)
-            name_by_key[key] = b.get('customer_name')
-
-        # Mark slots booked if in active bookings, else available
-        for location in locations:
-            for floor in [1, 2]:
-                for row in rows:
-                    for num in nums:
-                        sid = f'F{floor}-{row}{num}'
-                        key = (location, sid)
-                        if key in booked_keys:
-                            parking_slots_collection.update_one(
-                                {'location': location, 'slot_id': sid},
-                                {'$set': {'status': 'booked', 'booked_by': name_by_key.get(key)}}
-                            )
-                        else:
-                            parking_slots_collection.update_one(
-                                {'location': location, 'slot_id': sid},
-                                {'$set': {'status': 'available', 'booked_by': None}}
-                            )
-
-# Initialize DB data on startup (works with gunicorn & local)
+        sync_slot_statuses()
+        # Slots may have been created or migrated above
+        _slots_changed()
+    elif Config.EXPIRY_TICK_SECONDS <= 0:
+        # Otherwise the expiry worker reconciles when it starts
+        sync_slot_statuses()
+
+def _migrate_slot_fields():
+    """Add floor and location (default) to legacy slots and prefix slot_id with the floor; no zones in API."""
+    migration_ops = []
+    for slot in parking_slots_collection.find(
+        {'$or': [{'floor': {'$exists': False}}, {'location': {'$exists': False}}, {'slot_id': {'$not': {'$regex': '^F'}}}]},
+        {'slot_id': 1, 'floor': 1, 'location': 1}
+    ):
+        slot_id = str(slot.get('slot_id', '')).strip()
+        updated_fields = {}
+
+        # Default floor=1 if missing
+        if 'floor' not in slot:
+            updated_fields['floor'] = 1
+
+        # Default location if missing
+        if 'location' not in slot:
+            updated_fields['location'] = 'CityMall'
+
+        # Normalize slot_id to include floor prefix
+        if slot_id and not slot_id.startswith('F'):
+            updated_fields['slot_id'] = f"F{updated_fields.get('floor', slot.get('floor', 1))}-{slot_id}"
+
+        if updated_fields:
+            migration_ops.append(UpdateOne({'_id': slot['_id']}, {'$set': updated_fields}))
+
+    if migration_ops:
+        parking_slots_collection.bulk_write(migration_ops, ordered=False)
+
+def _seed_location_documents():
+    """Create location documents for databases seeded before locations were stored."""
+    seed_locations(locations_collection, Config.PARKING_LAYOUT)
+
+def _count_waitlist_queues():
+    """Seed the waitlist_queues counters from the entries already waiting."""
+    waitlist.recount()
+
+# (schema version, idempotent migration), applied in order by initialize_data
+SCHEMA_MIGRATIONS = [
+    # Expiry and reservations work on datetime booking windows
+    (1, _backfill_booking_times),
+    (2, _migrate_slot_fields),
+    (3, _backfill_finished_booking_times),
+    (4, _seed_location_documents),
+    # Waitlist caps are enforced by per-queue counters
+    (5, _count_waitlist_queues),
+]
+
+AVAILABILITY_FIELDS = {'slot_id': 1, 'location': 1, 'floor': 1, 'reservations': 1, 'closed': 1}
+
+def _refresh_availability():
+    availability_index.load(parking_slots_collection.find(location_directory.scope(), AVAILABILITY_FIELDS))
+
+def _on_expiry_tick():
+    _refresh_availability()
+    # Entries whose window has started can no longer be booked; the reload picks up other workers' entries
+    waitlist.expire(location_directory.scope())
+    waitlist.load(location_directory.scope())
+
+def _on_bookings_expired(*bookings):
+    for b in bookings:
+        _record_booking_stats(b, active_bookings=-1)
+
+def _reserve_slot_flow(location, slot_id, start_dt, end_dt, booking_id, customer_name):
+    """Atomically add a reservation if the slot is open and nothing on it overlaps [start_dt, end_dt). Returns the slot or None."""
+    reservation = {'booking_id': booking_id, 'start_at': start_dt, 'end_at': end_dt}
+    update = {'$push': {'reservations': {'$each': [reservation], '$sort': {'start_at': 1}}}}
+    if _occupies(start_dt, end_dt):
+        update['$set'] = {'status': 'booked', 'booked_by': customer_name}
+    slot = yield Mongo(
+        'parking_slots', 'find_one_and_update',
+        {'slot_id': slot_id, 'location': location, 'closed': {'$ne': True},
+         'reservations': {'$not': overlapping(start_dt, end_dt)}},
+        update,
+        return_document=ReturnDocument.AFTER
+    )
+    if slot:
+        availability_index.add(location, slot_id, start_dt, end_dt, booking_id)
+        if '$set' in update:
+            yield from _slots_changed_flow((location, slot_id, 'booked', customer_name))
+        else:
+            yield from _slots_changed_flow()
+    return slot
+
+def _reserve_slot(location, slot_id, start_dt, end_dt, booking_id, customer_name):
+    return _run(_reserve_slot_flow(location, slot_id, start_dt, end_dt, booking_id, customer_name))
+
+def _move_reservation_flow(booking, start_dt, end_dt):
+    """Atomically change an active booking's window if its slot is open and the new one overlaps no other reservation."""
+    result = yield Mongo(
+        'parking_slots', 'update_one',
+        {
+            'slot_id': booking.get('slot'),
+            'location': booking.get('location'),
+            'closed': {'$ne': True},
+            'reservations': {'$not': overlapping(start_dt, end_dt, exclude_booking_id=booking['_id'])}
+        },
+        {'$set': {'reservations.$[r].start_at': start_dt, 'reservations.$[r].end_at': end_dt}},
+        array_filters=[{'r.booking_id': booking['_id']}]
+    )
+    if result.matched_count == 0:
+        return False
+    if _occupies(start_dt, end_dt):
+        occupancy = {'status': 'booked', 'booked_by': booking.get('customer_name')}
+    elif _occupies(booking.get('start_at'), booking.get('end_at')):
+        occupancy = {'status': 'available', 'booked_by': None}
+    else:
+        occupancy = None
+    if occupancy:
+        yield Mongo(
+            'parking_slots', 'update_one',
+            {'slot_id': booking.get('slot'), 'location': booking.get('location'), 'closed': {'$ne': True}},
+            {'$set': occupancy}
+        )
+        yield from _slots_changed_flow(
+            (booking.get('location'), booking.get('slot'), occupancy['status'], occupancy['booked_by'])
+        )
+    availability_index.remove(booking.get('location'), booking.get('slot'), booking['_id'])
+    availability_index.add(booking.get('location'), booking.get('slot'), start_dt, end_dt, booking['_id'])
+    return True
+
+def _release_ops(booking):
+    """Writes dropping a booking's reservation and, if the booking occupies the slot right now, freeing it."""
+    slot_filter = {'slot_id': booking.get('slot'), 'location': booking.get('location')}
+    ops = [UpdateOne(slot_filter, {'$pull': {'reservations': {'booking_id': booking['_id']}}})]
+    if _occupies(booking.get('start_at'), booking.get('end_at')):
+        # A closed slot stays closed
+        ops.append(UpdateOne({**slot_filter, 'closed': {'$ne': True}},
+                             {'$set': {'status': 'available', 'booked_by': None}}))
+    return ops
+
+def _release_slot_flow(booking):
+    """Drop a booking's reservation, freeing the slot if the booking occupies it right now."""
+    ops = _release_ops(booking)
+    yield Mongo('parking_slots', 'bulk_write', ops)
+    availability_index.remove(booking.get('location'), booking.get('slot'), booking['_id'])
+    if len(ops) > 1:
+        yield from _slots_changed_flow((booking.get('location'), booking.get('slot'), 'available', None))
+    else:
+        yield from _slots_changed_flow()
+
+def _release_slot(booking):
+    _run(_release_slot_flow(booking))
+
+def _reserve_slots(location, slot_ids, start_dt, end_dt, booking_ids, customer_name):
+    """Claim [start_dt, end_dt) on every slot or on none, in one bulk_write. Returns whether all were claimed."""
+    occupying = _occupies(start_dt, end_dt)
+    ops = []
+    for slot_id, booking_id in zip(slot_ids, booking_ids):
+        reservation = {'booking_id': booking_id, 'start_at': start_dt, 'end_at': end_dt}
+        update = {'$push': {'reservations': {'$each': [reservation], '$sort': {'start_at': 1}}}}
+        if occupying:
+            update['$set'] = {'status': 'booked', 'booked_by': customer_name}
+        ops.append(UpdateOne(
+            {'slot_id': slot_id, 'location': location, 'closed': {'$ne': True},
+             'reservations': {'$not': overlapping(start_dt, end_dt)}},
+            update
+        ))
+    result = parking_slots_collection.bulk_write(ops, ordered=False)
+
+    if result.modified_count < len(ops):
+        # Another booking took one of the slots first: give back the ones claimed here
+        claimed = {'location': location, 'slot_id': {'$in': slot_ids}, 'reservations.booking_id': {'$in': booking_ids}}
+        if occupying:
+            parking_slots_collection.update_many({**claimed, 'closed': {'$ne': True}},
+                                                 {'$set': {'status': 'available', 'booked_by': None}})
+        parking_slots_collection.update_many(claimed, {'$pull': {'reservations': {'booking_id': {'$in': booking_ids}}}})
+        return False
+
+    for slot_id, booking_id in zip(slot_ids, booking_ids):
+        availability_index.add(location, slot_id, start_dt, end_dt, booking_id)
+    if occupying:
+        _slots_changed(*[(location, slot_id, 'booked', customer_name) for slot_id in slot_ids])
+    else:
+        _slots_changed()
+    return True
+
+def _release_slots(bookings):
+    """_release_slot for several bookings, applied in one bulk_write."""
+    ops = []
+    changes = []
+    for booking in bookings:
+        release = _release_ops(booking)
+        if len(release) > 1:
+            changes.append((booking.get('location'), booking.get('slot'), 'available', None))
+        ops.extend(release)
+    if not ops:
+        return
+    parking_slots_collection.bulk_write(ops, ordered=False)
+    for booking in bookings:
+        availability_index.remove(booking.get('location'), booking.get('slot'), booking['_id'])
+    _slots_changed(*changes)
+
+def _bulk_write_errors(collection, ops):
+    """Run an unordered bulk_write; returns {op index: error message} for the operations that failed."""
+    try:
+        collection.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        return {error['index']: error.get('errmsg', 'Write failed') for error in e.details.get('writeErrors', [])}
+    return {}
+
+def _new_booking(booking_id, user_id, customer_name, vehicle_number, slot, date, time, duration,
+                 start_dt, end_dt, rates):
+    """Active booking document for a window claimed on ``slot``, priced at ``rates``."""
+    return {
+        '_id': booking_id,
+        'user_id': user_id,
+        'customer_name': customer_name,
+        'vehicle_number': vehicle_number,
+        'slot': slot.get('slot_id'),
+        'location': slot.get('location'),
+        'floor': slot.get('floor', 1),
+        'date': date,
+        'time': time,
+        'duration': duration,
+        'amount': rates.amount(slot.get('location'), slot.get('floor', 1), start_dt, duration),
+        'rate_version': rates.version,
+        'status': 'active',
+        'start_at': start_dt,
+        'end_at': end_dt,
+        'created_at': datetime.utcnow()
+    }
+
+def _book_waitlisted(entry):
+    """Book a free slot on a waitlist entry's floor (the slot it asked for first); None when all are taken."""
+    location, floor = entry['location'], entry['floor']
+    start_dt, end_dt = entry['start_at'], entry['end_at']
+    free = availability_index.free_slots(location, start_dt, end_dt, floor)
+    if entry.get('slot') in free:
+        free.remove(entry['slot'])
+        free.insert(0, entry['slot'])
+    rates = pricing.table()
+    for slot_id in free:
+        booking_id = ObjectId()
+        slot = _reserve_slot(location, slot_id, start_dt, end_dt, booking_id, entry['customer_name'])
+        if not slot:
+            continue
+        booking = _new_booking(booking_id, entry['user_id'], entry['customer_name'], entry['vehicle_number'], slot,
+                               entry['date'], entry['time'], entry['duration'], start_dt, end_dt, rates)
+        try:
+            bookings_collection.insert_one(booking)
+        except Exception:
+            _release_slot(booking)
+            raise
+        _record_booking_stats(booking, total_bookings=1, active_bookings=1, revenue=booking['amount'])
+        analytics_rollups.record(None, booking)
+        return booking
+    return None
+
+def _on_waitlist_promoted(entry, booking):
+    app.logger.info('Waitlist entry %s booked %s %s', entry['_id'], booking['location'], booking['slot'])
+
+def _promote_waitlist(*bookings):
+    """
+    Offer the windows these bookings gave back to the waitlist; call once their own writes are done.
+    Returns the (entry, booking) pairs promoted.
+    """
+    promoted = []
+    now_dt = datetime.utcnow()
+    for booking in bookings:
+        start_dt, end_dt = booking.get('start_at'), booking.get('end_at')
+        if not isinstance(start_dt, datetime) or not isinstance(end_dt, datetime) or end_dt <= now_dt:
+            continue
+        try:
+            promoted.extend(waitlist.promote(booking.get('location'), booking.get('floor', 1), start_dt, end_dt))
+        except Exception as e:
+            # The release itself went through; the entry stays queued for the next one
+            app.logger.warning('Waitlist promotion failed: %s', e)
+    return promoted
+
+def _join_waitlist(data, user_id, start_dt, end_dt, priority=0):
+    """
+    (body, status) for a booking request whose slot is taken and that asked to wait ("waitlist": true):
+    202 with the queued entry when every slot on that slot's floor is taken for the window.
+    """
+    location = data.get('location')
+    slot = parking_slots_collection.find_one({'location': location, 'slot_id': data['slot']}, {'floor': 1})
+    if not slot:
+        return {'error': 'Slot not available'}, 400
+    floor = slot.get('floor', 1)
+    if availability_index.free_slots(location, start_dt, end_dt, floor):
+        # Only a full floor queues; another slot there can be booked right away
+        return {'error': 'Slot not available; other slots on this floor are free'}, 400
+    entry = waitlist.join({
+        'user_id': user_id,
+        'customer_name': data['name'],
+        'vehicle_number': data['vehicle'],
+        'slot': data['slot'],
+        'location': location,
+        'floor': floor,
+        'date': data['date'],
+        'time': data['time'],
+        'duration': int(data['duration']),
+        'priority': priority,
+        'start_at': start_dt,
+        'end_at': end_dt,
+    })
+    if entry is None:
+        return {'error': 'Waitlist for this window is full'}, 400
+    # A slot freed while the entry was being queued would otherwise wait for the next release
+    promoted = {e['_id']: e for e, _ in _promote_waitlist(entry)}
+    entry = promoted.get(entry['_id'], entry)
+    if entry['status'] == 'waiting':
+        entry['position'] = waitlist.position(entry)
+    return _serialize_booking(entry), 202
+
+# Booking requests queued for full floors, promoted as slots free up
+waitlist = Waitlist(db['waitlist'], db['waitlist_queues'], _book_waitlisted,
+                    max_per_window=Config.WAITLIST_MAX_PER_WINDOW, claim_seconds=Config.WAITLIST_CLAIM_SECONDS,
+                    logger=app.logger)
+waitlist.add_hook(_on_waitlist_promoted)
+
+# Initialize DB data and indexes on startup (works with gunicorn & local)
 initialize_data()
+_refresh_availability()
+waitlist.load(location_directory.scope())
+
+# Expire finished bookings in the background instead of on every read
+expiry_worker = ExpiryWorker(
+    bookings_collection,
+    parking_slots_collection,
+    interval_seconds=Config.EXPIRY_TICK_SECONDS,
+    on_start=reconcile_expired_and_slots,
+    on_tick=_on_expiry_tick,
+    on_change=_slots_changed,
+    on_expired=_on_bookings_expired,
+    archive=bookings_archive_collection if Config.BOOKING_ARCHIVE_AFTER_DAYS > 0 else None,
+    archive_after=timedelta(days=Config.BOOKING_ARCHIVE_AFTER_DAYS),
+    archive_batch_size=Config.BOOKING_ARCHIVE_BATCH_SIZE,
+    scope=location_directory.scope(),
+    logger=app.logger
+)
+
+@app.before_request
+def _start_background_workers():
+    expiry_worker.start()
+    analytics_rollups.start()
+    if Config.SLOT_STREAM_CHANGE_STREAMS:
+        slot_change_relay.start()
+
+# Authentication helpers
+user_cache = TTLCache(max_entries=Config.USER_CACHE_SIZE, ttl_seconds=Config.USER_CACHE_TTL_SECONDS)
+
+def _load_user(user_id):
+    return users_collection.find_one({'_id': ObjectId(user_id)}, {'password': 0})
+
+def _create_token(user):
+    """Access token carrying the user's role so guarded routes need no user lookup."""
+    # The ASGI app issues tokens outside a Flask request
+    with app.app_context():
+        return create_access_token(identity=str(user['_id']), additional_claims={'role': user['role']})
+
+def current_user_role():
+    """Role of the authenticated user, from the token claim or (older tokens) the cached user."""
+    role = get_jwt().get('role')
+    if role is None:
+        user = user_cache.get(get_jwt_identity(), _load_user)
+        role = user['role'] if user else None
+    return role
+
+def admin_required(fn):
+    """jwt_required plus a 403 unless the caller is an admin."""
+    @wraps(fn)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        if current_user_role() != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        return fn(*args, **kwargs)
+    return wrapper
+
+def _rate_limit_client():
+    """The authenticated user, or the client address (resolved through trusted proxies) without a verified token."""
+    try:
+        identity = get_jwt_identity()
+    except RuntimeError:
+        identity = None
+    return f'user:{identity}' if identity else f'ip:{request.remote_addr}'
+
+def _too_many_requests(message, retry_after):
+    return {'error': message}, 429, {'Retry-After': str(max(1, math.ceil(retry_after)))}
+
+def _rate_limit_flow(budget, client):
+    """(body, 429, headers) when ``client`` may not make a ``budget`` request right now, else None."""
+    if budget in Config.LOAD_SHED_BUDGETS:
+        retry_after = load_shedder.retry_after()
+        if retry_after:
+            return _too_many_requests('Server busy, try again shortly', retry_after)
+    if rate_limiter.backend.in_process:
+        allowed, retry_after = rate_limiter.check(budget, client)
+    else:
+        allowed, retry_after = yield Call(rate_limiter.check, budget, client)
+    if not allowed:
+        return _too_many_requests('Too many requests', retry_after)
+    return None
+
+def _respond(result):
+    """Flask response for a flow's (body, status[, headers])."""
+    body, status, *headers = result
+    return (jsonify(body), status, *headers)
+
+def rate_limited(budget):
+    """429 with Retry-After once the caller exhausts ``budget`` (Config.RATE_LIMITS), or while the
+    database is over its latency budget for routes in Config.LOAD_SHED_BUDGETS. Goes below jwt_required."""
+    def decorator(fn):
+        if not Config.RATE_LIMITING:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            limited = _run(_rate_limit_flow(budget, _rate_limit_client()))
+            if limited:
+                return _respond(limited)
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
 
 # Authentication Routes
+def _signed_in(user, status):
+    """(body, status) handing out a token for ``user``."""
+    return {
+        'access_token': _create_token(user),
+        'user': {
+            'id': str(user['_id']),
+            'username': user['username'],
+            'role': user['role']
+        }
+    }, status
+
+def _login_flow(data):
+    """(body, status[, headers]) for POST /api/auth/login."""
+    username = data.get('username')
+    password = data.get('password')
+
+    if not username or not password:
+        return {'error': 'Username and password required'}, 400
+
+    try:
+        user = yield Mongo('users', 'find_one', {'username': username})
+        if not user or not (yield Call(password_hasher.verify, password, user['password'])):
+            return {'error': 'Invalid credentials'}, 401
+
+        # Upgrade hashes made with an older scheme or cost while we have the plain password
+        if password_hasher.needs_rehash(user['password']):
+            yield Mongo(
+                'users', 'update_one',
+                {'_id': user['_id'], 'password': user['password']},
+                {'$set': {'password': (yield Call(password_hasher.hash, password))}}
+            )
+    except HashingBusy as e:
+        return {'error': str(e)}, 503, {'Retry-After': '1'}
+
+    return _signed_in(user, 200)
+
+def _register_flow(data):
+    """(body, status[, headers]) for POST /api/auth/register."""
+    username = data.get('username')
+    password = data.get('password')
+    role = data.get('role', 'customer')
+
+    if not username or not password:
+        return {'error': 'Username and password required'}, 400
+
+    # Check if user already exists
+    if (yield Mongo('users', 'find_one', {'username': username})):
+        return {'error': 'Username already exists'}, 400
+
+    # Create new user
+    try:
+        hashed = yield Call(password_hasher.hash, password)
+    except HashingBusy as e:
+        return {'error': str(e)}, 503, {'Retry-After': '1'}
+    user = {
+        'username': username,
+        'password': hashed,
+        'role': role,
+        'created_at': datetime.utcnow()
+    }
+    result = yield Mongo('users', 'insert_one', user)
+    user['_id'] = result.inserted_id
+
+    return _signed_in(user, 201)
+
 @app.route('/api/auth/login', methods=['POST'])
+@rate_limited('auth')
 def login():
     try:
-        data = request.get_json()
-        username = data.get('username')
-        password = data.get('password')
-        
-        if not username or not password:
-            return jsonify({'error': 'Username and password required'}), 400
-        
-        user = users_collection.find_one({'username': username})
-        if not user or not check_password_hash(user['password'], password):
-            return jsonify({'error': 'Invalid credentials'}), 401
-        
-        access_token = create_access_token(identity=str(user['_id']))
-        return jsonify({
-            'access_token': access_token,
-            'user': {
-                'id': str(user['_id']),
-                'username': user['username'],
-                'role': user['role']
-            }
-        }), 200
-        
+        return _respond(_run(_login_flow(request.get_json())))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/auth/register', methods=['POST'])
+@rate_limited('auth')
 def register():
     try:
-        data = request.get_json()
-        username = data.get('username')
-        password = data.get('password')
-        role = data.get('role', 'customer')
-        
-        if not username or not password:
-            return jsonify({'error': 'Username and password required'}), 400
-        
-        # Check if user already exists
-        if users_collection.find_one({'username': username}):
-            return jsonify({'error': 'Username already exists'}), 400
-        
-        # Create new user
-        user = {
-            'username': username,
-            'password': generate_password_hash(password),
-            'role': role,
-            'created_at': datetime.utcnow()
-        }
-        
-        result = users_collection.insert_one(user)
-        user['_id'] = result.inserted_id
-        
-        access_token = create_access_token(identity=str(user['_id']))
-        return jsonify({
-            'access_token': access_token,
-            'user': {
-                'id': str(user['_id']),
-                'username': user['username'],
-                'role': user['role']
-            }
-        }), 201
-        
+        return _respond(_run(_register_flow(request.get_json())))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Location Routes
+LOCATION_FIELDS = ('name', 'floors', 'rows', 'numbers', 'active', 'settings')
+
+def _location_listing():
+    """Every location with its layout, settings and slot count, in layout order."""
+    return [
+        {**{field: doc.get(field) for field in LOCATION_FIELDS}, 'capacity': location_directory.capacity(name)}
+        for name, doc in location_directory.all().items()
+    ]
+
+@app.route('/api/locations', methods=['GET'])
+@rate_limited('reads')
+def get_locations():
+    try:
+        return jsonify(_location_listing()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/locations/<name>', methods=['PUT'])
+@admin_required
+def put_location(name):
+    """Create or change a location; slots for new floors/rows/numbers are added right away (none are removed)."""
+    try:
+        data = request.get_json(silent=True)
+        existing = locations_collection.find_one({'_id': name})
+        try:
+            # Fields left out keep their stored value, or the layout defaults for a new location
+            doc = location_document(name, data, defaults=existing or Config.PARKING_LAYOUT)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        now = datetime.utcnow()
+        fields = {field: doc[field] for field in LOCATION_FIELDS}
+        locations_collection.update_one(
+            {'_id': name},
+            {'$set': {**fields, 'updated_at': now}, '$setOnInsert': {'created_at': now}},
+            upsert=True
+        )
+        created = seed_slots(parking_slots_collection, {'locations': [doc]})
+        location_directory.invalidate()
+        if created:
+            if location_directory.serves(name):
+                availability_index.load(
+                    parking_slots_collection.find({'location': name}, AVAILABILITY_FIELDS), location=name
+                )
+            _slots_changed()
+        return jsonify({'location': fields, 'slots_created': created}), 200 if existing else 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Parking Slots Routes
+# Reservations and created_at are not part of the listing (reservations can be long)
+SLOT_LISTING_PROJECTION = {'reservations': 0, 'created_at': 0}
+
+def _slot_listing_flow(params):
+    """
+    (listing, status) for GET /api/parking-slots; the listing of a 200 is (etag, serialized body),
+    served from cache while no slot/booking write has happened.
+    """
+    # Optional filters: location, floor, status
+    query = {}
+    location_param = params.get('location')
+    floor_param = params.get('floor')
+    status_param = params.get('status')
+
+    if location_param:
+        if not location_directory.serves(location_param):
+            return _misdirected(location_param)
+        query['location'] = location_param
+    if floor_param:
+        try:
+            query['floor'] = int(floor_param)
+        except ValueError:
+            pass
+    if status_param:
+        query['status'] = status_param
+    # Without a location a pinned worker lists its own locations
+    query = location_directory.scope(query)
+
+    cache_key = (location_param, query.get('floor'), status_param)
+    counter = yield Mongo('counters', 'find_one', {'_id': SLOTS_VERSION_ID})
+    version = counter['value'] if counter else 0
+    cached = slot_listing_cache.get(cache_key, version)
+    if cached:
+        return cached, 200
+    slots = yield Mongo('parking_slots', 'find', query, SLOT_LISTING_PROJECTION)
+    body = app.json.dumps_bytes(slots)
+    return (slot_listing_cache.put(cache_key, version, body), body), 200
+
 @app.route('/api/parking-slots', methods=['GET'])
+@rate_limited('reads')
 def get_parking_slots():
     try:
-        # Optional filters: location, floor, status
-        query = {}
-        location_param = request.args.get('location')
-        floor_param = request.args.get('floor')
-        status_param = request.args.get('status')
-
-        # Reconcile before serving data to avoid phantom booked slots
-        reconcile_expired_and_slots(location_param)
+        listing, status = _run(_slot_listing_flow(request.args))
+        if status != 200:
+            return jsonify(listing), status
+        etag, body = listing
 
-        if location_param:
-            query['location'] = location_param
-        if floor_param:
-            try:
-                query['floor'] = int(floor_param)
-            except ValueError:
-                pass
-        if status_param:
-            query['status'] = status_param
-
-        slots = list(parking_slots_collection.find(query))
-        for slot in slots:
-            slot['_id'] = str(slot['_id'])
-        return jsonify(slots), 200
+        response = app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+SLOT_STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+SLOT_STREAM_PREAMBLE = 'retry: 3000\n\n'
+
+def _slot_event(event_id, delta, location_param):
+    """SSE text for one item of slot_feed.subscribe(), or None when it is for another location."""
+    if event_id is None:
+        return ': keep-alive\n\n'
+    if event_id == 'reset':
+        # Deltas were missed; the client should reload the full listing
+        return 'event: reset\ndata: {}\n\n'
+    if delta['location'] == location_param or (
+        not location_param and location_directory.serves(delta['location'])
+    ):
+        return f"id: {event_id}\nevent: slot\ndata: {json.dumps(delta)}\n\n"
+    return None
+
+# Each open stream holds one of this worker's threads (the async app streams on the event loop instead)
+slot_stream_clients = threading.BoundedSemaphore(Config.SLOT_STREAM_MAX_CLIENTS)
+
+@app.route('/api/parking-slots/stream', methods=['GET'])
+@rate_limited('reads')
+def stream_parking_slots():
+    """Server-sent events with slot status deltas, optionally filtered by location."""
+    location_param = request.args.get('location')
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    if not location_directory.serves(location_param):
+        body, status = _misdirected(location_param)
+        return jsonify(body), status
+    if not slot_stream_clients.acquire(blocking=False):
+        # Clients fall back to polling the listing
+        return jsonify({'error': 'Too many open slot streams'}), 503, {'Retry-After': '30'}
+
+    def generate():
+        yield SLOT_STREAM_PREAMBLE
+        for event_id, delta in slot_feed.subscribe(last_event_id, Config.SLOT_STREAM_HEARTBEAT_SECONDS):
+            event = _slot_event(event_id, delta, location_param)
+            if event:
+                yield event
+
+    response = Response(generate(), mimetype='text/event-stream', headers=SLOT_STREAM_HEADERS)
+    response.call_on_close(slot_stream_clients.release)
+    return response
+
+def _slots_reopened_or_closed(locations):
+    """After admins open or close slots: re-derive statuses and reload those locations' availability."""
+    for location in locations:
+        sync_slot_statuses(location)
+        if location_directory.serves(location):
+            availability_index.load(
+                parking_slots_collection.find({'location': location}, AVAILABILITY_FIELDS), location=location
+            )
+
+def _update_slot_flow(slot_id, location, data):
+    """(body, status) for PUT /api/parking-slots/<slot_id>."""
+    # ?location= routes the update to one location's slot; without it every location's slot_id matches
+    slot_filter = {'slot_id': slot_id}
+    if location:
+        slot_filter['location'] = location
+    try:
+        data = slot_update(data)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+    result = yield Mongo('parking_slots', 'update_one', slot_filter, {'$set': data})
+    if result.modified_count == 0:
+        return {'error': 'Slot not found'}, 404
+
+    slots = yield Mongo('parking_slots', 'find', slot_filter, {'location': 1, 'slot_id': 1, 'status': 1, 'booked_by': 1})
+    if 'closed' in data:
+        yield Call(_slots_reopened_or_closed, {s.get('location') for s in slots})
+        slots = yield Mongo('parking_slots', 'find', slot_filter,
+                            {'location': 1, 'slot_id': 1, 'status': 1, 'booked_by': 1})
+    yield from _slots_changed_flow(*[
+        (s.get('location'), s.get('slot_id'), s.get('status'), s.get('booked_by')) for s in slots
+    ])
+    return {'message': 'Slot updated successfully'}, 200
+
 @app.route('/api/parking-slots/<slot_id>', methods=['PUT'])
-@jwt_required()
+@admin_required
 def update_parking_slot(slot_id):
     try:
-        data = request.get_json()
-        current_user_id = get_jwt_identity()
-        
-        # Check if user is admin
-        user = users_collection.find_one({'_id': ObjectId(current_user_id)})
-        if user['role'] != 'admin':
-            return jsonify({'error': 'Admin access required'}), 403
-        
-        result = parking_slots_collection.update_one(
-            {'slot_id': slot_id},
-            {'$set': data}
-        )
-        
-        if result.modified_count == 0:
-            return jsonify({'error': 'Slot not found'}), 404
-        
-        return jsonify({'message': 'Slot updated successfully'}), 200
-        
+        return _respond(_run(_update_slot_flow(slot_id, request.args.get('location'), request.get_json())))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/slots:batch', methods=['POST'])
+@admin_required
+def batch_update_parking_slots():
+    """Apply many slot updates in one bulk_write; each item targets a slot (slot_id) or a whole floor."""
+    try:
+        try:
+            items = operations(request.get_json(silent=True), Config.BATCH_MAX_OPERATIONS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        results = [None] * len(items)
+        parsed = {}
+        for i, item in enumerate(items):
+            try:
+                parsed[i] = parse_slot_operation(item)
+            except ValueError as e:
+                results[i] = {'index': i, 'ok': False, 'error': str(e)}
+
+        # One read resolves the slots every item matches, so missing ones are reported per item
+        by_slot, by_floor = {}, {}
+        if parsed:
+            for slot in parking_slots_collection.find(
+                {'$or': [slot_filter for slot_filter, _, _ in parsed.values()]},
+                {'location': 1, 'slot_id': 1, 'floor': 1}
+            ):
+                by_slot[(slot.get('location'), slot.get('slot_id'))] = slot
+                by_floor.setdefault((slot.get('location'), slot.get('floor')), []).append(slot)
+
+        ops = []
+        applied = []
+        for i, (slot_filter, update, many) in parsed.items():
+            if many:
+                slots = by_floor.get((slot_filter['location'], slot_filter['floor']), [])
+            else:
+                slot = by_slot.get((slot_filter['location'], slot_filter['slot_id']))
+                slots = [slot] if slot else []
+            if not slots:
+                results[i] = {'index': i, 'ok': False, 'error': 'Slot not found'}
+                continue
+            ops.append((UpdateMany if many else UpdateOne)(slot_filter, {'$set': update}))
+            applied.append((i, slots, 'closed' in update))
+
+        errors = _bulk_write_errors(parking_slots_collection, ops) if ops else {}
+        touched = []
+        opened_or_closed = set()
+        for n, (i, slots, opens_or_closes) in enumerate(applied):
+            if n in errors:
+                results[i] = {'index': i, 'ok': False, 'error': errors[n]}
+            else:
+                results[i] = {'index': i, 'ok': True, 'matched': len(slots)}
+                touched.extend(slot['_id'] for slot in slots)
+                if opens_or_closes:
+                    opened_or_closed.update(slot.get('location') for slot in slots)
+
+        # Closed slots take no bookings; reopened ones get their booked/available status back
+        _slots_reopened_or_closed(opened_or_closed)
+        if touched:
+            _slots_changed(*[
+                (s.get('location'), s.get('slot_id'), s.get('status'), s.get('booked_by'))
+                for s in parking_slots_collection.find(
+                    {'_id': {'$in': touched}}, {'location': 1, 'slot_id': 1, 'status': 1, 'booked_by': 1}
+                )
+            ])
+
+        succeeded = sum(1 for r in results if r['ok'])
+        return jsonify({'succeeded': succeeded, 'failed': len(results) - succeeded, 'results': results}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Availability Routes
+def _parse_window_time(value: str):
+    """Parse a window bound given as 'YYYY-MM-DD HH:MM' or ISO 8601."""
+    return datetime.fromisoformat(value.strip())
+
+def _availability(params):
+    """(body, status) for GET /api/availability; ``params`` are the query arguments."""
+    location = params.get('location')
+    start_param = params.get('start')
+    end_param = params.get('end')
+
+    if not location or not start_param or not end_param:
+        return {'error': 'location, start and end are required'}, 400
+    if not location_directory.serves(location):
+        return _misdirected(location)
+    try:
+        start_dt = _parse_window_time(start_param)
+        end_dt = _parse_window_time(end_param)
+    except ValueError:
+        return {'error': 'start and end must be YYYY-MM-DD HH:MM'}, 400
+    if end_dt <= start_dt:
+        return {'error': 'end must be after start'}, 400
+
+    window = {
+        'location': location,
+        'start': start_dt.strftime("%Y-%m-%d %H:%M"),
+        'end': end_dt.strftime("%Y-%m-%d %H:%M")
+    }
+
+    # Single slot check
+    slot_param = params.get('slot')
+    if slot_param:
+        window['slot'] = slot_param
+        window['free'] = availability_index.is_free(location, slot_param, start_dt, end_dt)
+        return window, 200
+
+    floor = None
+    floor_param = params.get('floor')
+    if floor_param:
+        try:
+            floor = int(floor_param)
+        except ValueError:
+            pass
+
+    free = availability_index.free_slots(location, start_dt, end_dt, floor)
+    window['free_slots'] = free
+    window['count'] = len(free)
+    return window, 200
+
+@app.route('/api/availability', methods=['GET'])
+@rate_limited('reads')
+def get_availability():
+    try:
+        # Answered from the in-memory index the expiry worker keeps in step with MongoDB
+        return _respond(_availability(request.args))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _suggest_slots(params):
+    """(body, status) for GET /api/parking-slots/suggest; ``params`` are the query arguments."""
+    location = params.get('location')
+    start_param = params.get('start')
+    end_param = params.get('end')
+    if not location or not start_param or not end_param:
+        return {'error': 'location, start and end are required'}, 400
+    if not location_directory.serves(location):
+        return _misdirected(location)
+    try:
+        start_dt = _parse_window_time(start_param)
+        end_dt = _parse_window_time(end_param)
+    except ValueError:
+        return {'error': 'start and end must be YYYY-MM-DD HH:MM'}, 400
+    if end_dt <= start_dt:
+        return {'error': 'end must be after start'}, 400
+    try:
+        floor = int(params['floor']) if params.get('floor') else None
+        limit = min(max(int(params.get('limit') or 5), 1), Config.SUGGEST_LIMIT_MAX)
+    except ValueError:
+        return {'error': 'floor and limit must be integers'}, 400
+
+    # Preferred location first, then the configured fallback order (default layout order), limited to
+    # the locations this worker holds in its availability index
+    fallbacks = Config.SUGGEST_LOCATION_ORDER or location_directory.names()
+    locations = [location] + [loc for loc in fallbacks if loc != location and location_directory.serves(loc)]
+    if params.get('fallback', 'true').lower() == 'false':
+        locations = [location]
+    suggestions = availability_index.suggest(
+        locations, start_dt, end_dt, floor=floor, near=params.get('near'), limit=limit,
+        costs=Config.SUGGEST_COSTS
+    )
+    return {
+        'location': location,
+        'start': start_dt.strftime("%Y-%m-%d %H:%M"),
+        'end': end_dt.strftime("%Y-%m-%d %H:%M"),
+        'suggestions': [
+            {'location': loc, 'slot_id': slot_id, 'floor': slot_floor, 'cost': cost}
+            for cost, loc, slot_id, slot_floor in suggestions
+        ],
+        'count': len(suggestions)
+    }, 200
+
+@app.route('/api/parking-slots/suggest', methods=['GET'])
+@rate_limited('reads')
+def suggest_parking_slots():
+    try:
+        # Answered from the in-memory availability index: no MongoDB round-trip
+        body, status = _suggest_slots(request.args)
+        return jsonify(body), status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Pricing Routes
+def _quote_windows(data, rates):
+    """(body, status) for POST /api/quotes: every window priced against the same compiled rate table."""
+    if not isinstance(data, dict):
+        return {'error': 'Request body must be a JSON object'}, 400
+    windows = data.get('windows')
+    if not isinstance(windows, list) or not windows:
+        return {'error': 'windows must be a non-empty list'}, 400
+    if len(windows) > Config.QUOTE_MAX_WINDOWS:
+        return {'error': f'At most {Config.QUOTE_MAX_WINDOWS} windows per request'}, 400
+
+    quotes = []
+    for i, window in enumerate(windows):
+        try:
+            if not isinstance(window, dict):
+                raise ValueError('Window must be an object')
+            # location and floor default to the request's own
+            location = window.get('location', data.get('location'))
+            if not location:
+                raise ValueError('location is required')
+            floor = int(window.get('floor', data.get('floor', 1)))
+            duration = int(window['duration'])
+            start_dt, end_dt = _parse_booking_times(window['date'], window['time'], duration)
+            quote = rates.quote(location, floor, start_dt, duration)
+        except KeyError as e:
+            quotes.append({'index': i, 'ok': False, 'error': f'{e.args[0]} is required'})
+            continue
+        except (TypeError, ValueError) as e:
+            quotes.append({'index': i, 'ok': False, 'error': str(e)})
+            continue
+        quotes.append({
+            'index': i,
+            'ok': True,
+            'location': location,
+            'floor': floor,
+            'start': start_dt.isoformat(' ', 'minutes'),
+            'end': end_dt.isoformat(' ', 'minutes'),
+            'duration': duration,
+            **quote
+        })
+    return {'currency': rates.currency, 'rate_version': rates.version, 'quotes': quotes}, 200
+
+@app.route('/api/quotes', methods=['POST'])
+@rate_limited('quotes')
+def create_quotes():
+    """Price many candidate windows in one call (the same prices POST /api/bookings charges)."""
+    try:
+        body, status = _quote_windows(request.get_json(silent=True), pricing.table())
+        return jsonify(body), status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/rates', methods=['GET'])
+@admin_required
+def get_rates():
+    try:
+        rates = pricing.table()
+        return jsonify({'rate_version': rates.version, 'rates': rates.rates}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/rates', methods=['PUT'])
+@admin_required
+def replace_rates():
+    """Replace the rate table; existing bookings keep their amount and rate_version."""
+    try:
+        try:
+            rates = pricing.replace(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'rate_version': rates.version, 'rates': rates.rates}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Bookings Routes
+def _bookings_page_flow(query, projection, limit_param, after_param):
+    """(body, status, headers) for one page of GET /api/bookings (?limit= and/or ?cursor= given)."""
+    # Keyset pagination on _id; the next page's cursor is returned in X-Next-Cursor
+    try:
+        limit = int(limit_param) if limit_param else Config.BOOKINGS_PAGE_SIZE
+    except ValueError:
+        return {'error': 'limit must be an integer'}, 400
+    limit = max(1, min(limit, Config.BOOKINGS_PAGE_MAX))
+    if after_param:
+        try:
+            query = {**query, '_id': {'$gt': ObjectId(after_param)}}
+        except InvalidId:
+            return {'error': 'Invalid cursor'}, 400
+
+    bookings = yield Mongo('bookings', 'find', query, projection, sort=[('_id', 1)], limit=limit + 1)
+    has_more = len(bookings) > limit
+    bookings = [_serialize_booking(b) for b in bookings[:limit]]
+    return bookings, 200, ({'X-Next-Cursor': str(bookings[-1]['_id'])} if has_more else {})
+
+def _create_booking_flow(data, user_id, role):
+    """(body, status) for POST /api/bookings."""
+    # Calculate start/end
+    start_dt, end_dt = _parse_booking_times(data['date'], data['time'], int(data['duration']))
+
+    if end_dt <= start_dt:
+        return {'error': 'Duration must be positive'}, 400
+    # The amount is priced server-side; any amount the client sends is ignored
+    rates = yield Call(pricing.table)
+    if int(data['duration']) > rates.max_hours:
+        return {'error': f'Duration must be at most {rates.max_hours} hours'}, 400
+    if 'priority' in data and role != 'admin':
+        return {'error': 'Only admins can set priority'}, 403
+    location = data.get('location')
+    if not location_directory.serves(location):
+        return _misdirected(location)
+    if not (yield Call(location_directory.accepts_bookings, location)):
+        return {'error': f'Location {location} is not taking bookings'}, 400
+
+    # Claim the window atomically: only one concurrent request can reserve overlapping time
+    booking_id = ObjectId()
+    slot = yield from _reserve_slot_flow(location, data['slot'], start_dt, end_dt, booking_id, data['name'])
+    if not slot:
+        if (yield Mongo('parking_slots', 'find_one', {'slot_id': data['slot'], 'location': location, 'closed': True},
+                        {'_id': 1})):
+            return {'error': 'Slot is closed'}, 409
+        if data.get('waitlist'):
+            return (yield Call(_join_waitlist, data, user_id, start_dt, end_dt, int(data.get('priority', 0))))
+        return {'error': 'Slot not available'}, 400
+
+    # Create booking
+    booking = _new_booking(booking_id, user_id, data['name'], data['vehicle'], slot,
+                           data['date'], data['time'], int(data['duration']), start_dt, end_dt, rates)
+
+    try:
+        yield Mongo('bookings', 'insert_one', booking)
+    except Exception:
+        # Release the claim so the slot does not stay reserved without a booking
+        yield from _release_slot_flow(booking)
+        raise
+    yield from _booking_stats_flow(booking, total_bookings=1, active_bookings=1, revenue=booking['amount'])
+    yield from _booking_analytics_flow(None, booking)
+    return _serialize_booking(booking), 201
+
+def _update_booking_flow(key, data, user_id, role):
+    """(body, status) for PUT /api/bookings/<id>; ``key`` is the booking's _booking_key filter."""
+    # Check if user is admin or booking owner
+    booking = yield Mongo('bookings', 'find_one', key)
+
+    if not booking:
+        return {'error': 'Booking not found'}, 404
+
+    is_admin = role == 'admin'
+    if not is_admin and str(booking['user_id']) != user_id:
+        return {'error': 'Access denied'}, 403
+    if not is_admin:
+        # As on create, a customer's amount is ignored; a changed window is repriced below
+        data.pop('amount', None)
+    if not data:
+        return {'error': 'No fields to update'}, 400
+
+    # Keep start_at/end_at as datetimes derived from date/time/duration so expiry stays indexed
+    start_dt, end_dt = booking.get('start_at'), booking.get('end_at')
+    if any(field in data for field in ('date', 'time', 'duration', 'start_at', 'end_at')):
+        merged = {**booking, **data}
+        start_dt, end_dt = _parse_booking_times(merged['date'], merged['time'], int(merged['duration']))
+        if end_dt <= start_dt:
+            return {'error': 'Duration must be positive'}, 400
+        data['duration'] = int(merged['duration'])
+        data['start_at'] = start_dt
+        data['end_at'] = end_dt
+        if 'amount' not in data:
+            # A new window is repriced at the current rates
+            rates = yield Call(pricing.table)
+            try:
+                data['amount'] = rates.amount(booking.get('location'), booking.get('floor', 1),
+                                              start_dt, data['duration'])
+            except ValueError as e:
+                return {'error': str(e)}, 400
+            data['rate_version'] = rates.version
+
+    # The booking is written first, only if its status and window are still the ones read above, so two
+    # concurrent edits cannot both change the slot; writes carry the location so a sharded cluster
+    # routes them to the booking's shard
+    result = yield Mongo(
+        'bookings', 'update_one',
+        {'location': booking.get('location'), '_id': booking['_id'], 'status': booking.get('status'),
+         'start_at': booking.get('start_at'), 'end_at': booking.get('end_at')},
+        {'$set': data}
+    )
+    if result.matched_count == 0:
+        return {'error': 'Booking was changed by another request, try again'}, 409
+    if result.modified_count == 0:
+        return {'error': 'Booking not found'}, 404
+
+    # Then the slot's reservations follow the booking's status and window; if the slot refuses (or the
+    # write fails) the booking is put back as it was
+    was_active = booking.get('status') == 'active'
+    new_status = data.get('status', booking.get('status'))
+    try:
+        if was_active and new_status in ['completed', 'cancelled']:
+            yield from _release_slot_flow(booking)
+            slot_ok = True
+        elif was_active and new_status == 'active' and 'start_at' in data:
+            slot_ok = yield from _move_reservation_flow(booking, start_dt, end_dt)
+        elif not was_active and new_status == 'active':
+            slot_ok = bool((yield from _reserve_slot_flow(booking.get('location'), booking.get('slot'),
+                                                          start_dt, end_dt, booking['_id'],
+                                                          booking.get('customer_name'))))
+        else:
+            slot_ok = True
+    except Exception:
+        yield from _restore_booking_flow(booking, data)
+        raise
+    if not slot_ok:
+        yield from _restore_booking_flow(booking, data)
+        return {'error': 'Slot not available'}, 400
+
+    yield from _booking_stats_flow(
+        booking,
+        active_bookings=int(new_status == 'active') - int(was_active),
+        revenue=as_amount(data.get('amount', booking.get('amount'))) - as_amount(booking.get('amount'))
+    )
+    yield from _booking_analytics_flow(booking, {**booking, **data})
+    if was_active and (new_status != 'active' or 'start_at' in data):
+        # The old window (or what a move left of it) may fit a waiting request
+        yield Call(_promote_waitlist, booking)
+
+    return {'message': 'Booking updated successfully'}, 200
+
+def _restore_booking_flow(booking, data):
+    """Undo an update that set ``data`` on ``booking``: put back the fields it overwrote, drop the ones it added."""
+    restore = {}
+    previous = {field: booking[field] for field in data if field in booking}
+    added = {field: '' for field in data if field not in booking}
+    if previous:
+        restore['$set'] = previous
+    if added:
+        restore['$unset'] = added
+    yield Mongo('bookings', 'update_one', {'location': booking.get('location'), '_id': booking['_id']}, restore)
+
+def _delete_booking_flow(key):
+    """(body, status) for DELETE /api/bookings/<id>."""
+    booking = yield Mongo('bookings', 'find_one', key)
+    if not booking:
+        return {'error': 'Booking not found'}, 404
+
+    # Free up the slot (only an active booking still holds it)
+    if booking.get('status') == 'active':
+        yield from _release_slot_flow(booking)
+
+    # Delete booking
+    result = yield Mongo('bookings', 'delete_one', {'location': booking.get('location'), '_id': booking['_id']})
+    if result.deleted_count:
+        yield from _booking_stats_flow(
+            booking,
+            total_bookings=-1,
+            active_bookings=-int(booking.get('status') == 'active'),
+            revenue=-as_amount(booking.get('amount'))
+        )
+        yield from _booking_analytics_flow(booking, None)
+        if booking.get('status') == 'active':
+            yield Call(_promote_waitlist, booking)
+
+    return {'message': 'Booking deleted successfully'}, 200
+
 @app.route('/api/bookings', methods=['GET'])
 @jwt_required()
+@rate_limited('reads')
 def get_bookings():
     try:
-        # Expire any past bookings before returning
-        reconcile_expired_and_slots(None)
-
         current_user_id = get_jwt_identity()
-        user = users_collection.find_one({'_id': ObjectId(current_user_id)})
         
         # Admin can see all bookings, customers see only their own
-        if user['role'] == 'admin':
-            bookings = list(bookings_collection.find())
-        else:
-            bookings = list(bookings_collection.find({'user_id': current_user_id}))
-        
-        for booking in bookings:
-            booking['_id'] = str(booking['_id'])
-            booking['user_id'] = str(booking['user_id'])
-        
-        return jsonify(bookings), 200
+        query = {} if current_user_role() == 'admin' else {'user_id': current_user_id}
+        projection = _booking_projection(request.args.get('fields'))
+        limit_param = request.args.get('limit')
+        after_param = request.args.get('cursor')
+
+        if limit_param is None and after_param is None:
+            # Unpaginated: stream the whole list instead of building it in memory
+            cursor = bookings_collection.find(query, projection, batch_size=Config.EXPORT_BATCH_SIZE)
+            return Response(_stream_json_array(cursor), mimetype='application/json')
+
+        return _respond(_run(_bookings_page_flow(query, projection, limit_param, after_param)))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/bookings', methods=['POST'])
 @jwt_required()
+@rate_limited('bookings')
 def create_booking():
+    try:
+        return _respond(_run(_create_booking_flow(request.get_json(), get_jwt_identity(), current_user_role())))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/bookings/<booking_id>', methods=['PUT'])
+@jwt_required()
+@rate_limited('bookings')
+def update_booking(booking_id):
+    try:
+        return _respond(_run(_update_booking_flow(
+            _booking_key(booking_id, request.args.get('location')), request.get_json(),
+            get_jwt_identity(), current_user_role()
+        )))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/bookings/<booking_id>', methods=['DELETE'])
+@admin_required
+def delete_booking(booking_id):
+    try:
+        return _respond(_run(_delete_booking_flow(_booking_key(booking_id, request.args.get('location')))))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/bookings:batch', methods=['POST'])
+@jwt_required()
+@rate_limited('bookings')
+def batch_bookings():
+    """Cancel, delete (admin) or edit many bookings in one bulk_write, with a result per item."""
+    try:
+        try:
+            items = operations(request.get_json(silent=True), Config.BATCH_MAX_OPERATIONS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        is_admin = current_user_role() == 'admin'
+        current_user_id = get_jwt_identity()
+
+        results = [None] * len(items)
+        parsed = {}
+        seen = set()
+        for i, item in enumerate(items):
+            try:
+                op, booking_id, fields = parse_booking_operation(item)
+            except ValueError as e:
+                results[i] = {'index': i, 'ok': False, 'error': str(e)}
+                continue
+            if op == 'delete' and not is_admin:
+                results[i] = {'index': i, 'ok': False, 'error': 'Access denied'}
+            elif 'amount' in fields and not is_admin:
+                results[i] = {'index': i, 'ok': False, 'error': 'Only admins can set amount'}
+            elif booking_id in seen:
+                results[i] = {'index': i, 'ok': False, 'error': 'Booking appears more than once in the batch'}
+            else:
+                seen.add(booking_id)
+                parsed[i] = (op, booking_id, fields)
+
+        bookings = {}
+        if parsed:
+            bookings = {b['_id']: b for b in bookings_collection.find({'_id': {'$in': list(seen)}})}
+
+        ops = []
+        applied = []
+        for i, (op, booking_id, fields) in parsed.items():
+            booking = bookings.get(booking_id)
+            if not booking:
+                results[i] = {'index': i, 'ok': False, 'error': 'Booking not found'}
+            elif not is_admin and str(booking.get('user_id')) != current_user_id:
+                results[i] = {'index': i, 'ok': False, 'error': 'Access denied'}
+            elif op == 'cancel' and booking.get('status') != 'active':
+                results[i] = {'index': i, 'ok': False, 'error': 'Booking is not active'}
+            else:
+                key = {'location': booking.get('location'), '_id': booking_id}
+                if op == 'cancel':
+                    ops.append(UpdateOne({**key, 'status': 'active'}, {'$set': {'status': 'cancelled'}}))
+                elif op == 'delete':
+                    ops.append(DeleteOne(key))
+                else:
+                    ops.append(UpdateOne(key, {'$set': fields}))
+                applied.append((i, op, booking, fields))
+
+        errors = _bulk_write_errors(bookings_collection, ops) if ops else {}
+        released = []
+        stats_changes = []
+        for n, (i, op, booking, fields) in enumerate(applied):
+            if n in errors:
+                results[i] = {'index': i, 'ok': False, 'error': errors[n]}
+                continue
+            results[i] = {'index': i, 'ok': True}
+            was_active = booking.get('status') == 'active'
+            if op == 'cancel':
+                released.append(booking)
+                stats_changes.append((booking, 0, -1, 0))
+                analytics_rollups.record(booking, {**booking, 'status': 'cancelled'})
+            elif op == 'delete':
+                if was_active:
+                    released.append(booking)
+                stats_changes.append((booking, -1, -int(was_active), -as_amount(booking.get('amount'))))
+                analytics_rollups.record(booking, None)
+            else:
+                if 'amount' in fields:
+                    stats_changes.append(
+                        (booking, 0, 0, as_amount(fields['amount']) - as_amount(booking.get('amount')))
+                    )
+                analytics_rollups.record(booking, {**booking, **fields})
+
+        # Slots are released only for bookings whose write went through
+        _release_slots(released)
+        _record_booking_stats_many(*stats_changes)
+        _promote_waitlist(*released)
+
+        succeeded = sum(1 for r in results if r['ok'])
+        return jsonify({'succeeded': succeeded, 'failed': len(results) - succeeded, 'results': results}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/bookings/fleet', methods=['POST'])
+@jwt_required()
+@rate_limited('bookings')
+def create_fleet_booking():
+    """Book one slot per vehicle on neighbouring slots of a floor, all in one call (all or nothing)."""
     try:
         data = request.get_json()
         current_user_id = get_jwt_identity()
-        
-        # Check if slot is available
-        slot = parking_slots_collection.find_one({'slot_id': data['slot'], 'location': data.get('location')})
-        if not slot or slot['status'] != 'available':
-            return jsonify({'error': 'Slot not available'}), 400
-        
-        # Calculate start/end
+
+        vehicles = data.get('vehicles')
+        if not isinstance(vehicles, list) or not vehicles:
+            return jsonify({'error': 'vehicles must be a non-empty list'}), 400
+        if len(vehicles) > Config.FLEET_MAX_SLOTS:
+            return jsonify({'error': f'At most {Config.FLEET_MAX_SLOTS} vehicles per fleet booking'}), 400
+
+        location = data.get('location')
+        if not location_directory.serves(location):
+            body, status = _misdirected(location)
+            return jsonify(body), status
+        if not location_directory.accepts_bookings(location):
+            return jsonify({'error': f'Location {location} is not taking bookings'}), 400
+        floor = int(data.get('floor', 1))
         start_dt, end_dt = _parse_booking_times(data['date'], data['time'], int(data['duration']))
+        if end_dt <= start_dt:
+            return jsonify({'error': 'Duration must be positive'}), 400
+        rates = pricing.table()
+        try:
+            amount = rates.amount(location, floor, start_dt, int(data['duration']))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # Candidate runs come from the in-memory index; each claim is still checked atomically in MongoDB,
+        # so a run taken by another worker in the meantime just moves on to the next one
+        free = set(availability_index.free_slots(location, start_dt, end_dt, floor))
+        runs = contiguous_runs(availability_index.slots(location, floor), free, len(vehicles))
+        for run in itertools.islice(runs, Config.FLEET_CLAIM_ATTEMPTS):
+            booking_ids = [ObjectId() for _ in run]
+            if _reserve_slots(location, run, start_dt, end_dt, booking_ids, data['name']):
+                break
+        else:
+            return jsonify({'error': f'No {len(vehicles)} neighbouring slots available on floor {floor}'}), 400
 
-        # Create booking
-        booking = {
+        fleet_id = str(ObjectId())
+        created_at = datetime.utcnow()
+        bookings = [{
+            '_id': booking_id,
             'user_id': current_user_id,
             'customer_name': data['name'],
-            'vehicle_number': data['vehicle'],
-            'slot': data['slot'],
-            'location': slot.get('location'),
-            'floor': slot.get('floor', 1),
+            'vehicle_number': vehicle,
+            'slot': slot_id,
+            'location': location,
+            'floor': floor,
             'date': data['date'],
             'time': data['time'],
             'duration': int(data['duration']),
-            'amount': data['amount'],
+            'amount': amount,
+            'rate_version': rates.version,
             'status': 'active',
-            'start_at': start_dt.strftime("%Y-%m-%d %H:%M"),
-            'end_at': end_dt.strftime("%Y-%m-%d %H:%M"),
-            'created_at': datetime.utcnow()
-        }
-        
-        result = bookings_collection.insert_one(booking)
-        booking['_id'] = str(result.inserted_id)
-        
-        # Update slot status
-        parking_slots_collection.update_one(
-            {'slot_id': data['slot']},
-            {'$set': {'status': 'booked', 'booked_by': data['name']}}
-        )
-        
-        return jsonify(booking), 201
-        
+            'start_at': start_dt,
+            'end_at': end_dt,
+            'fleet_id': fleet_id,
+            'created_at': created_at
+        } for booking_id, slot_id, vehicle in zip(booking_ids, run, vehicles)]
+
+        try:
+            bookings_collection.insert_many(bookings)
+        except Exception:
+            # Release the claims so the slots do not stay reserved without bookings
+            bookings_collection.delete_many({'location': location, '_id': {'$in': booking_ids}})
+            _release_slots(bookings)
+            raise
+        _record_booking_stats_many(*[(booking, 1, 1, booking['amount']) for booking in bookings])
+        for booking in bookings:
+            analytics_rollups.record(None, booking)
+
+        return jsonify({
+            'fleet_id': fleet_id,
+            'slots': run,
+            'bookings': [_serialize_booking(booking) for booking in bookings]
+        }), 201
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/bookings/<booking_id>', methods=['PUT'])
+# Waitlist Routes
+@app.route('/api/waitlist', methods=['GET'])
 @jwt_required()
-def update_booking(booking_id):
+@rate_limited('reads')
+def get_waitlist():
+    """Waitlist entries, newest first (admins see everyone's); waiting ones carry their queue position."""
     try:
-        data = request.get_json()
-        current_user_id = get_jwt_identity()
-        
-        # Check if user is admin or booking owner
-        user = users_collection.find_one({'_id': ObjectId(current_user_id)})
-        booking = bookings_collection.find_one({'_id': ObjectId(booking_id)})
-        
-        if not booking:
-            return jsonify({'error': 'Booking not found'}), 404
-        
-        if user['role'] != 'admin' and str(booking['user_id']) != current_user_id:
-            return jsonify({'error': 'Access denied'}), 403
-        
-        result = bookings_collection.update_one(
-            {'_id': ObjectId(booking_id)},
-            {'$set': data}
-        )
-        
-        if result.modified_count == 0:
-            return jsonify({'error': 'Booking not found'}), 404
-
-        # If status was updated to completed/cancelled, free up the slot
-        new_status = data.get('status')
-        if new_status in ['completed', 'cancelled']:
-            slot_id = booking.get('slot')
-            location = booking.get('location')
-            if slot_id and location:
-                parking_slots_collection.update_one(
-                    {'slot_id': slot_id, 'location': location},
-                    {'$set': {'status': 'available', 'booked_by': None}}
-                )
-        
-        return jsonify({'message': 'Booking updated successfully'}), 200
-        
+        query = {} if current_user_role() == 'admin' else {'user_id': get_jwt_identity()}
+        if request.args.get('status'):
+            query['status'] = request.args['status']
+        try:
+            limit = int(request.args.get('limit') or Config.BOOKINGS_PAGE_SIZE)
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        limit = max(1, min(limit, Config.BOOKINGS_PAGE_MAX))
+
+        entries = list(waitlist.entries.find(query).sort('_id', -1).limit(limit))
+        for entry in entries:
+            if entry['status'] == 'waiting':
+                entry['position'] = waitlist.position(entry)
+            _serialize_booking(entry)
+        return jsonify(entries), 200
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/bookings/<booking_id>', methods=['DELETE'])
+@app.route('/api/waitlist/<entry_id>', methods=['DELETE'])
 @jwt_required()
-def delete_booking(booking_id):
+@rate_limited('bookings')
+def cancel_waitlist_entry(entry_id):
     try:
-        current_user_id = get_jwt_identity()
-        
-        # Check if user is admin
-        user = users_collection.find_one({'_id': ObjectId(current_user_id)})
-        if user['role'] != 'admin':
-            return jsonify({'error': 'Admin access required'}), 403
-        
-        booking = bookings_collection.find_one({'_id': ObjectId(booking_id)})
-        if not booking:
-            return jsonify({'error': 'Booking not found'}), 404
-        
-        # Free up the slot
-        parking_slots_collection.update_one(
-            {'slot_id': booking['slot']},
-            {'$set': {'status': 'available', 'booked_by': None}}
-        )
-        
-        # Delete booking
-        bookings_collection.delete_one({'_id': ObjectId(booking_id)})
-        
-        return jsonify({'message': 'Booking deleted successfully'}), 200
-        
+        query = {} if current_user_role() == 'admin' else {'user_id': get_jwt_identity()}
+        if not waitlist.cancel(ObjectId(entry_id), query):
+            return jsonify({'error': 'Waitlist entry not found or no longer waiting'}), 404
+        return jsonify({'message': 'Left the waitlist'}), 200
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Admin Dashboard Routes
+def _admin_stats_flow():
+    """(body, status) for GET /api/admin/stats."""
+    # One $facet aggregation, or the incrementally maintained document when materialized
+    if Config.STATS_MATERIALIZED:
+        return (yield Call(stats_store.read)), 200
+    return (yield Call(reporting_stats.compute)), 200
+
 @app.route('/api/admin/stats', methods=['GET'])
-@jwt_required()
+@admin_required
 def get_admin_stats():
     try:
-        current_user_id = get_jwt_identity()
-        user = users_collection.find_one({'_id': ObjectId(current_user_id)})
-        
-        if user['role'] != 'admin':
-            return jsonify({'error': 'Admin access required'}), 403
-        
-        # Calculate stats
-        total_bookings = bookings_collection.count_documents({})
-        active_bookings = bookings_collection.count_documents({'status': 'active'})
-        
-        # Calculate total revenue
-        revenue_pipeline = [
-            {'$group': {'_id': None, 'total': {'$sum': '$amount'}}}
-        ]
-        revenue_result = list(bookings_collection.aggregate(revenue_pipeline))
-        total_revenue = revenue_result[0]['total'] if revenue_result else 0
-        
-        # Count available slots
-        available_slots = parking_slots_collection.count_documents({'status': 'available'})
-        
-        return jsonify({
-            'total_bookings': total_bookings,
-            'active_bookings': active_bookings,
-            'total_revenue': total_revenue,
-            'available_slots': available_slots
-        }), 200
-        
+        return _respond(_run(_admin_stats_flow()))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _analytics_series(params):
+    """(body, status) for GET /api/admin/analytics: every bucket in the range, empty ones as zeros."""
+    granularity = params.get('granularity', 'hour')
+    if granularity not in GRANULARITIES:
+        return {'error': f"granularity must be one of {', '.join(GRANULARITIES)}"}, 400
+    if not params.get('start') or not params.get('end'):
+        return {'error': 'start and end are required'}, 400
+    try:
+        start_dt = _parse_window_time(params['start'])
+        end_dt = _parse_window_time(params['end'])
+    except ValueError:
+        return {'error': 'start and end must be YYYY-MM-DD HH:MM'}, 400
+    if end_dt <= start_dt:
+        return {'error': 'end must be after start'}, 400
+    try:
+        floor = int(params['floor']) if params.get('floor') else None
+    except ValueError:
+        return {'error': 'floor must be an integer'}, 400
+
+    step = GRANULARITIES[granularity]
+    first = bucket_start(start_dt, granularity)
+    if math.ceil((end_dt - first) / step) > Config.ANALYTICS_MAX_BUCKETS:
+        return {'error': f'At most {Config.ANALYTICS_MAX_BUCKETS} buckets per request'}, 400
+
+    location = params.get('location')
+    buckets = {}
+    for row in analytics_rollups.read(granularity, first, end_dt, location, floor):
+        counters = buckets.setdefault(row['bucket'], {})
+        for field in ('bookings', 'revenue', 'occupied_minutes'):
+            counters[field] = counters.get(field, 0) + row.get(field, 0)
+
+    # Occupancy is occupied slot-time over the slot-time the matching slots offer in a bucket; a pinned
+    # worker only indexes its own locations' slots, so it counts them from the location layouts
+    if location_directory.served is None:
+        capacity = availability_index.capacity(location, floor)
+    else:
+        capacity = location_directory.capacity(location, floor)
+    bucket_minutes = step.total_seconds() / 60
+    series = []
+    totals = {'bookings': 0, 'revenue': 0, 'occupied_hours': 0}
+    bucket = first
+    while bucket < end_dt:
+        counters = buckets.get(bucket, {})
+        occupied = counters.get('occupied_minutes', 0)
+        point = {
+            'bucket': bucket.isoformat(' ', 'minutes'),
+            'bookings': counters.get('bookings', 0),
+            'revenue': round(counters.get('revenue', 0), 2),
+            'occupied_hours': round(occupied / 60, 2),
+            'occupancy': round(occupied / (capacity * bucket_minutes), 4) if capacity else None,
+        }
+        series.append(point)
+        for field in totals:
+            totals[field] += point[field]
+        bucket += step
+    totals['revenue'] = round(totals['revenue'], 2)
+    totals['occupied_hours'] = round(totals['occupied_hours'], 2)
+
+    return {
+        'granularity': granularity,
+        'start': first.isoformat(' ', 'minutes'),
+        'end': end_dt.isoformat(' ', 'minutes'),
+        'location': location,
+        'floor': floor,
+        'capacity': capacity,
+        'totals': totals,
+        'series': series
+    }, 200
+
+@app.route('/api/admin/analytics', methods=['GET'])
+@admin_required
+def get_admin_analytics():
+    try:
+        # Served from the rollup collection: a range reads one document per bucket and (location, floor)
+        body, status = _analytics_series(request.args)
+        return jsonify(body), status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/admin/export', methods=['GET'])
-@jwt_required()
+@admin_required
 def export_bookings():
     try:
-        current_user_id = get_jwt_identity()
-        user = users_collection.find_one({'_id': ObjectId(current_user_id)})
-        
-        if user['role'] != 'admin':
-            return jsonify({'error': 'Admin access required'}), 403
-        
-        bookings = list(bookings_collection.find())
-        for booking in bookings:
-            booking['_id'] = str(booking['_id'])
-            booking['user_id'] = str(booking['user_id'])
-        
-        return jsonify(bookings), 200
+        export_format = request.args.get('format', 'json').lower()
+        projection = _booking_projection(request.args.get('fields'))
+        cursor = reporting_bookings_collection.find({}, projection, batch_size=Config.EXPORT_BATCH_SIZE)
+        # Archived bookings follow the live ones; the archive query only runs once those are exhausted
+        cursor = itertools.chain(cursor, reporting_archive_collection.find(
+            {}, projection, batch_size=Config.EXPORT_BATCH_SIZE
+        ))
+
+        # Stream straight off the cursor so memory stays flat regardless of history size
+        if export_format == 'ndjson':
+            return Response(_json_chunks(cursor, separator=b'\n', terminated=True), mimetype='application/x-ndjson', headers={
+                'Content-Disposition': 'attachment; filename=bookings.ndjson'
+            })
+        if export_format == 'csv':
+            return Response(_stream_csv(cursor), mimetype='text/csv', headers={
+                'Content-Disposition': 'attachment; filename=bookings.csv'
+            })
+        return Response(_stream_json_array(cursor), mimetype='application/json')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Metrics (Prometheus text format, per worker process)
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    return Response(instrumentation.render(), mimetype='text/plain; version=0.0.4')
+
 # Health check
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'OK', 'message': 'Parking System API is running'}), 200
+    return jsonify({
+        'status': 'OK',
+        'message': 'Parking System API is running',
+        'slot_reconcile': slot_sync_metrics,
+        'expiry_failures': expiry_worker.failures,
+        'mongo_pool': mongo.pool_stats()
+    }), 200
 
 if __name__ == '__main__':
     app.run(debug=True)
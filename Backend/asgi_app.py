@@ -0,0 +1,398 @@
+"""
+Async (ASGI) mode of the API.
+
+Serves the auth, parking slot, availability, booking and admin routes with the
+same request and response shapes as app.py, on Starlette with the Motor driver,
+so a request waiting on MongoDB parks a coroutine instead of a worker thread.
+Startup (schema, seeding, indexes), password hashing, the availability index and
+the expiry worker are shared with the WSGI app by importing it, and tokens
+issued by either mode are accepted by the other.
+
+    python run.py --async            # or: uvicorn asgi_app:app --port 5000
+
+The route logic is not repeated here: app.py writes it once as flows (see
+flows.py), which this module awaits on Motor, with their blocking steps (password
+hashing, pricing and location caches, waitlist joins and promotions) run in the
+thread pool. What is left is the HTTP layer: request parsing, authentication,
+conditional and streaming responses.
+
+The live slot stream waits on the event loop (SlotChangeFeed.subscribe_async),
+so open streams cost no threads. The batch endpoints, fleet bookings, the
+waitlist listing/cancel routes and the admin rate table and location routes are
+only served by the WSGI app.
+"""
+
+import contextlib
+import csv
+import io
+from functools import wraps
+
+from bson import ObjectId
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import ExpiredSignatureError, PyJWTError
+from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+import app as wsgi
+from config import Config
+from connection import PoolStats, client_options, read_heavy_preference
+from flows import run_async
+
+# Same pool, timeout and read/write settings as the sync connection factory
+pool_stats = PoolStats()
+client = AsyncIOMotorClient(wsgi.MONGODB_URI, event_listeners=[pool_stats, wsgi.command_metrics, wsgi.load_shedder], **client_options())
+db = client[wsgi.DATABASE_NAME]
+
+users_collection = db['users']
+bookings_collection = db['bookings']
+
+# Reporting reads (export) may go to secondaries
+reporting_bookings_collection = db.get_collection('bookings', read_preference=read_heavy_preference())
+reporting_archive_collection = db.get_collection('bookings_archive', read_preference=read_heavy_preference())
+
+# The collections wsgi.flow_collections names, on Motor
+flow_collections = {name: db[name] for name in wsgi.flow_collections}
+
+def _run(flow):
+    """Await a route flow from app.py; its blocking steps run in the thread pool."""
+    return run_async(flow, flow_collections, run_in_threadpool)
+
+def json_response(data, status_code=200, headers=None):
+    """Serialize like Flask's jsonify (same provider), so both modes return identical bodies."""
+    return Response(wsgi.app.json.dumps_bytes(data), status_code, headers, media_type='application/json')
+
+def error_response(message, status_code):
+    return json_response({'error': message}, status_code)
+
+def _booking_key(request):
+    return wsgi._booking_key(request.path_params['booking_id'], request.query_params.get('location'))
+
+# Authentication helpers
+async def _user_role(user_id):
+    """Role for tokens issued before the role claim existed, via the shared user cache."""
+    user = wsgi.user_cache.get(user_id)
+    if user is None:
+        user = await users_collection.find_one({'_id': ObjectId(user_id)}, {'password': 0})
+        if user is not None:
+            wsgi.user_cache.put(user_id, user)
+    return user['role'] if user else None
+
+def jwt_required(admin=False):
+    """Authenticate the bearer token like flask_jwt_extended; sets request.state.identity/role."""
+    def decorator(fn):
+        @wraps(fn)
+        async def wrapper(request):
+            header = request.headers.get('Authorization')
+            if not header:
+                return json_response({'msg': 'Missing Authorization Header'}, 401)
+            scheme, _, token = header.partition(' ')
+            if scheme != 'Bearer' or not token:
+                return json_response({'msg': "Bad Authorization header. Expected 'Authorization: Bearer <JWT>'"}, 422)
+            try:
+                with wsgi.app.app_context():
+                    claims = decode_token(token)
+            except ExpiredSignatureError:
+                return json_response({'msg': 'Token has expired'}, 401)
+            except (PyJWTError, JWTExtendedException) as e:
+                return json_response({'msg': str(e)}, 422)
+            if claims.get('type') != 'access':
+                return json_response({'msg': 'Only non-refresh tokens are allowed'}, 422)
+
+            request.state.identity = claims[wsgi.app.config['JWT_IDENTITY_CLAIM']]
+            request.state.role = claims.get('role') or await _user_role(request.state.identity)
+            if admin and request.state.role != 'admin':
+                return error_response('Admin access required', 403)
+            return await fn(request)
+        return wrapper
+    return decorator
+
+def rate_limited(budget):
+    """Counterpart of app.rate_limited, sharing its buckets and latency average; goes below jwt_required."""
+    def decorator(fn):
+        if not Config.RATE_LIMITING:
+            return fn
+
+        @wraps(fn)
+        async def wrapper(request):
+            identity = getattr(request.state, 'identity', None)
+            # uvicorn resolves client.host from X-Forwarded-For sent by FORWARDED_ALLOW_IPS
+            client = f'user:{identity}' if identity else f'ip:{request.client.host if request.client else None}'
+            limited = await _run(wsgi._rate_limit_flow(budget, client))
+            if limited:
+                return json_response(*limited)
+            return await fn(request)
+        return wrapper
+    return decorator
+
+# Authentication Routes
+@rate_limited('auth')
+async def login(request):
+    try:
+        return json_response(*await _run(wsgi._login_flow(await request.json())))
+    except Exception as e:
+        return error_response(str(e), 500)
+
+@rate_limited('auth')
+async def register(request):
+    try:
+        return json_response(*await _run(wsgi._register_flow(await request.json())))
+    except Exception as e:
+        return error_response(str(e), 500)
+
+# Parking Slots Routes
+@rate_limited('reads')
+async def get_parking_slots(request):
+    try:
+        # Same cache and version counter as the WSGI app
+        listing, status = await _run(wsgi._slot_listing_flow(request.query_params))
+        if status != 200:
+            return json_response(listing, status)
+        etag, body = listing
+
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+        if_none_match = request.headers.get('If-None-Match', '')
+        if f'"{etag}"' in if_none_match or if_none_match.strip() == '*':
+            return Response(status_code=304, headers=headers)
+        return Response(body, 200, headers, media_type='application/json')
+    except Exception as e:
+        return error_response(str(e), 500)
+
+@rate_limited('reads')
+async def stream_parking_slots(request):
+    """Server-sent events with slot status deltas, like app.stream_parking_slots; a stream costs no thread here."""
+    location_param = request.query_params.get('location')
+    last_event_id = request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id')
+    if not wsgi.location_directory.serves(location_param):
+        return json_response(*wsgi._misdirected(location_param))
+
+    async def generate():
+        yield wsgi.SLOT_STREAM_PREAMBLE
+        async for event_id, delta in wsgi.slot_feed.subscribe_async(last_event_id,
+                                                                     Config.SLOT_STREAM_HEARTBEAT_SECONDS):
+            event = wsgi._slot_event(event_id, delta, location_param)
+            if event:
+                yield event
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers=wsgi.SLOT_STREAM_HEADERS)
+
+@jwt_required(admin=True)
+async def update_parking_slot(request):
+    try:
+        return json_response(*await _run(wsgi._update_slot_flow(
+            request.path_params['slot_id'], request.query_params.get('location'), await request.json()
+        )))
+    except Exception as e:
+        return error_response(str(e), 500)
+
+# Availability Routes
+@rate_limited('reads')
+async def get_availability(request):
+    try:
+        # Answered from the in-memory index the expiry worker keeps in step with MongoDB
+        return json_response(*wsgi._availability(request.query_params))
+    except Exception as e:
+        return error_response(str(e), 500)
+
+@rate_limited('reads')
+async def suggest_parking_slots(request):
+    try:
+        # The fallback order comes from the location cache, whose periodic re-read is a sync query
+        return json_response(*await run_in_threadpool(wsgi._suggest_slots, request.query_params))
+    except Exception as e:
+        return error_response(str(e), 500)
+
+@rate_limited('reads')
+async def get_locations(request):
+    try:
+        # Location documents are cached; the periodic re-read is a sync query
+        return json_response(await run_in_threadpool(wsgi._location_listing), 200)
+    except Exception as e:
+        return error_response(str(e), 500)
+
+@rate_limited('quotes')
+async def create_quotes(request):
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        # The compiled table is cached; its periodic version check is a sync read
+        rates = await run_in_threadpool(wsgi.pricing.table)
+        body, status = wsgi._quote_windows(data, rates)
+        return json_response(body, status)
+    except Exception as e:
+        return error_response(str(e), 500)
+
+# Bookings Routes
+async def _json_array(cursor):
+    yield b'['
+    i = 0
+    async for booking in cursor:
+        yield (b',' if i else b'') + wsgi.app.json.dumps_bytes(wsgi._serialize_booking(booking))
+        i += 1
+    yield b']'
+
+async def _chain(*cursors):
+    for cursor in cursors:
+        async for booking in cursor:
+            yield booking
+
+async def _ndjson(cursor):
+    async for booking in cursor:
+        yield wsgi.app.json.dumps_bytes(wsgi._serialize_booking(booking)) + b'\n'
+
+async def _csv(cursor):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=wsgi.EXPORT_CSV_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    async for booking in cursor:
+        writer.writerow(wsgi._serialize_booking(booking))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    yield buffer.getvalue()
+
+@jwt_required()
+@rate_limited('reads')
+async def get_bookings(request):
+    try:
+        # Admin can see all bookings, customers see only their own
+        query = {} if request.state.role == 'admin' else {'user_id': request.state.identity}
+        projection = wsgi._booking_projection(request.query_params.get('fields'))
+        limit_param = request.query_params.get('limit')
+        after_param = request.query_params.get('cursor')
+
+        if limit_param is None and after_param is None:
+            cursor = bookings_collection.find(query, projection, batch_size=Config.EXPORT_BATCH_SIZE)
+            return StreamingResponse(_json_array(cursor), media_type='application/json')
+
+        return json_response(*await _run(wsgi._bookings_page_flow(query, projection, limit_param, after_param)))
+    except Exception as e:
+        return error_response(str(e), 500)
+
+@jwt_required()
+@rate_limited('bookings')
+async def create_booking(request):
+    try:
+        return json_response(*await _run(wsgi._create_booking_flow(
+            await request.json(), request.state.identity, request.state.role
+        )))
+    except Exception as e:
+        return error_response(str(e), 500)
+
+@jwt_required()
+@rate_limited('bookings')
+async def update_booking(request):
+    try:
+        return json_response(*await _run(wsgi._update_booking_flow(
+            _booking_key(request), await request.json(), request.state.identity, request.state.role
+        )))
+    except Exception as e:
+        return error_response(str(e), 500)
+
+@jwt_required(admin=True)
+async def delete_booking(request):
+    try:
+        return json_response(*await _run(wsgi._delete_booking_flow(_booking_key(request))))
+    except Exception as e:
+        return error_response(str(e), 500)
+
+# Admin Dashboard Routes
+@jwt_required(admin=True)
+async def get_admin_stats(request):
+    try:
+        # The stats aggregation and the materialized document are read with the sync client
+        return json_response(*await _run(wsgi._admin_stats_flow()))
+    except Exception as e:
+        return error_response(str(e), 500)
+
+@jwt_required(admin=True)
+async def get_admin_analytics(request):
+    try:
+        # Rollup reads use the sync client, off the event loop
+        body, status = await run_in_threadpool(wsgi._analytics_series, request.query_params)
+        return json_response(body, status)
+    except Exception as e:
+        return error_response(str(e), 500)
+
+@jwt_required(admin=True)
+async def export_bookings(request):
+    try:
+        export_format = request.query_params.get('format', 'json').lower()
+        projection = wsgi._booking_projection(request.query_params.get('fields'))
+        # Archived bookings follow the live ones
+        cursor = _chain(
+            reporting_bookings_collection.find({}, projection, batch_size=Config.EXPORT_BATCH_SIZE),
+            reporting_archive_collection.find({}, projection, batch_size=Config.EXPORT_BATCH_SIZE)
+        )
+
+        if export_format == 'ndjson':
+            return StreamingResponse(_ndjson(cursor), media_type='application/x-ndjson', headers={
+                'Content-Disposition': 'attachment; filename=bookings.ndjson'
+            })
+        if export_format == 'csv':
+            return StreamingResponse(_csv(cursor), media_type='text/csv', headers={
+                'Content-Disposition': 'attachment; filename=bookings.csv'
+            })
+        return StreamingResponse(_json_array(cursor), media_type='application/json')
+    except Exception as e:
+        return error_response(str(e), 500)
+
+# Metrics: MongoDB command totals and gauges (route figures are only recorded by the WSGI app)
+async def metrics(request):
+    return Response(wsgi.instrumentation.render(), media_type='text/plain; version=0.0.4')
+
+# Health check
+async def health_check(request):
+    return json_response({
+        'status': 'OK',
+        'message': 'Parking System API is running',
+        'mode': 'asgi',
+        'slot_reconcile': wsgi.slot_sync_metrics,
+        'mongo_pool': {
+            **pool_stats.snapshot(),
+            'max_pool_size': client_options().get('maxPoolSize', 100),
+            'min_pool_size': client_options().get('minPoolSize', 0)
+        }
+    }, 200)
+
+routes = [
+    Route('/api/auth/login', login, methods=['POST']),
+    Route('/api/auth/register', register, methods=['POST']),
+    Route('/api/parking-slots', get_parking_slots, methods=['GET']),
+    Route('/api/parking-slots/stream', stream_parking_slots, methods=['GET']),
+    Route('/api/parking-slots/suggest', suggest_parking_slots, methods=['GET']),
+    Route('/api/parking-slots/{slot_id}', update_parking_slot, methods=['PUT']),
+    Route('/api/availability', get_availability, methods=['GET']),
+    Route('/api/locations', get_locations, methods=['GET']),
+    Route('/api/quotes', create_quotes, methods=['POST']),
+    Route('/api/bookings', get_bookings, methods=['GET']),
+    Route('/api/bookings', create_booking, methods=['POST']),
+    Route('/api/bookings/{booking_id}', update_booking, methods=['PUT']),
+    Route('/api/bookings/{booking_id}', delete_booking, methods=['DELETE']),
+    Route('/api/admin/stats', get_admin_stats, methods=['GET']),
+    Route('/api/admin/analytics', get_admin_analytics, methods=['GET']),
+    Route('/api/admin/export', export_bookings, methods=['GET']),
+    Route('/api/metrics', metrics, methods=['GET']),
+    Route('/api/health', health_check, methods=['GET']),
+]
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Expiry sweeps and availability refreshes run on the WSGI app's thread, on the sync client
+    wsgi.expiry_worker.start()
+    wsgi.analytics_rollups.start()
+    yield
+
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'],
+                           expose_headers=['X-Next-Cursor', 'Retry-After'])],
+    lifespan=lifespan
+)
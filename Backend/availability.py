@@ -0,0 +1,239 @@
+"""
+Time-interval availability for parking slots.
+
+Each slot document carries a ``reservations`` array of ``{booking_id, start_at,
+end_at}`` entries for its active bookings; ``overlapping()`` builds the filter
+used to claim a window atomically in MongoDB. ``AvailabilityIndex`` mirrors
+those reservations in memory as per-(location, slot) sorted start/end arrays so
+"is this slot free for [start, end)" is a binary search.
+
+For suggestions every location's slots also get a bit in layout order, and a
+per-location bitmap marks the slots holding any reservation: the other slots
+are free for every window without a lookup, so ``suggest()`` only binary-searches
+reserved slots before ranking the free ones by distance from the preferred spot.
+Slots an admin closed (``closed: true``) have a bit in a second bitmap and are
+never free.
+"""
+
+import heapq
+import re
+import threading
+from bisect import bisect_left, bisect_right
+
+_SLOT_ID = re.compile(r'^F(\d+)-([A-Za-z]+)(\d+)$')
+
+# Cost of one step away from the preferred spot, per dimension
+DEFAULT_SUGGEST_COSTS = {'location': 100, 'floor': 10, 'row': 2, 'number': 1}
+
+
+def slot_coordinates(slot_id):
+    """(floor, row, number) for a layout slot id such as F1-A2 (rows A=0, B=1, ...), or None."""
+    match = _SLOT_ID.match(slot_id or '')
+    if not match:
+        return None
+    floor, row, number = match.groups()
+    row_index = 0
+    for letter in row.upper():
+        row_index = row_index * 26 + ord(letter) - ord('A') + 1
+    return int(floor), row_index - 1, int(number)
+
+
+def _layout_key(slot_id, floor):
+    coordinates = slot_coordinates(slot_id)
+    return (0, *coordinates) if coordinates else (1, floor, slot_id)
+
+
+def overlapping(start_dt, end_dt, exclude_booking_id=None):
+    """$elemMatch on reservations that intersect [start_dt, end_dt), optionally ignoring one booking."""
+    match = {'start_at': {'$lt': end_dt}, 'end_at': {'$gt': start_dt}}
+    if exclude_booking_id is not None:
+        match['booking_id'] = {'$ne': exclude_booking_id}
+    return {'$elemMatch': match}
+
+
+class AvailabilityIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # location -> {slot_id: floor}
+        self._slots = {}
+        # (location, slot_id) -> (starts, ends, booking_ids), sorted by start
+        self._intervals = {}
+        # location -> [(slot_id, floor, row, number)] in layout order; a slot's position is its bit
+        self._layout = {}
+        # location -> {slot_id: bit}
+        self._bits = {}
+        # location -> bitmap of slots with at least one reservation
+        self._reserved = {}
+        # location -> bitmap of slots closed by an admin
+        self._closed = {}
+
+    def load(self, slot_docs, location=None):
+        """Rebuild from slot documents (all locations, or just ``location``)."""
+        slots, intervals, closed = {}, {}, set()
+        for doc in slot_docs:
+            loc, slot_id = doc.get('location'), doc.get('slot_id')
+            slots.setdefault(loc, {})[slot_id] = doc.get('floor', 1)
+            if doc.get('closed'):
+                closed.add((loc, slot_id))
+            reservations = sorted(doc.get('reservations') or [], key=lambda r: r['start_at'])
+            intervals[(loc, slot_id)] = (
+                [r['start_at'] for r in reservations],
+                [r['end_at'] for r in reservations],
+                [r['booking_id'] for r in reservations],
+            )
+        for loc in slots:
+            slots[loc] = dict(sorted(slots[loc].items()))
+        layout, bits, reserved, closed = self._bitmaps(slots, intervals, closed)
+
+        with self._lock:
+            if location is None:
+                self._slots, self._intervals = slots, intervals
+                self._layout, self._bits, self._reserved, self._closed = layout, bits, reserved, closed
+            else:
+                self._slots[location] = slots.get(location, {})
+                self._intervals = {k: v for k, v in self._intervals.items() if k[0] != location}
+                self._intervals.update(intervals)
+                self._layout[location] = layout.get(location, [])
+                self._bits[location] = bits.get(location, {})
+                self._reserved[location] = reserved.get(location, 0)
+                self._closed[location] = closed.get(location, 0)
+
+    @staticmethod
+    def _bitmaps(slots, intervals, closed_slots):
+        layout, bits, reserved, closed = {}, {}, {}, {}
+        for loc, floors in slots.items():
+            ordered = sorted(floors.items(), key=lambda item: _layout_key(*item))
+            layout[loc] = []
+            bits[loc] = {}
+            reserved[loc] = 0
+            closed[loc] = 0
+            for bit, (slot_id, floor) in enumerate(ordered):
+                _, row, number = slot_coordinates(slot_id) or (floor, None, None)
+                layout[loc].append((slot_id, floor, row, number))
+                bits[loc][slot_id] = bit
+                if intervals.get((loc, slot_id), ([],))[0]:
+                    reserved[loc] |= 1 << bit
+                if (loc, slot_id) in closed_slots:
+                    closed[loc] |= 1 << bit
+        return layout, bits, reserved, closed
+
+    def _mark(self, location, slot_id, starts):
+        bit = self._bits.get(location, {}).get(slot_id)
+        if bit is None:
+            return
+        if starts:
+            self._reserved[location] |= 1 << bit
+        else:
+            self._reserved[location] &= ~(1 << bit)
+
+    def add(self, location, slot_id, start_dt, end_dt, booking_id):
+        with self._lock:
+            starts, ends, ids = self._intervals.setdefault((location, slot_id), ([], [], []))
+            i = bisect_right(starts, start_dt)
+            starts.insert(i, start_dt)
+            ends.insert(i, end_dt)
+            ids.insert(i, booking_id)
+            self._mark(location, slot_id, starts)
+
+    def remove(self, location, slot_id, booking_id):
+        with self._lock:
+            starts, ends, ids = self._intervals.get((location, slot_id), ([], [], []))
+            if booking_id in ids:
+                i = ids.index(booking_id)
+                del starts[i], ends[i], ids[i]
+                self._mark(location, slot_id, starts)
+
+    def _is_closed(self, location, slot_id):
+        bit = self._bits.get(location, {}).get(slot_id)
+        return bit is not None and bool(self._closed.get(location, 0) >> bit & 1)
+
+    def _is_free(self, location, slot_id, start_dt, end_dt):
+        if self._is_closed(location, slot_id):
+            return False
+        starts, ends, _ = self._intervals.get((location, slot_id), ([], [], []))
+        # Reservations never overlap, so ends are sorted too: only the last one
+        # starting before end_dt can reach into the window
+        i = bisect_left(starts, end_dt)
+        return i == 0 or ends[i - 1] <= start_dt
+
+    def is_free(self, location, slot_id, start_dt, end_dt):
+        with self._lock:
+            if slot_id not in self._slots.get(location, {}):
+                return False
+            return self._is_free(location, slot_id, start_dt, end_dt)
+
+    def slots(self, location, floor=None):
+        """All slot ids at ``location`` (optionally on ``floor``)."""
+        with self._lock:
+            return [
+                slot_id for slot_id, slot_floor in self._slots.get(location, {}).items()
+                if floor is None or slot_floor == floor
+            ]
+
+    def capacity(self, location=None, floor=None):
+        """Number of slots at ``location`` (all locations when None), optionally on ``floor``."""
+        with self._lock:
+            locations = [location] if location else list(self._slots)
+            return sum(
+                1 for loc in locations for slot_floor in self._slots.get(loc, {}).values()
+                if floor is None or slot_floor == floor
+            )
+
+    def free_slots(self, location, start_dt, end_dt, floor=None):
+        """Slot ids at ``location`` (optionally on ``floor``) with nothing booked in [start_dt, end_dt)."""
+        with self._lock:
+            return [
+                slot_id for slot_id, slot_floor in self._slots.get(location, {}).items()
+                if (floor is None or slot_floor == floor)
+                and self._is_free(location, slot_id, start_dt, end_dt)
+            ]
+
+    def _free_bitmap(self, location, start_dt, end_dt):
+        layout = self._layout.get(location, [])
+        closed = self._closed.get(location, 0)
+        reserved = self._reserved.get(location, 0) & ~closed
+        free = ((1 << len(layout)) - 1) & ~reserved & ~closed
+        # Only slots holding reservations need the interval check
+        while reserved:
+            low = reserved & -reserved
+            reserved ^= low
+            if self._is_free(location, layout[low.bit_length() - 1][0], start_dt, end_dt):
+                free |= low
+        return free
+
+    def suggest(self, locations, start_dt, end_dt, floor=None, near=None, limit=5, costs=None):
+        """
+        The ``limit`` cheapest free slots for [start_dt, end_dt) as (cost, location, slot_id, floor).
+        ``locations`` is the preferred location followed by the fallbacks in order; each step down that
+        list, each floor away from ``floor`` and each row/number away from ``near`` (a slot id) adds its cost.
+        """
+        costs = {**DEFAULT_SUGGEST_COSTS, **(costs or {})}
+        near_floor, near_row, near_number = slot_coordinates(near) or (None, None, None)
+        if floor is None:
+            floor = near_floor
+        best = []  # max-heap of (-cost, -order, entry) holding the cheapest ``limit`` entries
+        order = 0
+        with self._lock:
+            for rank, location in enumerate(locations):
+                base = rank * costs['location']
+                # Later locations only cost more: stop once they cannot beat what has been found
+                if len(best) == limit and base >= -best[0][0]:
+                    break
+                layout = self._layout.get(location, [])
+                free = self._free_bitmap(location, start_dt, end_dt)
+                while free:
+                    low = free & -free
+                    free ^= low
+                    slot_id, slot_floor, row, number = layout[low.bit_length() - 1]
+                    cost = base
+                    if floor is not None:
+                        cost += abs(slot_floor - floor) * costs['floor']
+                    if near_row is not None and row is not None:
+                        cost += abs(row - near_row) * costs['row'] + abs(number - near_number) * costs['number']
+                    order += 1
+                    entry = (-cost, -order, (cost, location, slot_id, slot_floor))
+                    if len(best) < limit:
+                        heapq.heappush(best, entry)
+                    elif entry > best[0]:
+                        heapq.heapreplace(best, entry)
+        return [entry for _, _, entry in sorted(best, reverse=True)]
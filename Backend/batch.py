@@ -0,0 +1,124 @@
+"""
+Validation for the batch admin endpoints and slot runs for fleet bookings.
+
+``parse_slot_operation`` and ``parse_booking_operation`` check one item of a
+POST /api/admin/slots:batch or /api/bookings:batch body and raise ValueError
+with the message reported for that item; valid items are applied together in
+one bulk_write. ``slot_update`` turns an admin's ``status``/``closed`` change
+into the ``closed`` flag: a slot's status is otherwise derived from its bookings.
+``contiguous_runs`` walks a floor's slots in layout order (row, then number) to
+find neighbouring slots for POST /api/bookings/fleet.
+"""
+
+from bson import ObjectId
+
+from availability import slot_coordinates
+
+# Slot identity and reservations are maintained by the booking routes only
+LOCKED_SLOT_FIELDS = ('_id', 'slot_id', 'location', 'floor', 'reservations')
+
+BOOKING_OPERATIONS = ('cancel', 'delete', 'update')
+
+# Fields a batch 'update' may change; windows and status go through cancel or PUT /api/bookings/<id>
+EDITABLE_BOOKING_FIELDS = ('customer_name', 'vehicle_number', 'amount')
+
+
+def operations(data, max_operations):
+    """The ``operations`` list of a batch body."""
+    items = (data or {}).get('operations')
+    if not isinstance(items, list) or not items:
+        raise ValueError('operations must be a non-empty list')
+    if len(items) > max_operations:
+        raise ValueError(f'At most {max_operations} operations per batch')
+    return items
+
+
+def parse_slot_operation(item):
+    """(filter, $set, many) for one slot item: a slot by location + slot_id, or a whole floor by location + floor."""
+    if not isinstance(item, dict):
+        raise ValueError('Operation must be an object')
+    location = item.get('location')
+    if not isinstance(location, str) or not location:
+        raise ValueError('location is required')
+    update = item.get('update')
+    if not isinstance(update, dict) or not update:
+        raise ValueError('update must be a non-empty object')
+    locked = sorted(set(update) & set(LOCKED_SLOT_FIELDS))
+    if locked:
+        raise ValueError(f"Cannot change {', '.join(locked)}")
+    update = slot_update(update)
+
+    if item.get('slot_id') is not None:
+        return {'location': location, 'slot_id': str(item['slot_id'])}, update, False
+    if isinstance(item.get('floor'), int) and not isinstance(item.get('floor'), bool):
+        return {'location': location, 'floor': item['floor']}, update, True
+    raise ValueError('slot_id or floor is required')
+
+
+def slot_update(update):
+    """
+    $set for an admin slot update. ``closed: true`` closes the slot to bookings, as does a status other than
+    available (e.g. ``"maintenance"``, shown as the closed slot's status); ``closed: false`` or
+    ``status: "available"`` reopens it. Booked/available itself is left to reconciliation.
+    """
+    update = dict(update)
+    status = update.pop('status', None)
+    if status is not None:
+        if not isinstance(status, str) or not status or status == 'booked':
+            raise ValueError('status must be available or a reason the slot is closed')
+        update.setdefault('closed', status != 'available')
+    if 'closed' in update:
+        if not isinstance(update['closed'], bool):
+            raise ValueError('closed must be true or false')
+        if update['closed']:
+            update.update(status=status if status not in (None, 'available') else 'closed', booked_by=None)
+    return update
+
+
+def parse_booking_operation(item):
+    """(op, booking ObjectId, fields) for one booking item."""
+    if not isinstance(item, dict):
+        raise ValueError('Operation must be an object')
+    op = item.get('op')
+    if op not in BOOKING_OPERATIONS:
+        raise ValueError(f"op must be one of {', '.join(BOOKING_OPERATIONS)}")
+    booking_id = item.get('booking_id')
+    # ObjectId(None) would make a new id instead of rejecting a missing one
+    if not isinstance(booking_id, str) or not ObjectId.is_valid(booking_id):
+        raise ValueError('Invalid booking_id')
+    booking_id = ObjectId(booking_id)
+
+    fields = {}
+    if op == 'update':
+        fields = item.get('fields')
+        if not isinstance(fields, dict) or not fields:
+            raise ValueError('fields must be a non-empty object')
+        other = sorted(set(fields) - set(EDITABLE_BOOKING_FIELDS))
+        if other:
+            raise ValueError(f"Cannot change {', '.join(other)} in a batch")
+    return op, booking_id, fields
+
+
+def slot_order(slot_id):
+    """Sort key placing F1-A2 before F1-A10 and row A before row B."""
+    coordinates = slot_coordinates(slot_id)
+    return (0, *coordinates) if coordinates else (1, slot_id)
+
+
+def contiguous_runs(slot_ids, free, count):
+    """Runs of ``count`` neighbouring slot ids (same floor and row, consecutive numbers) that are all in ``free``."""
+    run = []
+    previous = None
+    for slot_id in sorted(slot_ids, key=slot_order):
+        coordinates = slot_coordinates(slot_id)
+        # A new row or floor, a gap in the numbering or an id outside the layout breaks the run
+        if coordinates is None or previous is None or coordinates[:2] != previous[:2] \
+                or coordinates[2] != previous[2] + 1:
+            run = []
+        previous = coordinates
+        if coordinates is not None and slot_id in free:
+            run.append(slot_id)
+            if len(run) >= count:
+                yield run[-count:]
+        else:
+            run = []
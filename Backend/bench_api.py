@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+API benchmark harness
+Seeds a configurable parking layout and booking history, drives the hot
+endpoints of the Flask app with concurrent clients, and reports throughput,
+p50/p95/p99 latency and MongoDB operations per request for each.
+
+    python bench_api.py --mongomock                                   # in-memory stand-in
+    python bench_api.py --locations 50 --bookings 200000 --clients 32 # throwaway db on MONGODB_URI
+    python bench_api.py --endpoints slots create_booking --requests 1000 --mongomock
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+
+class OpCounter:
+    """Counts MongoDB operations issued while an endpoint is being driven"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(self):
+        with self._lock:
+            self.count += 1
+
+    def install_command_listener(self):
+        from pymongo import monitoring
+        counter = self
+
+        class Listener(monitoring.CommandListener):
+            def started(self, event):
+                # Cursor continuation batches are part of the same operation
+                if event.command_name != 'getMore':
+                    counter.add()
+
+            def succeeded(self, event):
+                pass
+
+            def failed(self, event):
+                pass
+
+        monitoring.register(Listener())
+
+    def install_mongomock(self):
+        """mongomock emits no command events: count the outermost Collection calls instead"""
+        from mongomock.collection import Collection
+        counter = self
+        depth = threading.local()
+
+        def counted(method):
+            def wrapper(*args, **kwargs):
+                depth.value = getattr(depth, 'value', 0) + 1
+                try:
+                    if depth.value == 1:
+                        counter.add()
+                    return method(*args, **kwargs)
+                finally:
+                    depth.value -= 1
+            return wrapper
+
+        for name in ('find', 'find_one', 'insert_one', 'insert_many', 'update_one', 'update_many',
+                     'delete_one', 'delete_many', 'replace_one', 'aggregate', 'bulk_write',
+                     'count_documents', 'find_one_and_update', 'distinct'):
+            setattr(Collection, name, counted(getattr(Collection, name)))
+
+
+def load_app(args, counter):
+    """Import the Flask app against a throwaway database seeded with the requested layout"""
+    layout = {
+        'locations': [f'Location{i:03d}' for i in range(args.locations)],
+        'floors': list(range(1, args.floors + 1)),
+        'rows': [chr(ord('A') + i) for i in range(args.rows)],
+        'numbers': [str(i) for i in range(1, args.numbers + 1)],
+    }
+    layout_file = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    json.dump(layout, layout_file)
+    layout_file.close()
+    os.environ['PARKING_LAYOUT_FILE'] = layout_file.name
+    os.environ['EXPIRY_TICK_SECONDS'] = '0'
+    os.environ['RATE_LIMITING'] = 'false'
+    # Never the configured DATABASE_NAME: the benchmark writes bookings and drops its database
+    os.environ['DATABASE_NAME'] = args.database
+
+    if args.mongomock:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("mongomock is not installed (pip install mongomock)")
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+        os.environ.setdefault('MONGODB_URI', 'mongodb://localhost:27017/')
+        counter.install_mongomock()
+    else:
+        os.environ.setdefault('MONGODB_URI', 'mongodb://localhost:27017/')
+        counter.install_command_listener()
+
+    import app as app_module
+    os.unlink(layout_file.name)
+    return app_module, layout
+
+
+def seed_bookings(app_module, layout, total, customer_id):
+    """Insert booking history: mostly completed bookings, plus active future ones holding reservations"""
+    slots = [(loc, floor, f'F{floor}-{row}{num}')
+             for loc in layout['locations'] for floor in layout['floors']
+             for row in layout['rows'] for num in layout['numbers']]
+    past = datetime.utcnow() - timedelta(days=30)
+    future = datetime.utcnow() + timedelta(days=30)
+    batch = []
+    for i in range(total):
+        location, floor, slot_id = slots[i % len(slots)]
+        active = i % 5 == 0
+        # Active bookings take consecutive hours per slot so none of them overlap
+        start = (future if active else past) + timedelta(hours=i // len(slots))
+        batch.append({
+            'user_id': customer_id,
+            'customer_name': f'Bench {i}',
+            'vehicle_number': f'BN{i:06d}',
+            'slot': slot_id,
+            'location': location,
+            'floor': floor,
+            'date': start.strftime('%Y-%m-%d'),
+            'time': start.strftime('%H:%M'),
+            'duration': 1,
+            'amount': 20,
+            'status': 'active' if active else 'completed',
+            'start_at': start,
+            'end_at': start + timedelta(hours=1),
+            'created_at': start - timedelta(days=1),
+        })
+        if len(batch) == 10000:
+            app_module.bookings_collection.insert_many(batch)
+            batch = []
+    if batch:
+        app_module.bookings_collection.insert_many(batch)
+
+    # Rebuild slot reservations/statuses and derived state from the seeded bookings
+    app_module.sync_slot_statuses()
+    app_module._refresh_availability()
+    app_module._slots_changed()
+    if app_module.Config.STATS_MATERIALIZED:
+        app_module.stats_store.rebuild()
+
+
+def endpoints(layout, requests):
+    """name -> (number of requests, function(i) returning (method, path, json body, role))"""
+    locations = layout['locations']
+    floors = layout['floors']
+    # Windows far in the future, one hour apart, so created bookings never collide
+    base = datetime(2100, 1, 1)
+
+    def slots(i):
+        return 'GET', f'/api/parking-slots?location={random.choice(locations)}&floor={random.choice(floors)}', None, None
+
+    def availability(i):
+        day = (base + timedelta(days=i % 365)).strftime('%Y-%m-%d')
+        return 'GET', f'/api/availability?location={random.choice(locations)}&start={day}T09:00&end={day}T11:00', \
+            None, None
+
+    def create_booking(i):
+        start = base + timedelta(hours=i)
+        floor = random.choice(floors)
+        return 'POST', '/api/bookings', {
+            'slot': f"F{floor}-{random.choice(layout['rows'])}{random.choice(layout['numbers'])}",
+            'location': random.choice(locations), 'name': f'Load {i}', 'vehicle': f'LD{i:06d}',
+            'date': start.strftime('%Y-%m-%d'), 'time': start.strftime('%H:%M'), 'duration': 1, 'amount': 20
+        }, 'customer'
+
+    def bookings_page(i):
+        return 'GET', '/api/bookings?limit=100', None, 'customer'
+
+    def admin_stats(i):
+        return 'GET', '/api/admin/stats', None, 'admin'
+
+    def export(i):
+        return 'GET', '/api/admin/export?format=ndjson', None, 'admin'
+
+    heavy = max(1, requests // 10)
+    return {
+        'slots': (requests, slots),
+        'availability': (requests, availability),
+        'create_booking': (requests, create_booking),
+        'bookings_page': (requests, bookings_page),
+        'admin_stats': (heavy, admin_stats),
+        'export': (heavy, export),
+    }
+
+
+def check_export(flask_app, tokens):
+    """Problems with the NDJSON export body: every line must hold one JSON document, with none left blank"""
+    response = flask_app.test_client().get('/api/admin/export?format=ndjson',
+                                           headers={'Authorization': f"Bearer {tokens['admin']}"})
+    if response.status_code != 200:
+        return [f'status {response.status_code}']
+    body = response.get_data()
+    problems = [] if body.endswith(b'\n') else ['body does not end with a newline']
+    for number, line in enumerate(body.split(b'\n')[:-1], 1):
+        if not line.strip():
+            problems.append(f'blank line {number}')
+            continue
+        try:
+            json.loads(line)
+        except ValueError:
+            problems.append(f'line {number} is not JSON')
+    return problems
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def drive(flask_app, tokens, count, make_request, clients, counter):
+    def attempt(i):
+        method, path, body, role = make_request(i)
+        headers = {'Authorization': f'Bearer {tokens[role]}'} if role else {}
+        client = flask_app.test_client()
+        started = time.perf_counter()
+        response = client.open(path, method=method, json=body, headers=headers)
+        # Consume streamed bodies so the full response is timed
+        response.get_data()
+        return response.status_code, time.perf_counter() - started
+
+    ops_before = counter.count
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(attempt, range(count)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for _, latency in results)
+    errors = sum(1 for status, _ in results if status >= 500 or status in (401, 403, 422))
+    return {
+        'requests': count,
+        'rps': count / elapsed,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'ops': (counter.count - ops_before) / count,
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the booking API's hot endpoints")
+    parser.add_argument('--locations', type=int, default=5)
+    parser.add_argument('--floors', type=int, default=2)
+    parser.add_argument('--rows', type=int, default=4, help="rows per floor (A, B, ...)")
+    parser.add_argument('--numbers', type=int, default=3, help="slots per row")
+    parser.add_argument('--bookings', type=int, default=5000, help="booking history to seed")
+    parser.add_argument('--requests', type=int, default=300, help="requests per endpoint (stats/export get a tenth)")
+    parser.add_argument('--clients', type=int, default=16, help="concurrent client threads")
+    parser.add_argument('--endpoints', nargs='+', help="subset of endpoints to run")
+    parser.add_argument('--mongomock', action='store_true', help="use an in-memory mongomock database")
+    parser.add_argument('--database', default=f'parking_bench_{os.getpid()}', help="database to seed")
+    parser.add_argument('--keep', action='store_true', help="keep the seeded database afterwards")
+    args = parser.parse_args()
+
+    counter = OpCounter()
+    app_module, layout = load_app(args, counter)
+    flask_app = app_module.app
+
+    try:
+        seed_started = time.perf_counter()
+        customer = app_module.users_collection.find_one({'username': 'customer'})
+        seed_bookings(app_module, layout, args.bookings, str(customer['_id']))
+        seed_seconds = time.perf_counter() - seed_started
+
+        tokens = {}
+        for role, password in (('admin', 'admin123'), ('customer', 'customer123')):
+            response = flask_app.test_client().post('/api/auth/login', json={'username': role, 'password': password})
+            tokens[role] = response.get_json()['access_token']
+
+        selected = endpoints(layout, args.requests)
+        names = args.endpoints or list(selected)
+        unknown = set(names) - set(selected)
+        if unknown:
+            sys.exit(f"unknown endpoints: {', '.join(sorted(unknown))} (choose from {', '.join(selected)})")
+
+        if args.mongomock and 'admin_stats' in names:
+            # /api/admin/stats aggregates with $unionWith, which mongomock does not implement
+            names = [name for name in names if name != 'admin_stats']
+            print("ℹ️  admin_stats skipped: mongomock has no $unionWith (run it against MONGODB_URI)")
+
+        slot_count = len(layout['locations']) * len(layout['floors']) * len(layout['rows']) * len(layout['numbers'])
+        print(f"🚗 {len(layout['locations'])} locations, {slot_count} slots, {args.bookings} bookings "
+              f"seeded in {seed_seconds:.1f}s; {args.clients} concurrent clients")
+        print(f"   {'endpoint':15} {'requests':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'db ops/req':>10} {'errors':>6}")
+        if 'export' in names:
+            problems = check_export(flask_app, tokens)
+            if problems:
+                sys.exit(f"❌ NDJSON export is malformed: {', '.join(problems[:5])}")
+        for name in names:
+            count, make_request = selected[name]
+            r = drive(flask_app, tokens, count, make_request, args.clients, counter)
+            print(f"   {name:15} {r['requests']:8d} {r['rps']:9.1f} {r['p50'] * 1000:8.1f} {r['p95'] * 1000:8.1f} "
+                  f"{r['p99'] * 1000:8.1f} {r['ops']:10.1f} {r['errors']:6d}")
+    finally:
+        if not args.keep and not args.mongomock:
+            app_module.mongo.client().drop_database(app_module.DATABASE_NAME)
+
+
+if __name__ == '__main__':
+    main()
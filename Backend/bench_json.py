@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+JSON serialization micro-benchmark
+Times encoding a 10k-slot listing and a 100k-booking list the way the routes
+used to (ids converted to str per document, stdlib encoder via Flask's default
+provider) against FastJSONProvider with the stdlib encoder and with orjson.
+No database is needed: the documents are generated in memory.
+
+    python bench_json.py
+    python bench_json.py --slots 50000 --bookings 200000 --repeat 5
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from serialization import FastJSONProvider, orjson  # noqa: E402
+
+
+def make_slots(count):
+    created = datetime(2024, 1, 1)
+    return [{
+        '_id': ObjectId(),
+        'slot_id': f"F{i % 2 + 1}-{'ABCD'[i // 2 % 4]}{i // 8 % 12 + 1}",
+        'location': f'Location{i // 96:03d}',
+        'floor': i % 2 + 1,
+        'status': 'booked' if i % 3 == 0 else 'available',
+        'booked_by': 'Bench' if i % 3 == 0 else None,
+        'created_at': created,
+    } for i in range(count)]
+
+
+def make_bookings(count):
+    base = datetime(2024, 1, 1)
+    user_id = str(ObjectId())
+    bookings = []
+    for i in range(count):
+        start = base + timedelta(hours=i)
+        bookings.append({
+            '_id': ObjectId(),
+            'user_id': user_id,
+            'customer_name': f'Bench {i}',
+            'vehicle_number': f'BN{i:06d}',
+            'slot': f"F1-A{i % 3 + 1}",
+            'location': 'CityMall',
+            'floor': 1,
+            'date': start.strftime('%Y-%m-%d'),
+            'time': start.strftime('%H:%M'),
+            'duration': 1,
+            'amount': 20,
+            'status': 'completed',
+            'start_at': start,
+            'end_at': start + timedelta(hours=1),
+            'created_at': start - timedelta(days=1),
+        })
+    return bookings
+
+
+def format_window(doc):
+    """app._serialize_booking (documents are copied first so every run starts from datetimes)."""
+    for field in ('start_at', 'end_at'):
+        if isinstance(doc.get(field), datetime):
+            doc[field] = doc[field].isoformat(' ', 'minutes')
+    return doc
+
+
+def legacy_body(app, docs):
+    """Previous route code: str ids and strftime windows per document, then Flask's default stdlib provider."""
+    converted = []
+    for doc in docs:
+        doc = dict(doc)
+        for field in ('start_at', 'end_at'):
+            if isinstance(doc.get(field), datetime):
+                doc[field] = doc[field].strftime("%Y-%m-%d %H:%M")
+        doc['_id'] = str(doc['_id'])
+        if 'user_id' in doc:
+            doc['user_id'] = str(doc['user_id'])
+        converted.append(doc)
+    return app.json.dumps(converted).encode('utf-8')
+
+
+def provider_body(app, docs):
+    return app.json.dumps_bytes([format_window(dict(doc)) for doc in docs])
+
+
+def drop_created_at(docs):
+    return [{k: v for k, v in doc.items() if k != 'created_at'} for doc in docs]
+
+
+def best_of(repeat, fn):
+    timings = []
+    body = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON serialization paths for large responses")
+    parser.add_argument('--slots', type=int, default=10000)
+    parser.add_argument('--bookings', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3, help="runs per case (best is reported)")
+    args = parser.parse_args()
+
+    legacy_app = Flask('legacy')
+    legacy_app.json = DefaultJSONProvider(legacy_app)
+    stdlib_app = Flask('stdlib')
+    stdlib_app.json = FastJSONProvider(stdlib_app)
+    stdlib_app.json.encoder = 'stdlib'
+    fast_app = Flask('fast')
+    fast_app.json = FastJSONProvider(fast_app)
+
+    slots = make_slots(args.slots)
+    bookings = make_bookings(args.bookings)
+    cases = [
+        (f'{args.slots} slots', slots),
+        (f'{args.slots} slots, no created_at', drop_created_at(slots)),
+        (f'{args.bookings} bookings', bookings),
+    ]
+    paths = [
+        ('legacy (str ids + stdlib)', lambda docs: legacy_body(legacy_app, docs)),
+        ('provider, stdlib', lambda docs: provider_body(stdlib_app, docs)),
+    ]
+    if orjson is not None:
+        paths.append(('provider, orjson', lambda docs: provider_body(fast_app, docs)))
+    else:
+        print("orjson is not installed (pip install orjson); skipping the orjson path")
+
+    print(f"🚗 best of {args.repeat} runs")
+    print(f"   {'payload':32} {'path':28} {'ms':>9} {'MB':>7}")
+    for case, docs in cases:
+        for path, encode in paths:
+            seconds, size = best_of(args.repeat, lambda: encode(docs))
+            print(f"   {case:32} {path:28} {seconds * 1000:9.1f} {size / 1e6:7.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Location affinity scaling benchmark
+Starts one worker process per location, each pinned to it with LOCATIONS_SERVED,
+fires concurrent POST /api/bookings at every worker at once, and reports the
+aggregate booking throughput as locations (and their workers) are added.
+
+    python bench_locations.py --mongomock                              # in-memory stand-in
+    python bench_locations.py --locations 1 2 4 8 --requests 500       # throwaway db on MONGODB_URI
+
+With --mongomock every worker has its own in-memory database, so the figures only
+show how far pinned workers scale on this machine. Against MongoDB all workers
+share the database (shard it by location to spread the writes as well).
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+
+def load_app(location, layout_path, database, use_mongomock):
+    """Import the Flask app in this worker process, pinned to ``location``"""
+    os.environ['PARKING_LAYOUT_FILE'] = layout_path
+    os.environ['LOCATIONS_SERVED'] = location
+    os.environ['DATABASE_NAME'] = database
+    os.environ['EXPIRY_TICK_SECONDS'] = '0'
+    os.environ['RATE_LIMITING'] = 'false'
+    # Hash inline: password hashing is not what is measured here
+    os.environ['PASSWORD_HASH_WORKERS'] = '0'
+    os.environ.setdefault('MONGODB_URI', 'mongodb://localhost:27017/')
+    if use_mongomock:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+    import app as app_module
+    return app_module
+
+
+def run_worker(location, layout_path, args, database, barrier, results):
+    """One pinned worker: book ``args.requests`` windows at its location once every worker is ready"""
+    app_module = load_app(location, layout_path, database, args.mongomock)
+    flask_app = app_module.app
+    login = flask_app.test_client().post(
+        '/api/auth/login', json={'username': 'customer', 'password': 'customer123'}
+    )
+    headers = {'Authorization': f"Bearer {login.get_json()['access_token']}"}
+    slots = app_module.availability_index.slots(location)
+    # Far-future windows, one hour apart per slot, so no two requests collide
+    base = datetime(2100, 1, 1)
+
+    def attempt(i):
+        start = base + timedelta(hours=i // len(slots))
+        response = flask_app.test_client().post('/api/bookings', headers=headers, json={
+            'slot': slots[i % len(slots)],
+            'location': location,
+            'name': f'Bench {i}',
+            'vehicle': f'BL{i:06d}',
+            'date': start.strftime('%Y-%m-%d'),
+            'time': start.strftime('%H:%M'),
+            'duration': 1
+        })
+        return response.status_code
+
+    # A pinned worker sends every other location back to the proxy
+    probe = flask_app.test_client().get(f'/api/parking-slots?location={location}-elsewhere').status_code
+
+    barrier.wait()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        statuses = list(pool.map(attempt, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    results.put({
+        'location': location,
+        'created': statuses.count(201),
+        'errors': len(statuses) - statuses.count(201),
+        'seconds': elapsed,
+        'indexed_slots': app_module.availability_index.capacity(),
+        'misdirected': probe == 421,
+    })
+
+
+def run(count, layout, layout_path, args, context):
+    """Run ``count`` pinned workers together; returns (wall seconds, per-worker results)"""
+    database = f'{args.database}_{count}'
+    locations = layout['locations'][:count]
+    # Every worker plus this process, so timing starts once all of them have booted
+    barrier = context.Barrier(count + 1)
+    results = context.Queue()
+    workers = [
+        context.Process(target=run_worker, args=(location, layout_path, args, database, barrier, results))
+        for location in locations
+    ]
+    for worker in workers:
+        worker.start()
+    barrier.wait(timeout=args.boot_timeout)
+    started = time.perf_counter()
+    outcomes = [results.get() for _ in workers]
+    wall = time.perf_counter() - started
+    for worker in workers:
+        worker.join()
+    if not args.mongomock and not args.keep:
+        import pymongo
+        pymongo.MongoClient(os.environ.get('MONGODB_URI', 'mongodb://localhost:27017/')).drop_database(database)
+    return wall, outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Booking throughput as pinned per-location workers are added")
+    parser.add_argument('--locations', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="location counts to run (one worker process each)")
+    parser.add_argument('--requests', type=int, default=300, help="bookings per location")
+    parser.add_argument('--clients', type=int, default=8, help="concurrent client threads per worker")
+    parser.add_argument('--floors', type=int, default=2)
+    parser.add_argument('--rows', type=int, default=4, help="rows per floor (A, B, ...)")
+    parser.add_argument('--numbers', type=int, default=3, help="slots per row")
+    parser.add_argument('--mongomock', action='store_true', help="use an in-memory mongomock database per worker")
+    parser.add_argument('--database', default=f'parking_bench_locations_{os.getpid()}',
+                        help="database name prefix (one database per location count)")
+    parser.add_argument('--keep', action='store_true', help="keep the seeded databases afterwards")
+    parser.add_argument('--boot-timeout', type=float, default=120, help="seconds to wait for workers to boot")
+    args = parser.parse_args()
+
+    if args.mongomock:
+        try:
+            import mongomock  # noqa: F401
+        except ImportError:
+            sys.exit("mongomock is not installed (pip install mongomock)")
+
+    layout = {
+        'locations': [f'Location{i:03d}' for i in range(max(args.locations))],
+        'floors': list(range(1, args.floors + 1)),
+        'rows': [chr(ord('A') + i) for i in range(args.rows)],
+        'numbers': [str(i) for i in range(1, args.numbers + 1)],
+    }
+    layout_file = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    json.dump(layout, layout_file)
+    layout_file.close()
+    # Spawned workers import the app fresh, with their own LOCATIONS_SERVED
+    context = multiprocessing.get_context('spawn')
+
+    print(f"🚗 {args.requests} bookings per location, {args.clients} clients per pinned worker, "
+          f"{args.floors * args.rows * args.numbers} slots per location"
+          f"{' (mongomock: one database per worker)' if args.mongomock else ''}")
+    print(f"   {'locations':>9} {'created':>8} {'errors':>6} {'seconds':>8} {'bookings/s':>10} "
+          f"{'per worker':>10} {'scaling':>7}")
+    baseline = None
+    try:
+        for count in sorted(set(args.locations)):
+            wall, outcomes = run(count, layout, layout_file.name, args, context)
+            created = sum(o['created'] for o in outcomes)
+            errors = sum(o['errors'] for o in outcomes)
+            rate = created / wall
+            baseline = baseline or rate / count
+            print(f"   {count:9d} {created:8d} {errors:6d} {wall:8.2f} {rate:10.1f} {rate / count:10.1f} "
+                  f"{rate / baseline:6.2f}x")
+            # Each worker should index only its own location and turn the others away
+            stray = [o['location'] for o in outcomes if not o['misdirected']
+                     or o['indexed_slots'] != args.floors * args.rows * args.numbers]
+            if stray:
+                print(f"   ❌ not pinned to their location: {', '.join(stray)}")
+    finally:
+        os.unlink(layout_file.name)
+
+
+if __name__ == '__main__':
+    main()
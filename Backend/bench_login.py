@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Login throughput benchmark
+Fires parallel POST /api/auth/login requests and reports throughput and latency
+for the configured password hashing scheme, cost and pool size.
+
+    python bench_login.py --requests 200 --threads 16                                   # uses MONGODB_URI
+    python bench_login.py --requests 200 --threads 16 --mongomock                       # in-memory stand-in
+    python bench_login.py --scheme pbkdf2 --cost 600000 --hash-workers 0 --mongomock   # inline hashing
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def load_app(use_mongomock):
+    """Import the Flask app, optionally against an in-memory mongomock client"""
+    if use_mongomock:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("mongomock is not installed (pip install mongomock)")
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+        os.environ.setdefault('MONGODB_URI', 'mongodb://localhost:27017/')
+    os.environ.setdefault('EXPIRY_TICK_SECONDS', '0')
+    os.environ.setdefault('RATE_LIMITING', 'false')
+    import app as app_module
+    return app_module
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel login throughput benchmark")
+    parser.add_argument('--requests', type=int, default=200, help="number of logins")
+    parser.add_argument('--threads', type=int, default=16, help="concurrent client threads")
+    parser.add_argument('--scheme', help="PASSWORD_HASH_SCHEME (bcrypt, pbkdf2, scrypt)")
+    parser.add_argument('--cost', type=int, help="PASSWORD_HASH_COST")
+    parser.add_argument('--hash-workers', type=int, help="PASSWORD_HASH_WORKERS (0 hashes on the request thread)")
+    parser.add_argument('--mongomock', action='store_true', help="use an in-memory mongomock database")
+    args = parser.parse_args()
+
+    for name, value in (('PASSWORD_HASH_SCHEME', args.scheme), ('PASSWORD_HASH_COST', args.cost),
+                        ('PASSWORD_HASH_WORKERS', args.hash_workers)):
+        if value is not None:
+            os.environ[name] = str(value)
+
+    app_module = load_app(args.mongomock)
+    flask_app = app_module.app
+    hasher = app_module.password_hasher
+
+    # A user whose hash matches the configured scheme, so no login triggers a rehash
+    username = 'bench-login'
+    app_module.users_collection.update_one(
+        {'username': username},
+        {'$set': {'password': hasher.hash('bench-password'), 'role': 'customer'}},
+        upsert=True
+    )
+
+    def attempt(_):
+        started = time.perf_counter()
+        response = flask_app.test_client().post(
+            '/api/auth/login', json={'username': username, 'password': 'bench-password'}
+        )
+        return response.status_code, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(attempt, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    statuses = [status for status, _ in results]
+    latencies = sorted(latency for _, latency in results)
+
+    print(f"🔑 {args.requests} logins with {args.threads} threads, "
+          f"{hasher.scheme} cost {hasher.cost}, {hasher.workers} hash workers")
+    print(f"   200 ok: {statuses.count(200)}  503 busy: {statuses.count(503)}  "
+          f"other: {len(statuses) - statuses.count(200) - statuses.count(503)}")
+    print(f"   throughput: {args.requests / elapsed:.1f} logins/s  "
+          f"p50: {latencies[len(latencies) // 2] * 1000:.1f} ms  "
+          f"p99: {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms")
+
+    app_module.users_collection.delete_one({'username': username})
+
+
+if __name__ == '__main__':
+    main()
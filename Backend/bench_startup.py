@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Worker cold-start benchmark
+Times what every gunicorn worker does on boot (importing app, which runs
+initialize_data) against a fresh database and again once it is initialized.
+
+    python bench_startup.py --runs 5              # separate processes against MONGODB_URI
+    python bench_startup.py --runs 5 --mongomock  # in-memory stand-in, one process
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+
+def child():
+    """Import the app once and print the boot time and number of MongoDB commands as JSON"""
+    from pymongo import monitoring
+
+    class CommandCounter(monitoring.CommandListener):
+        count = 0
+
+        def started(self, event):
+            CommandCounter.count += 1
+
+        def succeeded(self, event):
+            pass
+
+        def failed(self, event):
+            pass
+
+    monitoring.register(CommandCounter())
+    started = time.perf_counter()
+    import app  # noqa: F401
+    print(json.dumps({'seconds': time.perf_counter() - started, 'commands': CommandCounter.count}))
+
+
+def run_processes(runs):
+    database = f"parking_bench_{uuid.uuid4().hex[:8]}"
+    env = dict(os.environ, DATABASE_NAME=database)
+    results = []
+    try:
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child'],
+                env=env, check=True, capture_output=True, text=True,
+                cwd=os.path.dirname(os.path.abspath(__file__))
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+    finally:
+        from pymongo import MongoClient
+        MongoClient(os.environ.get('MONGODB_URI') or 'mongodb://localhost:27017/').drop_database(database)
+    return results
+
+
+def run_mongomock(runs):
+    """mongomock has no command monitoring and no cross-process state: time the boots in-process"""
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("mongomock is not installed (pip install mongomock)")
+    import pymongo
+    pymongo.MongoClient = mongomock.MongoClient
+    os.environ.setdefault('MONGODB_URI', 'mongodb://localhost:27017/')
+
+    started = time.perf_counter()
+    import app as app_module
+    results = [{'seconds': time.perf_counter() - started, 'commands': None}]
+    for _ in range(runs - 1):
+        started = time.perf_counter()
+        app_module.initialize_data()
+        results.append({'seconds': time.perf_counter() - started, 'commands': None})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-worker cold-start benchmark")
+    parser.add_argument('--runs', type=int, default=5, help="boots to time (the first one sees an empty database)")
+    parser.add_argument('--mongomock', action='store_true', help="use an in-memory mongomock database")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    results = run_mongomock(args.runs) if args.mongomock else run_processes(max(args.runs, 1))
+
+    print(f"🚗 Worker boot times over {len(results)} runs")
+    for i, result in enumerate(results):
+        label = 'fresh database' if i == 0 else 'initialized  '
+        commands = f"  {result['commands']} commands" if result['commands'] is not None else ''
+        print(f"   #{i + 1} {label} {result['seconds'] * 1000:8.1f} ms{commands}")
+    warm = sorted(r['seconds'] for r in results[1:])
+    if warm:
+        print(f"   warm boot median: {warm[len(warm) // 2] * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Idempotent startup: schema versioning, location documents and parking slot seeding.
+
+A single ``{_id: 'schema'}`` document in the ``meta`` collection records which
+migrations have run and a fingerprint of the slot layout that was last seeded,
+so a worker booting against an up-to-date database does one point read instead
+of re-scanning every slot. Slots are seeded from a declarative layout with one
+unordered bulk of ``$setOnInsert`` upserts, which is safe to repeat and to run
+from several workers at once. Location documents (see locations.py) are seeded
+the same way, and slots are then seeded from every stored location.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from locations import LAYOUT_FIELDS, location_document
+
+SCHEMA_ID = 'schema'
+
+DUPLICATE_KEY = 11000
+
+
+def layout_slots(layout):
+    """
+    Yield (location, floor, slot_id) for a layout such as
+    ``{'locations': [...], 'floors': [1, 2], 'rows': ['A', 'B'], 'numbers': ['1', '2']}``.
+    A location may also be a dict with its own ``floors``/``rows``/``numbers``.
+    """
+    for entry in layout.get('locations', []):
+        if isinstance(entry, str):
+            entry = {'name': entry}
+        floors = entry.get('floors', layout.get('floors', [1]))
+        rows = entry.get('rows', layout.get('rows', []))
+        numbers = entry.get('numbers', layout.get('numbers', []))
+        for floor in floors:
+            for row in rows:
+                for num in numbers:
+                    yield entry['name'], int(floor), f'F{floor}-{row}{num}'
+
+
+def layout_fingerprint(layout):
+    return hashlib.md5(json.dumps(layout, sort_keys=True).encode()).hexdigest()
+
+
+def read_schema(meta):
+    """Return (version, layout fingerprint) recorded for this database."""
+    doc = meta.find_one({'_id': SCHEMA_ID}) or {}
+    return doc.get('version', 0), doc.get('layout')
+
+
+def record_schema(meta, version=None, layout=None):
+    update = {}
+    if version is not None:
+        # $max so a worker still on an older release never moves the version back
+        update['$max'] = {'version': version}
+    if layout is not None:
+        update['$set'] = {'layout': layout, 'updated_at': datetime.utcnow()}
+    if update:
+        meta.update_one({'_id': SCHEMA_ID}, update, upsert=True)
+
+
+def run_migrations(meta, migrations, logger=None):
+    """
+    Run the (version, fn) migrations newer than the recorded schema version, in order.
+    Each fn must be idempotent: workers booting together may both run it.
+    Returns the number of migrations applied.
+    """
+    current, _ = read_schema(meta)
+    applied = 0
+    for version, migrate in sorted(migrations, key=lambda m: m[0]):
+        if version <= current:
+            continue
+        if logger:
+            logger.info('Running schema migration %s (%s)', version, migrate.__name__)
+        migrate()
+        record_schema(meta, version=version)
+        applied += 1
+    return applied
+
+
+def _upsert_all(collection, ops):
+    """Apply upserts in one unordered bulk; returns how many documents were created."""
+    if not ops:
+        return 0
+    try:
+        return collection.bulk_write(ops, ordered=False).upserted_count
+    except BulkWriteError as e:
+        # Another worker inserted the same documents first (unique index)
+        if any(err.get('code') != DUPLICATE_KEY for err in e.details.get('writeErrors', [])):
+            raise
+        return e.details.get('nUpserted', 0)
+
+
+def seed_locations(locations, layout):
+    """
+    Upsert a document for every location in ``layout``; returns how many were created.
+    The layout's floors/rows/numbers and order replace the stored ones, while ``active``
+    and ``settings`` changed through the admin API are kept.
+    """
+    now = datetime.utcnow()
+    ops = []
+    for position, entry in enumerate(layout.get('locations', [])):
+        if isinstance(entry, str):
+            entry = {'name': entry}
+        doc = location_document(entry.get('name'), entry, defaults=layout)
+        ops.append(UpdateOne(
+            {'_id': doc['_id']},
+            {
+                '$set': {'name': doc['name'], **{field: doc[field] for field in LAYOUT_FIELDS},
+                         'position': position, 'updated_at': now},
+                '$setOnInsert': {'active': doc['active'], 'settings': doc['settings'], 'created_at': now},
+            },
+            upsert=True
+        ))
+    return _upsert_all(locations, ops)
+
+
+def stored_layout(locations):
+    """A layout (for layout_slots) of every stored location document."""
+    return {'locations': list(locations.find({}, {'name': 1, **{field: 1 for field in LAYOUT_FIELDS}}))}
+
+
+def seed_slots(parking_slots, layout):
+    """Insert any slot in ``layout`` that does not exist yet; returns how many were created."""
+    now = datetime.utcnow()
+    ops = [
+        UpdateOne(
+            {'location': location, 'slot_id': slot_id},
+            {'$setOnInsert': {
+                'floor': floor,
+                'status': 'available',
+                'booked_by': None,
+                'reservations': [],
+                'created_at': now,
+            }},
+            upsert=True
+        )
+        for location, floor, slot_id in layout_slots(layout)
+    ]
+    # The unique (location, slot_id) index makes concurrent seeding safe
+    return _upsert_all(parking_slots, ops)
+
+
+def ensure_seeded(meta, parking_slots, layout, locations=None):
+    """
+    Seed slots only when the layout differs from the one last recorded. Returns slots created.
+    With a ``locations`` collection the layout updates the location documents first and slots
+    are seeded from every stored location, including ones added through the admin API.
+    """
+    fingerprint = layout_fingerprint(layout)
+    _, seeded = read_schema(meta)
+    if seeded == fingerprint:
+        return 0
+    if locations is not None:
+        seed_locations(locations, layout)
+        layout = stored_layout(locations)
+    created = seed_slots(parking_slots, layout)
+    record_schema(meta, layout=fingerprint)
+    return created
@@ -0,0 +1,80 @@
+"""
+Response caching helpers.
+
+``SlotListingCache`` keeps serialized GET /api/parking-slots bodies per
+(location, floor, status) filter. Entries are tagged with a version counter
+stored in MongoDB (the ``SLOTS_VERSION_ID`` document in ``counters``) that every
+slot/booking write bumps, so all gunicorn workers see an invalidation from any
+of them with a single point lookup.
+
+``TTLCache`` is a small bounded LRU whose entries also expire after a fixed
+time, used for user documents looked up by authenticated requests.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+SLOTS_VERSION_ID = 'parking_slots'
+
+
+class SlotListingCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> (version, etag, body)
+        self._entries = OrderedDict()
+
+    def get(self, key, version):
+        """Return (etag, body) cached for ``key`` at ``version``, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def put(self, key, version, body):
+        etag = hashlib.md5(body).hexdigest()
+        with self._lock:
+            self._entries[key] = (version, etag, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return etag
+
+
+class TTLCache:
+    def __init__(self, max_entries=1024, ttl_seconds=60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # key -> (expires_at, value)
+        self._entries = OrderedDict()
+
+    def get(self, key, loader=None):
+        """Return the cached value, calling ``loader(key)`` on a miss (None results are not cached)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+        if loader is None:
+            return None
+        value = loader(key)
+        if value is not None:
+            self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
@@ -1,6 +1,25 @@
+import json
 import os
 from datetime import timedelta
 
+
+def _optional_int(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def _write_concern(value):
+    # w is a node count or a tag such as 'majority'
+    if not value:
+        return None
+    return int(value) if value.isdigit() else value
+
+
+def _load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-change-this-in-production'
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'your-jwt-secret-key-change-this-in-production'
@@ -9,9 +28,172 @@ class Config:
     # MongoDB configuration
     MONGODB_URI = os.environ.get('MONGODB_URI') or 'mongodb://localhost:27017/'
     DATABASE_NAME = os.environ.get('DATABASE_NAME') or 'parking_system'
+
+    # Connection pool per worker process (keep workers x MONGO_MAX_POOL_SIZE under the server's
+    # connection limit), timeouts, and the default read preference / write concern
+    MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE') or 50)
+    MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE') or 0)
+    MONGO_MAX_IDLE_TIME_MS = _optional_int('MONGO_MAX_IDLE_TIME_MS')
+    MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS') or 5000)
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS') or 5000)
+    MONGO_SOCKET_TIMEOUT_MS = _optional_int('MONGO_SOCKET_TIMEOUT_MS')
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = _optional_int('MONGO_WAIT_QUEUE_TIMEOUT_MS')
+    MONGO_READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE') or 'primary'
+    MONGO_WRITE_CONCERN = _write_concern(os.environ.get('MONGO_WRITE_CONCERN'))
+    MONGO_WRITE_CONCERN_TIMEOUT_MS = _optional_int('MONGO_WRITE_CONCERN_TIMEOUT_MS')
+
+    # Read preference for reporting reads that tolerate replication lag (admin stats and export),
+    # e.g. secondaryPreferred on a replica set, optionally bounded by maxStalenessSeconds (>= 90)
+    MONGO_READ_HEAVY_PREFERENCE = os.environ.get('MONGO_READ_HEAVY_PREFERENCE') or 'primary'
+    MONGO_MAX_STALENESS_SECONDS = _optional_int('MONGO_MAX_STALENESS_SECONDS')
     
     # CORS configuration
     CORS_ORIGINS = os.environ.get('CORS_ORIGINS') or ['http://localhost:3000', 'http://127.0.0.1:3000', 'file://']
+
+    # Seconds between background expiry sweeps of finished bookings (0 disables the worker)
+    EXPIRY_TICK_SECONDS = int(os.environ.get('EXPIRY_TICK_SECONDS') or 30)
+    # Completed/cancelled bookings move to bookings_archive this many days after they end (0 keeps them)
+    BOOKING_ARCHIVE_AFTER_DAYS = int(os.environ.get('BOOKING_ARCHIVE_AFTER_DAYS') or 90)
+    BOOKING_ARCHIVE_BATCH_SIZE = int(os.environ.get('BOOKING_ARCHIVE_BATCH_SIZE') or 1000)
+
+    # Number of (location, floor, status) slot listings kept serialized in memory
+    SLOT_CACHE_SIZE = int(os.environ.get('SLOT_CACHE_SIZE') or 256)
+
+    # Live slot stream: replay buffer size, keep-alive interval, and whether to
+    # feed it from a MongoDB change stream (replica sets only) instead of in-process writes
+    SLOT_STREAM_BACKLOG = int(os.environ.get('SLOT_STREAM_BACKLOG') or 1000)
+    SLOT_STREAM_HEARTBEAT_SECONDS = int(os.environ.get('SLOT_STREAM_HEARTBEAT_SECONDS') or 15)
+    # Open streams per WSGI worker (each holds a thread); further clients get 503 and poll instead
+    SLOT_STREAM_MAX_CLIENTS = int(os.environ.get('SLOT_STREAM_MAX_CLIENTS') or 32)
+    SLOT_STREAM_CHANGE_STREAMS = (os.environ.get('SLOT_STREAM_CHANGE_STREAMS') or 'false').lower() == 'true'
+
+    # Booking listing pages (?limit=) and the cursor batch size used when streaming lists/exports
+    BOOKINGS_PAGE_SIZE = int(os.environ.get('BOOKINGS_PAGE_SIZE') or 100)
+    BOOKINGS_PAGE_MAX = int(os.environ.get('BOOKINGS_PAGE_MAX') or 1000)
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE') or 1000)
+    # JSON encoder for responses: 'auto' (orjson when installed) or 'stdlib'
+    JSON_ENCODER = (os.environ.get('JSON_ENCODER') or 'auto').lower()
+
+    # Items per POST /api/admin/slots:batch or /api/bookings:batch request
+    BATCH_MAX_OPERATIONS = int(os.environ.get('BATCH_MAX_OPERATIONS') or 500)
+    # Vehicles per fleet booking, and neighbouring-slot runs tried before giving up
+    FLEET_MAX_SLOTS = int(os.environ.get('FLEET_MAX_SLOTS') or 20)
+    FLEET_CLAIM_ATTEMPTS = int(os.environ.get('FLEET_CLAIM_ATTEMPTS') or 3)
+
+    # Keep admin stats in a document updated on every booking write instead of aggregating per request
+    STATS_MATERIALIZED = (os.environ.get('STATS_MATERIALIZED') or 'false').lower() == 'true'
+
+    # User documents cached per worker for authenticated requests whose token lacks a role claim
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE') or 1024)
+    USER_CACHE_TTL_SECONDS = int(os.environ.get('USER_CACHE_TTL_SECONDS') or 60)
+
+    # Password hashing: scheme (bcrypt, pbkdf2 or scrypt), its cost (bcrypt/scrypt log2 rounds,
+    # pbkdf2 iterations; empty for the scheme default) and the per-worker hashing thread pool
+    # (0 hashes on the request thread) with its bound on queued hashes.
+    # Stored hashes made with other settings are upgraded on the user's next login.
+    PASSWORD_HASH_SCHEME = os.environ.get('PASSWORD_HASH_SCHEME') or 'bcrypt'
+    PASSWORD_HASH_COST = int(os.environ.get('PASSWORD_HASH_COST') or 0) or None
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 2)
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING') or 64)
+
+    # X-Profile request header returns a cProfile summary of that request (keep off in production)
+    PROFILE_REQUESTS = (os.environ.get('PROFILE_REQUESTS') or 'false').lower() == 'true'
+    PROFILE_TOP_N = int(os.environ.get('PROFILE_TOP_N') or 30)
+
+    # Parking locations and slots seeded at startup: every location gets floors x rows x numbers slots
+    # (F{floor}-{row}{number}); a location may be a dict overriding any of those lists (and setting
+    # active/settings). PARKING_LAYOUT_FILE points at a JSON file with the same shape. Locations are
+    # then documents in the locations collection, editable through PUT /api/admin/locations/<name>.
+    PARKING_LAYOUT = _load_json(os.environ['PARKING_LAYOUT_FILE']) if os.environ.get('PARKING_LAYOUT_FILE') else {
+        'locations': ['CityMall', 'TechPark', 'CentralOffice', 'Airport', 'Stadium'],
+        'floors': [1, 2],
+        'rows': ['A', 'B', 'C', 'D'],
+        'numbers': ['1', '2', '3'],
+    }
+
+    # Per-location worker affinity: LOCATIONS_SERVED (comma-separated, empty serves every location)
+    # pins this worker to some locations. It answers 421 for requests naming another location and
+    # only loads, expires and reconciles the slots and bookings of its own; a proxy in front routes
+    # each location to its workers. Location documents are re-read every LOCATIONS_CACHE_SECONDS.
+    LOCATIONS_SERVED = [
+        location.strip() for location in (os.environ.get('LOCATIONS_SERVED') or '').split(',') if location.strip()
+    ]
+    LOCATIONS_CACHE_SECONDS = int(os.environ.get('LOCATIONS_CACHE_SECONDS') or 30)
+
+    # GET /api/parking-slots/suggest: locations tried after the preferred one (comma-separated, default
+    # layout order), the cost of each step away from the preferred location/floor/row/slot number,
+    # and the largest ?limit=
+    SUGGEST_LOCATION_ORDER = [
+        location.strip() for location in (os.environ.get('SUGGEST_LOCATION_ORDER') or '').split(',') if location.strip()
+    ]
+    SUGGEST_COSTS = {
+        'location': int(os.environ.get('SUGGEST_COST_LOCATION') or 100),
+        'floor': int(os.environ.get('SUGGEST_COST_FLOOR') or 10),
+        'row': int(os.environ.get('SUGGEST_COST_ROW') or 2),
+        'number': int(os.environ.get('SUGGEST_COST_NUMBER') or 1),
+    }
+    SUGGEST_LIMIT_MAX = int(os.environ.get('SUGGEST_LIMIT_MAX') or 50)
+
+    # Booking prices (see pricing.py for the table shape). Defaults match the tiers the frontend
+    # used to charge; PRICING_RATES_FILE points at a JSON file with the same shape. The table is
+    # stored in MongoDB (replaceable through PUT /api/admin/rates) and each worker re-checks its
+    # version at most every PRICING_VERSION_CHECK_SECONDS.
+    PRICING_RATES = _load_json(os.environ['PRICING_RATES_FILE']) if os.environ.get('PRICING_RATES_FILE') else {
+        'currency': 'INR',
+        'hourly_rate': 20,
+        'packages': {'1': 20, '2': 35, '4': 60, '8': 100, '24': 200},
+        'long_stay_discounts': [[24, 0.5]],
+        'locations': {},
+        'floors': {},
+        'peak': [],
+        'max_hours': 720,
+    }
+    PRICING_VERSION_CHECK_SECONDS = int(os.environ.get('PRICING_VERSION_CHECK_SECONDS') or 5)
+    # Most windows priced by one POST /api/quotes call
+    QUOTE_MAX_WINDOWS = int(os.environ.get('QUOTE_MAX_WINDOWS') or 200)
+
+    # Occupancy/revenue rollups behind GET /api/admin/analytics: booking writes are buffered per
+    # worker and flushed every ANALYTICS_FLUSH_SECONDS (0 writes with each booking). The backfill
+    # (python run.py --backfill-analytics) aggregates ANALYTICS_BACKFILL_BATCH_DAYS of bookings at a time;
+    # workers hold their booking writes while it runs and replay them on the rebuilt rollups.
+    ANALYTICS_FLUSH_SECONDS = int(os.environ.get('ANALYTICS_FLUSH_SECONDS') or 5)
+    ANALYTICS_BACKFILL_BATCH_DAYS = int(os.environ.get('ANALYTICS_BACKFILL_BATCH_DAYS') or 30)
+    # Most buckets one analytics response may span
+    ANALYTICS_MAX_BUCKETS = int(os.environ.get('ANALYTICS_MAX_BUCKETS') or 2000)
+
+    # Rate limits and load shedding below (benchmarks turn both off with RATE_LIMITING=false)
+    RATE_LIMITING = (os.environ.get('RATE_LIMITING') or 'true').lower() == 'true'
+    # Token-bucket budgets ('requests/seconds'; '0' turns one off) per user, or per client IP for
+    # unauthenticated requests. RATE_LIMIT_BACKEND is 'memory' (per worker) or 'mongo' (shared by
+    # all workers, one extra write per limited request).
+    RATE_LIMITS = {
+        'auth': os.environ.get('RATE_LIMIT_AUTH') or '10/60',
+        'reads': os.environ.get('RATE_LIMIT_READS') or '120/60',
+        'quotes': os.environ.get('RATE_LIMIT_QUOTES') or '60/60',
+        'bookings': os.environ.get('RATE_LIMIT_BOOKINGS') or '30/60',
+    }
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND') or 'memory'
+    # Proxies in front of the app (the location router, a load balancer), whose X-Forwarded-For gives
+    # the client address that anonymous buckets are keyed by. WSGI: how many proxies append to the
+    # header (werkzeug ProxyFix; 0 trusts none, so clients cannot pick their own address). ASGI: the
+    # proxy addresses uvicorn takes the header from (same variable and default as uvicorn's own).
+    TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT') or 0)
+    FORWARDED_ALLOW_IPS = os.environ.get('FORWARDED_ALLOW_IPS') or '127.0.0.1'
+    RATE_LIMIT_MAX_CLIENTS = int(os.environ.get('RATE_LIMIT_MAX_CLIENTS') or 100000)
+
+    # Load shedding: while the moving average of MongoDB command latency is above
+    # LOAD_SHED_DB_LATENCY_MS (0 disables), routes in LOAD_SHED_BUDGETS answer 429 with Retry-After
+    LOAD_SHED_DB_LATENCY_MS = int(os.environ.get('LOAD_SHED_DB_LATENCY_MS') or 250)
+    LOAD_SHED_WINDOW_SECONDS = int(os.environ.get('LOAD_SHED_WINDOW_SECONDS') or 5)
+    LOAD_SHED_BUDGETS = [
+        budget.strip() for budget in (os.environ.get('LOAD_SHED_BUDGETS') or 'reads,quotes').split(',') if budget.strip()
+    ]
+
+    # Waitlist for full floors (POST /api/bookings with "waitlist": true): most entries waiting per
+    # (location, floor, window), and seconds after which a promotion left unfinished by a stopped
+    # worker is handed back to the queue
+    WAITLIST_MAX_PER_WINDOW = int(os.environ.get('WAITLIST_MAX_PER_WINDOW') or 50)
+    WAITLIST_CLAIM_SECONDS = int(os.environ.get('WAITLIST_CLAIM_SECONDS') or 60)
     
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -0,0 +1,194 @@
+"""
+Shared MongoDB connection factory.
+
+``connect()`` returns one ``MongoConnection`` per (uri, database) for the whole
+process, configured from Config (pool sizes, timeouts, read preference, write
+concern). The MongoClient behind it is created on first use in each process, so
+a gunicorn worker forked after ``app`` was imported opens its own pool instead
+of inheriting the parent's sockets. Collection handles resolve to the current
+process's client on every call, which lets modules keep them at import time.
+"""
+
+import os
+import threading
+
+from pymongo import MongoClient, ReadPreference
+from pymongo.monitoring import ConnectionPoolListener
+
+from config import Config
+
+READ_PREFERENCES = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST,
+}
+
+
+def client_options():
+    """MongoClient/AsyncIOMotorClient keyword arguments from Config (unset values keep driver defaults)."""
+    options = {
+        'maxPoolSize': Config.MONGO_MAX_POOL_SIZE,
+        'minPoolSize': Config.MONGO_MIN_POOL_SIZE,
+        'maxIdleTimeMS': Config.MONGO_MAX_IDLE_TIME_MS,
+        'connectTimeoutMS': Config.MONGO_CONNECT_TIMEOUT_MS,
+        'serverSelectionTimeoutMS': Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        'socketTimeoutMS': Config.MONGO_SOCKET_TIMEOUT_MS,
+        'waitQueueTimeoutMS': Config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        'readPreference': Config.MONGO_READ_PREFERENCE,
+        'w': Config.MONGO_WRITE_CONCERN,
+        'wTimeoutMS': Config.MONGO_WRITE_CONCERN_TIMEOUT_MS,
+    }
+    return {name: value for name, value in options.items() if value is not None}
+
+
+def read_heavy_preference():
+    """Read preference for reporting queries that tolerate slightly stale data (stats, exports)."""
+    preference = READ_PREFERENCES[Config.MONGO_READ_HEAVY_PREFERENCE]
+    if Config.MONGO_MAX_STALENESS_SECONDS and preference is not ReadPreference.PRIMARY:
+        return type(preference)(max_staleness=Config.MONGO_MAX_STALENESS_SECONDS)
+    return preference
+
+
+class PoolStats(ConnectionPoolListener):
+    """Connection pool counters for this process, reported by /api/health."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(
+            ('created', 'closed', 'checked_out', 'checked_in', 'checkout_failed', 'cleared'), 0
+        )
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._count('cleared')
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._count('created')
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._count('closed')
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._count('checkout_failed')
+
+    def connection_checked_out(self, event):
+        self._count('checked_out')
+
+    def connection_checked_in(self, event):
+        self._count('checked_in')
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self.counts)
+        counts['open'] = counts['created'] - counts['closed']
+        counts['in_use'] = counts['checked_out'] - counts['checked_in']
+        return counts
+
+
+class CollectionHandle:
+    """Stands in for a Collection and forwards every call to the current process's client."""
+
+    def __init__(self, connection, name, read_preference=None):
+        self._connection = connection
+        self._name = name
+        self._read_preference = read_preference
+        self._resolved = (None, None)
+
+    def _collection(self):
+        pid, collection = self._resolved
+        if pid != os.getpid():
+            collection = self._connection.database().get_collection(self._name, read_preference=self._read_preference)
+            self._resolved = (os.getpid(), collection)
+        return collection
+
+    def __getattr__(self, attr):
+        return getattr(self._collection(), attr)
+
+    def __repr__(self):
+        return f'CollectionHandle({self._name!r})'
+
+
+class DatabaseHandle:
+    """Database counterpart of CollectionHandle; ``db['name']`` returns a CollectionHandle."""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __getitem__(self, name):
+        return CollectionHandle(self._connection, name)
+
+    def __getattr__(self, attr):
+        return getattr(self._connection.database(), attr)
+
+
+class MongoConnection:
+    def __init__(self, uri, db_name, listeners=(), **options):
+        self.uri = uri
+        self.db_name = db_name
+        self.listeners = list(listeners)
+        self.options = options
+        self._lock = threading.Lock()
+        self._pid = None
+        self._client = None
+        self._pool_stats = None
+
+    def client(self):
+        """MongoClient for this process, created on first use (and again after a fork)."""
+        if self._pid == os.getpid():
+            return self._client
+        with self._lock:
+            if self._pid != os.getpid():
+                # The parent's client (if any) is left alone: closing it here would close its sockets too
+                self._pool_stats = PoolStats()
+                self._client = MongoClient(
+                    self.uri, event_listeners=[self._pool_stats, *self.listeners], **self.options
+                )
+                self._pid = os.getpid()
+        return self._client
+
+    def database(self):
+        return self.client()[self.db_name]
+
+    def handle(self):
+        return DatabaseHandle(self)
+
+    def collection(self, name, read_preference=None):
+        return CollectionHandle(self, name, read_preference)
+
+    def pool_stats(self):
+        stats = self._pool_stats.snapshot() if self._pid == os.getpid() else {}
+        stats['max_pool_size'] = self.options.get('maxPoolSize', 100)
+        stats['min_pool_size'] = self.options.get('minPoolSize', 0)
+        return stats
+
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def connect(uri, db_name, listeners=()):
+    """The process-wide MongoConnection for (uri, db_name); ``listeners`` apply when it is first created."""
+    with _connections_lock:
+        if (uri, db_name) not in _connections:
+            _connections[(uri, db_name)] = MongoConnection(uri, db_name, listeners, **client_options())
+        return _connections[(uri, db_name)]
@@ -0,0 +1,162 @@
+"""
+Live slot status change feed for GET /api/parking-slots/stream.
+
+``SlotChangeFeed`` is a single in-process ring buffer of slot deltas
+(slot_id, location, status, booked_by) that any number of SSE connections read
+from with their own cursor, so fan-out costs no extra DB queries. ``subscribe``
+blocks its thread between events (the WSGI app); ``subscribe_async`` parks a
+coroutine instead (the ASGI app), woken through its event loop by ``publish``.
+``ChangeStreamRelay`` optionally fills the feed from a MongoDB change stream on
+parking_slots so every process sees writes made by all the others.
+"""
+
+import asyncio
+import threading
+import uuid
+from collections import deque
+
+from pymongo.errors import PyMongoError
+
+
+class SlotChangeFeed:
+    def __init__(self, backlog=1000):
+        # Event ids are "<epoch>:<seq>" so a client reconnecting to another process is told to reset
+        self.epoch = uuid.uuid4().hex[:8]
+        self._events = deque(maxlen=backlog)
+        self._seq = 0
+        self._cond = threading.Condition()
+        # (event loop, asyncio.Event) of each waiting subscribe_async
+        self._async_waiters = set()
+        # Set while a change stream relay is the source of events
+        self.external_source = False
+
+    def publish(self, location, slot_id, status, booked_by=None):
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, {
+                'slot_id': slot_id,
+                'location': location,
+                'status': status,
+                'booked_by': booked_by,
+            }))
+            self._cond.notify_all()
+            for loop, wakeup in self._async_waiters:
+                loop.call_soon_threadsafe(wakeup.set)
+
+    def _parse_last_id(self, last_event_id):
+        """Sequence number to resume after, or None when the client must reload everything."""
+        if not last_event_id:
+            return self._seq
+        epoch, _, seq = last_event_id.partition(':')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        oldest = self._events[0][0] if self._events else self._seq + 1
+        if seq < oldest - 1:
+            return None
+        return seq
+
+    def _start(self, last_event_id):
+        """(cursor, whether the client must reset first); call holding the lock."""
+        cursor = self._parse_last_id(last_event_id)
+        if cursor is None:
+            return self._seq, True
+        return cursor, False
+
+    def _pending(self, cursor):
+        """Events after ``cursor`` (None when it fell behind the ring buffer); call holding the lock."""
+        if self._events and self._events[0][0] > cursor + 1:
+            return None
+        return [(seq, delta) for seq, delta in self._events if seq > cursor]
+
+    def _items(self, pending):
+        if pending is None:
+            # Fell behind the ring buffer; the client has to reload
+            yield 'reset', None
+        elif not pending:
+            yield None, None
+        for seq, delta in pending or []:
+            yield f'{self.epoch}:{seq}', delta
+
+    def subscribe(self, last_event_id=None, heartbeat_seconds=15):
+        """
+        Yield (event_id, delta) tuples as slots change. Yields (None, None) as a
+        keep-alive every ``heartbeat_seconds`` and ('reset', None) first when the
+        client's Last-Event-ID can no longer be replayed.
+        """
+        with self._cond:
+            cursor, reset = self._start(last_event_id)
+        if reset:
+            yield 'reset', None
+
+        while True:
+            with self._cond:
+                if self._seq == cursor:
+                    self._cond.wait(heartbeat_seconds)
+                pending = self._pending(cursor)
+                cursor = self._seq
+            yield from self._items(pending)
+
+    async def subscribe_async(self, last_event_id=None, heartbeat_seconds=15):
+        """``subscribe`` for a coroutine: waits on the running event loop instead of blocking a thread."""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            cursor, reset = self._start(last_event_id)
+            self._async_waiters.add(waiter)
+        try:
+            if reset:
+                yield 'reset', None
+
+            while True:
+                with self._cond:
+                    # Cleared under the lock, so a publish from here on sets it again
+                    waiter[1].clear()
+                    idle = self._seq == cursor
+                if idle:
+                    try:
+                        await asyncio.wait_for(waiter[1].wait(), heartbeat_seconds)
+                    except asyncio.TimeoutError:
+                        pass
+                with self._cond:
+                    pending = self._pending(cursor)
+                    cursor = self._seq
+                for item in self._items(pending):
+                    yield item
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+
+
+class ChangeStreamRelay:
+    """Publish slot status changes seen on a MongoDB change stream (replica sets only)."""
+
+    def __init__(self, parking_slots, feed, logger=None):
+        self.parking_slots = parking_slots
+        self.feed = feed
+        self.logger = logger
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self.feed.external_source = True
+        self._thread = threading.Thread(target=self._run, name='slot-change-stream', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        pipeline = [{'$match': {
+            'operationType': 'update',
+            'updateDescription.updatedFields.status': {'$exists': True},
+        }}]
+        try:
+            with self.parking_slots.watch(pipeline, full_document='updateLookup') as stream:
+                for change in stream:
+                    doc = change.get('fullDocument') or {}
+                    self.feed.publish(doc.get('location'), doc.get('slot_id'),
+                                      doc.get('status'), doc.get('booked_by'))
+        except PyMongoError as e:
+            # Standalone servers have no change streams; go back to in-process publishing
+            if self.logger:
+                self.logger.warning('Slot change stream unavailable, using in-process feed: %s', e)
+        finally:
+            self.feed.external_source = False
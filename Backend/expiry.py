@@ -0,0 +1,162 @@
+"""
+Background expiry of finished bookings.
+
+Bookings carry ``start_at``/``end_at`` as real datetimes and the bookings
+collection is indexed on ``(status, end_at)`` and ``(status, start_at)``, so each
+tick completes every ended booking with one indexed update_many and only reads
+back the bookings that tick claimed. Completed and cancelled bookings older than
+``archive_after`` are moved to the archive collection to keep bookings small.
+A ``scope`` filter (e.g. ``{'location': {'$in': [...]}}``) limits a worker pinned
+to some locations to their bookings.
+"""
+
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from pymongo import ReplaceOne, UpdateOne
+
+# Bookings in these states never change again and can leave the hot collection
+ARCHIVED_STATUSES = ['completed', 'cancelled']
+
+
+class ExpiryWorker:
+    def __init__(self, bookings, parking_slots, interval_seconds=30, on_start=None, on_tick=None,
+                 on_change=None, on_expired=None, archive=None, archive_after=None, archive_batch_size=1000,
+                 scope=None, logger=None):
+        self.bookings = bookings
+        self.parking_slots = parking_slots
+        self.interval_seconds = interval_seconds
+        self.archive = archive
+        self.archive_after = archive_after
+        self.archive_batch_size = archive_batch_size
+        self.scope = scope or {}
+        self.on_start = on_start
+        self.on_tick = on_tick
+        self.on_change = on_change
+        self.on_expired = on_expired
+        self.logger = logger
+        # Ticks that raised in a row; reset by the next one that completes
+        self.failures = 0
+        self._last_tick = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def tick(self, now=None):
+        """Complete ended bookings and occupy slots whose bookings have started. Returns the expired count."""
+        now = now or datetime.utcnow()
+        # The claim marks the bookings this update completed, so concurrent workers never double-process one
+        claim = uuid.uuid4().hex
+        result = self.bookings.update_many(
+            {**self.scope, 'status': 'active', 'end_at': {'$lte': now}},
+            {'$set': {'status': 'completed', 'expiry_claim': claim}}
+        )
+        completed = []
+        if result.modified_count:
+            completed = list(self.bookings.find({'expiry_claim': claim}, {'slot': 1, 'location': 1, 'floor': 1}))
+            # Claims only live for one tick, which keeps their sparse index near empty
+            self.bookings.update_many({'expiry_claim': claim}, {'$unset': {'expiry_claim': ''}})
+
+        ops = []
+        changes = []
+        for b in completed:
+            slot_filter = {'slot_id': b.get('slot'), 'location': b.get('location')}
+            ops.append(UpdateOne(slot_filter, {'$pull': {'reservations': {'booking_id': b['_id']}}}))
+            # Slots an admin closed keep their status
+            ops.append(UpdateOne({**slot_filter, 'closed': {'$ne': True}},
+                                 {'$set': {'status': 'available', 'booked_by': None}}))
+            changes.append((b.get('location'), b.get('slot'), 'available', None))
+
+        # Future reservations that began since the last tick now occupy their slot
+        if self._last_tick is not None:
+            started = self.bookings.find(
+                {**self.scope, 'status': 'active', 'start_at': {'$gt': self._last_tick, '$lte': now},
+                 'end_at': {'$gt': now}},
+                {'slot': 1, 'location': 1, 'customer_name': 1}
+            )
+            for b in started:
+                ops.append(UpdateOne(
+                    {'slot_id': b.get('slot'), 'location': b.get('location'), 'closed': {'$ne': True}},
+                    {'$set': {'status': 'booked', 'booked_by': b.get('customer_name')}}
+                ))
+                changes.append((b.get('location'), b.get('slot'), 'booked', b.get('customer_name')))
+        if ops:
+            # Ordered: a slot freed by one booking and taken by the next ends up booked
+            self.parking_slots.bulk_write(ops)
+        self._last_tick = now
+
+        self.archive_finished(now)
+
+        # on_change receives (location, slot_id, status, booked_by) for every slot touched,
+        # on_expired the bookings this tick completed
+        if changes and self.on_change:
+            self.on_change(*changes)
+        if completed and self.on_expired:
+            self.on_expired(*completed)
+        return len(completed)
+
+    def archive_finished(self, now=None):
+        """Move completed/cancelled bookings that ended before ``now - archive_after`` to the archive."""
+        if self.archive is None or self.archive_after is None:
+            return 0
+        cutoff = (now or datetime.utcnow()) - self.archive_after
+        query = {**self.scope, 'status': {'$in': ARCHIVED_STATUSES}, 'end_at': {'$lt': cutoff}}
+        moved = 0
+        while True:
+            batch = list(self.bookings.find(query).sort('end_at', 1).limit(self.archive_batch_size))
+            if not batch:
+                break
+            # Copy first, then delete: a crash in between leaves a booking in both, never in neither
+            # Upserts carry the shard key (location, _id) so a sharded archive can route them
+            self.archive.bulk_write([
+                ReplaceOne({'location': b.get('location'), '_id': b['_id']}, b, upsert=True) for b in batch
+            ], ordered=False)
+            self.bookings.delete_many({**query, '_id': {'$in': [b['_id'] for b in batch]}})
+            moved += len(batch)
+            if len(batch) < self.archive_batch_size:
+                break
+        return moved
+
+    def start(self):
+        """Start the worker thread once per process (safe to call on every request)."""
+        if self.interval_seconds <= 0:
+            return
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            # Threads do not survive a fork, so a forked worker starts its own
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='booking-expiry', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        if self.on_start:
+            try:
+                self.on_start()
+            except Exception as e:
+                if self.logger:
+                    self.logger.exception('Expiry worker startup reconcile failed: %s', e)
+        while not self._stop.is_set():
+            try:
+                self.tick()
+                if self.on_tick:
+                    self.on_tick()
+                self.failures = 0
+            except Exception as e:
+                # Keep the worker alive across transient DB errors, but never fail silently
+                self.failures += 1
+                if self.logger:
+                    if self.failures == 1:
+                        self.logger.exception('Expiry tick failed: %s', e)
+                    else:
+                        self.logger.error('Expiry tick failed %d times in a row: %s', self.failures, e)
+            self._stop.wait(self.interval_seconds)
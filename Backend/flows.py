@@ -0,0 +1,86 @@
+"""
+Route logic shared by the WSGI app (app.py) and the ASGI app (asgi_app.py).
+
+Logic that talks to MongoDB is written once, as a generator (a "flow") that
+yields each I/O step and is sent back its result:
+
+    slot = yield Mongo('parking_slots', 'find_one_and_update', query, update)
+    rates = yield Call(pricing.table)
+
+``run`` executes the steps with PyMongo in the calling thread; ``run_async``
+awaits them on Motor and runs ``Call`` steps (the sync client, blocking caches)
+in a thread pool, so the event loop never waits on either. An exception raised
+by a step is thrown back into the flow at its ``yield``, so the flow's own
+try/except blocks behave the same in both modes. Sub-flows compose with
+``yield from``; a route flow returns the route's ``(body, status[, headers])``.
+"""
+
+# Methods whose cursor is read to the end and sent back as a list
+CURSOR_METHODS = ('find', 'aggregate')
+
+
+class Mongo:
+    """Call ``method(*args, **kwargs)`` on the collection registered as ``collection``."""
+    __slots__ = ('collection', 'method', 'args', 'kwargs')
+
+    def __init__(self, collection, method, *args, **kwargs):
+        self.collection = collection
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+
+
+class Call:
+    """Call a blocking function (off the event loop in async mode)."""
+    __slots__ = ('fn', 'args', 'kwargs')
+
+    def __init__(self, fn, *args, **kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+
+def _execute(step, collections):
+    if isinstance(step, Call):
+        return step.fn(*step.args, **step.kwargs)
+    result = getattr(collections[step.collection], step.method)(*step.args, **step.kwargs)
+    return list(result) if step.method in CURSOR_METHODS else result
+
+
+async def _execute_async(step, collections, to_thread):
+    if isinstance(step, Call):
+        return await to_thread(step.fn, *step.args, **step.kwargs)
+    result = getattr(collections[step.collection], step.method)(*step.args, **step.kwargs)
+    if step.method in CURSOR_METHODS:
+        return await result.to_list(None)
+    return await result
+
+
+def run(flow, collections):
+    """Drive ``flow`` to completion on PyMongo ``collections`` (name -> collection); returns its value."""
+    result = error = None
+    while True:
+        try:
+            step = flow.send(result) if error is None else flow.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        result = error = None
+        try:
+            result = _execute(step, collections)
+        except Exception as e:
+            error = e
+
+
+async def run_async(flow, collections, to_thread):
+    """``run`` on Motor ``collections``; ``to_thread(fn, *args)`` awaits a blocking call in a thread pool."""
+    result = error = None
+    while True:
+        try:
+            step = flow.send(result) if error is None else flow.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        result = error = None
+        try:
+            result = await _execute_async(step, collections, to_thread)
+        except Exception as e:
+            error = e
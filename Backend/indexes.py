@@ -0,0 +1,130 @@
+"""
+Index definitions for the users, parking_slots, bookings, bookings_archive, rate_limits, analytics, waitlist and
+waitlist_queues collections (including the shard key indexes of locations.SHARD_KEYS), plus an explain() report that checks each route's query shape is served by an index.
+"""
+
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+INDEXES = {
+    'users': [
+        IndexModel([('username', ASCENDING)], name='username_unique', unique=True),
+    ],
+    'parking_slots': [
+        IndexModel([('location', ASCENDING), ('slot_id', ASCENDING)], name='location_slot_unique', unique=True),
+        IndexModel([('location', ASCENDING), ('floor', ASCENDING), ('status', ASCENDING)], name='location_floor_status'),
+    ],
+    'bookings': [
+        IndexModel([('status', ASCENDING), ('end_at', ASCENDING)], name='status_end_at'),
+        IndexModel([('status', ASCENDING), ('start_at', ASCENDING)], name='status_start_at'),
+        IndexModel([('user_id', ASCENDING), ('_id', ASCENDING)], name='user_id_id'),
+        IndexModel([('location', ASCENDING), ('slot', ASCENDING), ('status', ASCENDING)], name='location_slot_status'),
+        # Shard key; also serves booking lookups routed with ?location=
+        IndexModel([('location', ASCENDING), ('_id', ASCENDING)], name='location_id'),
+        # Only set on bookings an expiry tick is completing, so it stays almost empty
+        IndexModel([('expiry_claim', ASCENDING)], name='expiry_claim', sparse=True),
+    ],
+    'bookings_archive': [
+        IndexModel([('location', ASCENDING), ('_id', ASCENDING)], name='location_id'),
+    ],
+    'rate_limits': [
+        # Shared token buckets (RATE_LIMIT_BACKEND=mongo) disappear once they would be full again
+        IndexModel([('expires_at', ASCENDING)], name='expires_at_ttl', expireAfterSeconds=0),
+    ],
+    'analytics': [
+        IndexModel([('granularity', ASCENDING), ('bucket', ASCENDING), ('location', ASCENDING)],
+                   name='granularity_bucket_location'),
+    ],
+    'waitlist': [
+        # Queue rebuilds, expiry and queue positions
+        IndexModel([('status', ASCENDING), ('location', ASCENDING), ('floor', ASCENDING), ('start_at', ASCENDING)],
+                   name='status_location_floor_start_at'),
+        IndexModel([('user_id', ASCENDING), ('_id', ASCENDING)], name='user_id_id'),
+    ],
+    'waitlist_queues': [
+        # Expiry drops the counters of queues whose window has started
+        IndexModel([('start_at', ASCENDING)], name='start_at'),
+    ],
+}
+
+# (route, collection, filter, sort) for the queries each route issues
+ROUTE_QUERY_SHAPES = [
+    ('POST /api/auth/login', 'users', {'username': 'admin'}, None),
+    ('POST /api/auth/register', 'users', {'username': 'customer'}, None),
+    ('GET /api/parking-slots', 'parking_slots', {'location': 'CityMall', 'floor': 1, 'status': 'available'}, None),
+    ('GET /api/parking-slots (location only)', 'parking_slots', {'location': 'CityMall'}, None),
+    ('POST /api/bookings (slot lookup)', 'parking_slots', {'location': 'CityMall', 'slot_id': 'F1-A1'}, None),
+    ('PUT /api/bookings/<id>?location=', 'bookings',
+     {'location': 'CityMall', '_id': ObjectId('000000000000000000000000')}, None),
+    ('GET /api/bookings (customer)', 'bookings', {'user_id': '000000000000000000000000'}, None),
+    ('GET /api/bookings?cursor= (customer page)', 'bookings',
+     {'user_id': '000000000000000000000000', '_id': {'$gt': ObjectId('000000000000000000000000')}}, [('_id', ASCENDING)]),
+    ('GET /api/admin/stats (active count)', 'bookings', {'status': 'active'}, None),
+    ('expiry tick', 'bookings', {'status': 'active', 'end_at': {'$lte': datetime.utcnow()}}, [('end_at', ASCENDING)]),
+    ('expiry tick (started reservations)', 'bookings',
+     {'status': 'active', 'start_at': {'$gt': datetime(2000, 1, 1), '$lte': datetime.utcnow()}}, None),
+    ('expiry tick (claimed bookings)', 'bookings', {'expiry_claim': '0' * 32}, None),
+    ('archive sweep', 'bookings',
+     {'status': {'$in': ['completed', 'cancelled']}, 'end_at': {'$lt': datetime(2000, 1, 1)}}, [('end_at', ASCENDING)]),
+    ('slot reconcile (active bookings)', 'bookings', {'status': 'active', 'location': 'CityMall'}, None),
+    ('GET /api/admin/analytics', 'analytics',
+     {'granularity': 'hour', 'bucket': {'$gte': datetime(2000, 1, 1), '$lt': datetime(2000, 1, 2)}},
+     [('bucket', ASCENDING)]),
+    ('waitlist queue position', 'waitlist',
+     {'status': 'waiting', 'location': 'CityMall', 'floor': 1, 'start_at': datetime(2000, 1, 1),
+      'end_at': datetime(2000, 1, 1, 1)}, None),
+    ('GET /api/waitlist (customer)', 'waitlist', {'user_id': '000000000000000000000000'}, [('_id', ASCENDING)]),
+]
+
+
+def ensure_indexes(db, logger=None):
+    """Create the indexes in INDEXES (no-op for ones that already exist)."""
+    created = {}
+    for name, models in INDEXES.items():
+        try:
+            created[name] = db[name].create_indexes(models)
+        except OperationFailure as e:
+            # e.g. duplicate data blocking a unique index; keep serving and report it
+            if logger:
+                logger.warning('Could not create indexes on %s: %s', name, e)
+            created[name] = []
+    return created
+
+
+def _plan_summary(plan):
+    """Flatten a winning plan into its stage names and the indexes it used."""
+    stages, index_names = [], []
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        stages.append(node.get('stage'))
+        if node.get('indexName'):
+            index_names.append(node['indexName'])
+        if 'inputStage' in node:
+            stack.append(node['inputStage'])
+        stack.extend(node.get('inputStages', []))
+    return stages, index_names
+
+
+def explain_route_queries(db):
+    """Run explain() for every route query shape; returns one report dict per shape."""
+    report = []
+    for route, collection, query, sort in ROUTE_QUERY_SHAPES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain().get('queryPlanner', {}).get('winningPlan', {})
+        # Sharded/SBE explain output nests the classic plan one level down
+        plan = plan.get('queryPlan', plan)
+        stages, index_names = _plan_summary(plan)
+        report.append({
+            'route': route,
+            'collection': collection,
+            'stages': stages,
+            'indexes': index_names,
+            'uses_index': 'COLLSCAN' not in stages,
+        })
+    return report
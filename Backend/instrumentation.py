@@ -0,0 +1,240 @@
+"""
+Request instrumentation for the Flask app.
+
+``CommandMetrics`` is a pymongo CommandListener that totals commands and their
+server time by command name and also charges them to the request being served
+(pymongo publishes command events on the thread that ran the command).
+``Instrumentation`` times every route, adds a ``Server-Timing`` header with the
+request's MongoDB share, renders everything as Prometheus text for
+GET /api/metrics, and, when enabled, answers a request sent with ``X-Profile``
+with the cProfile summary of that request instead of its normal body.
+All figures are per process.
+"""
+
+import cProfile
+import io
+import pstats
+import threading
+import time
+from contextvars import ContextVar
+
+from flask import g, request
+from pymongo import monitoring
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROFILE_SORT_KEYS = ('cumulative', 'tottime', 'calls')
+
+_current_request = ContextVar('instrumented_request', default=None)
+
+
+class RequestScope:
+    __slots__ = ('started', 'commands', 'command_seconds')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.commands = 0
+        self.command_seconds = 0.0
+
+
+class CommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        # command name -> [count, seconds, failures]
+        self.commands = {}
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event, failed=False)
+
+    def failed(self, event):
+        self._record(event, failed=True)
+
+    def _record(self, event, failed):
+        seconds = event.duration_micros / 1e6
+        scope = _current_request.get()
+        if scope is not None:
+            scope.commands += 1
+            scope.command_seconds += seconds
+        with self._lock:
+            entry = self.commands.setdefault(event.command_name, [0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += int(failed)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: list(entry) for name, entry in self.commands.items()}
+
+
+class RouteMetrics:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # (method, route, status) -> count
+        self.requests = {}
+        # (method, route) -> [bucket counts..., +Inf count, seconds sum]
+        self.durations = {}
+        # (method, route) -> [mongo commands, mongo seconds]
+        self.mongo = {}
+
+    def observe(self, method, route, status, seconds, commands, command_seconds):
+        with self._lock:
+            key = (method, route)
+            self.requests[(method, route, status)] = self.requests.get((method, route, status), 0) + 1
+            histogram = self.durations.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[len(self.buckets)] += 1
+            histogram[-1] += seconds
+            mongo = self.mongo.setdefault(key, [0, 0.0])
+            mongo[0] += commands
+            mongo[1] += command_seconds
+
+    def snapshot(self):
+        with self._lock:
+            return (dict(self.requests),
+                    {key: list(value) for key, value in self.durations.items()},
+                    {key: list(value) for key, value in self.mongo.items()})
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+class Instrumentation:
+    def __init__(self, command_metrics, profile_enabled=False, profile_limit=30):
+        self.command_metrics = command_metrics
+        self.routes = RouteMetrics()
+        self.profile_enabled = profile_enabled
+        self.profile_limit = profile_limit
+        # name -> (help, read, label)
+        self._gauges = {}
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def gauge(self, name, help_text, read, label='key'):
+        """Expose ``read()`` as a gauge: a number, or a dict whose keys become ``label`` values."""
+        self._gauges[name] = (help_text, read, label)
+
+    def _before_request(self):
+        scope = RequestScope()
+        g._instrument_token = _current_request.set(scope)
+        g._instrument_scope = scope
+        if self.profile_enabled and request.headers.get('X-Profile'):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is already active on this thread
+                return
+            g._instrument_profiler = profiler
+
+    def _after_request(self, response):
+        scope = g.pop('_instrument_scope', None)
+        if scope is None:
+            return response
+        profiler = g.pop('_instrument_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+
+        seconds = time.perf_counter() - scope.started
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        self.routes.observe(request.method, route, response.status_code, seconds,
+                            scope.commands, scope.command_seconds)
+        response.headers['Server-Timing'] = (
+            f'db;dur={scope.command_seconds * 1000:.1f};desc="{scope.commands} commands", '
+            f'total;dur={seconds * 1000:.1f}'
+        )
+
+        if profiler is not None:
+            response = self._profile_response(profiler, response, scope, seconds)
+        return response
+
+    def _teardown_request(self, exc):
+        token = g.pop('_instrument_token', None)
+        if token is not None:
+            _current_request.reset(token)
+
+    def _profile_response(self, profiler, response, scope, seconds):
+        """Replace the body with the request's cProfile summary; the real status moves to X-Profile-Status."""
+        sort_key = request.headers.get('X-Profile')
+        if sort_key not in PROFILE_SORT_KEYS:
+            sort_key = 'cumulative'
+        out = io.StringIO()
+        out.write(f'{request.method} {request.full_path.rstrip("?")} -> {response.status_code}\n')
+        out.write(f'total {seconds * 1000:.1f} ms, {scope.commands} MongoDB commands '
+                  f'({scope.command_seconds * 1000:.1f} ms)\n\n')
+        pstats.Stats(profiler, stream=out).sort_stats(sort_key).print_stats(self.profile_limit)
+
+        profiled = response.__class__(out.getvalue(), status=200, mimetype='text/plain')
+        profiled.headers['X-Profile-Status'] = str(response.status_code)
+        profiled.headers['Server-Timing'] = response.headers['Server-Timing']
+        return profiled
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        requests, durations, mongo = self.routes.snapshot()
+        lines = [
+            '# HELP parking_http_requests_total HTTP requests by route and status.',
+            '# TYPE parking_http_requests_total counter',
+        ]
+        for (method, route, status), count in sorted(requests.items()):
+            lines.append(f'parking_http_requests_total{_labels(method=method, route=route, status=status)} {count}')
+
+        lines += [
+            '# HELP parking_http_request_duration_seconds Route handler time.',
+            '# TYPE parking_http_request_duration_seconds histogram',
+        ]
+        for (method, route), histogram in sorted(durations.items()):
+            for bound, count in zip(self.routes.buckets, histogram):
+                lines.append('parking_http_request_duration_seconds_bucket'
+                             f'{_labels(method=method, route=route, le=bound)} {count}')
+            total = histogram[len(self.routes.buckets)]
+            lines.append(f'parking_http_request_duration_seconds_bucket{_labels(method=method, route=route, le="+Inf")} {total}')
+            lines.append(f'parking_http_request_duration_seconds_sum{_labels(method=method, route=route)} {histogram[-1]:.6f}')
+            lines.append(f'parking_http_request_duration_seconds_count{_labels(method=method, route=route)} {total}')
+
+        lines += [
+            '# HELP parking_http_request_mongo_commands_total MongoDB commands issued while serving a route.',
+            '# TYPE parking_http_request_mongo_commands_total counter',
+        ]
+        for (method, route), (commands, _) in sorted(mongo.items()):
+            lines.append(f'parking_http_request_mongo_commands_total{_labels(method=method, route=route)} {commands}')
+        lines += [
+            '# HELP parking_http_request_mongo_seconds_total MongoDB command time while serving a route.',
+            '# TYPE parking_http_request_mongo_seconds_total counter',
+        ]
+        for (method, route), (_, command_seconds) in sorted(mongo.items()):
+            lines.append(f'parking_http_request_mongo_seconds_total{_labels(method=method, route=route)} {command_seconds:.6f}')
+
+        commands = self.command_metrics.snapshot()
+        for metric, index, help_text, fmt in (
+            ('parking_mongo_commands_total', 0, 'MongoDB commands by name (all threads).', '{}'),
+            ('parking_mongo_command_seconds_total', 1, 'MongoDB command time by name.', '{:.6f}'),
+            ('parking_mongo_command_failures_total', 2, 'Failed MongoDB commands by name.', '{}'),
+        ):
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+            for name, entry in sorted(commands.items()):
+                lines.append(f'{metric}{_labels(command=name)} {fmt.format(entry[index])}')
+
+        for name, (help_text, read, label) in sorted(self._gauges.items()):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+            value = read()
+            if isinstance(value, dict):
+                for key, number in sorted(value.items()):
+                    lines.append(f'{name}{_labels(**{label: key})} {number}')
+            else:
+                lines.append(f'{name} {value}')
+
+        return '\n'.join(lines) + '\n'
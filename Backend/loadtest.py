@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Sync vs async load test
+Starts the API in each mode (gunicorn for the WSGI app, uvicorn for asgi_app),
+drives it with many concurrent availability and booking requests, and reports
+requests/sec and latency percentiles per mode. Needs a real MongoDB
+(MONGODB_URI); each mode gets a throwaway database.
+
+    python loadtest.py --requests 5000 --concurrency 500
+    python loadtest.py --modes async --scenario availability --concurrency 2000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from urllib.request import urlopen
+
+HOST = '127.0.0.1'
+
+SERVERS = {
+    'sync': lambda port, args: ['gunicorn', '-w', '1', '--threads', str(args.threads), '-b', f'{HOST}:{port}', 'app:app'],
+    'async': lambda port, args: [sys.executable, '-m', 'uvicorn', 'asgi_app:app', '--host', HOST, '--port', str(port),
+                                 '--log-level', 'warning'],
+}
+
+
+async def http(port, method, path, body=None, headers=None):
+    """Minimal HTTP/1.1 request on a fresh connection; returns (status, body bytes)"""
+    reader, writer = await asyncio.open_connection(HOST, port)
+    payload = json.dumps(body).encode() if body is not None else b''
+    lines = [f'{method} {path} HTTP/1.1', f'Host: {HOST}:{port}', 'Connection: close',
+             f'Content-Length: {len(payload)}']
+    if body is not None:
+        lines.append('Content-Type: application/json')
+    lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + payload)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, content = response.partition(b'\r\n\r\n')
+    return int(head.split(b' ', 2)[1]), content
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urlopen(f'http://{HOST}:{port}/api/health', timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not come up")
+
+
+async def drive(port, args):
+    status, content = await http(port, 'POST', '/api/auth/login',
+                                 {'username': 'customer', 'password': 'customer123'})
+    if status != 200:
+        raise RuntimeError(f"login failed with {status}: {content[:200]}")
+    headers = {'Authorization': f"Bearer {json.loads(content)['access_token']}"}
+    locations = ['CityMall', 'TechPark', 'CentralOffice', 'Airport', 'Stadium']
+    gate = asyncio.Semaphore(args.concurrency)
+
+    def next_request(i):
+        day = f'2100-01-{i % 28 + 1:02d}'
+        location = random.choice(locations)
+        if args.scenario == 'availability' or (args.scenario == 'mixed' and i % 2):
+            return 'GET', f'/api/availability?location={location}&start={day}T10:00&end={day}T12:00', None
+        return 'POST', '/api/bookings', {
+            'slot': f"F{random.randint(1, 2)}-{random.choice('ABCD')}{random.randint(1, 3)}",
+            'location': location, 'name': 'Load', 'vehicle': f'LD{i:05d}',
+            'date': day, 'time': f'{random.randint(0, 22):02d}:00', 'duration': 1, 'amount': 20
+        }
+
+    async def one(i):
+        method, path, body = next_request(i)
+        async with gate:
+            started = time.perf_counter()
+            try:
+                status, _ = await http(port, method, path, body, headers)
+            except OSError:
+                status = None
+            return status, time.perf_counter() - started
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(args.requests)))
+    return results, time.perf_counter() - started
+
+
+def run_mode(mode, port, args, env):
+    server = subprocess.Popen(SERVERS[mode](port, args), env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        wait_until_up(port)
+        results, elapsed = asyncio.run(drive(port, args))
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = sorted(latency for _, latency in results)
+    statuses = [status for status, _ in results]
+    # 400 is a booking that lost its window to another request: a valid, complete answer
+    ok = sum(1 for status in statuses if status in (200, 201, 400))
+    return {
+        'mode': mode,
+        'rps': len(results) / elapsed,
+        'p50': latencies[len(latencies) // 2],
+        'p99': latencies[max(int(len(latencies) * 0.99) - 1, 0)],
+        'ok': ok,
+        'failed': len(results) - ok,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the sync (WSGI) and async (ASGI) API under load")
+    parser.add_argument('--requests', type=int, default=5000, help="requests per mode")
+    parser.add_argument('--concurrency', type=int, default=500, help="requests in flight at once")
+    parser.add_argument('--scenario', choices=['mixed', 'availability', 'booking'], default='mixed')
+    parser.add_argument('--modes', nargs='+', choices=list(SERVERS), default=list(SERVERS))
+    parser.add_argument('--threads', type=int, default=32, help="gunicorn threads for the sync server")
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+    mongodb_uri = os.environ.get('MONGODB_URI') or 'mongodb://localhost:27017/'
+    reports = []
+    for offset, mode in enumerate(args.modes):
+        # Each mode starts from its own freshly seeded database
+        database = f"parking_load_{mode}_{uuid.uuid4().hex[:8]}"
+        env = dict(os.environ, MONGODB_URI=mongodb_uri, DATABASE_NAME=database, FLASK_DEBUG='false',
+                   RATE_LIMITING='false')
+        try:
+            reports.append(run_mode(mode, args.port + offset, args, env))
+        finally:
+            MongoClient(mongodb_uri).drop_database(database)
+
+    print(f"🚗 {args.requests} {args.scenario} requests per mode, {args.concurrency} in flight")
+    for r in reports:
+        print(f"   {r['mode']:5}  {r['rps']:8.1f} req/s  p50: {r['p50'] * 1000:7.1f} ms  "
+              f"p99: {r['p99'] * 1000:7.1f} ms  ok: {r['ok']}  failed: {r['failed']}")
+
+
+if __name__ == '__main__':
+    main()
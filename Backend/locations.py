@@ -0,0 +1,134 @@
+"""
+Parking locations as documents.
+
+Each site is one document in the ``locations`` collection:
+
+    {"_id": "CityMall", "name": "CityMall", "floors": [1, 2], "rows": ["A", "B"],
+     "numbers": ["1", "2", "3"], "active": true, "settings": {"address": "..."}}
+
+holding its slot layout, whether it takes new bookings, and free-form settings
+returned by GET /api/locations. They are seeded from Config.PARKING_LAYOUT and
+created or changed through PUT /api/admin/locations/<name> afterwards.
+
+Every slot and booking query on the booking path carries the location, so the
+collections in ``SHARD_KEYS`` can be sharded on it (``python run.py
+--shard-collections`` against a mongos) without scatter-gather writes.
+``LocationDirectory`` caches the documents per worker and, for a worker pinned
+to some locations (Config.LOCATIONS_SERVED), tells the routes which requests
+belong elsewhere and scopes its background queries to its own locations.
+"""
+
+import threading
+import time
+
+# Shard keys of the per-location collections; each has a matching index in indexes.py
+SHARD_KEYS = {
+    'parking_slots': [('location', 1), ('slot_id', 1)],
+    'bookings': [('location', 1), ('_id', 1)],
+    'bookings_archive': [('location', 1), ('_id', 1)],
+}
+
+LAYOUT_FIELDS = ('floors', 'rows', 'numbers')
+
+
+def location_document(name, spec, defaults=None):
+    """Validated location document for ``name``; fields missing from ``spec`` come from ``defaults``."""
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError('Location name is required')
+    if not isinstance(spec, dict):
+        raise ValueError('Location must be an object')
+    defaults = defaults or {}
+    doc = {'_id': name, 'name': name}
+    for field in LAYOUT_FIELDS:
+        values = spec.get(field, defaults.get(field))
+        if not isinstance(values, list) or not values:
+            raise ValueError(f'{field} must be a non-empty list')
+        doc[field] = values
+    try:
+        doc['floors'] = [int(floor) for floor in doc['floors']]
+    except (TypeError, ValueError):
+        raise ValueError('floors must be whole numbers')
+    if any(floor <= 0 for floor in doc['floors']):
+        raise ValueError('floors must be positive')
+    doc['rows'] = [str(row) for row in doc['rows']]
+    if not all(row.isalpha() for row in doc['rows']):
+        raise ValueError('rows must be letters')
+    doc['numbers'] = [str(number) for number in doc['numbers']]
+    if not all(number.isdigit() for number in doc['numbers']):
+        raise ValueError('numbers must be digits')
+
+    doc['active'] = spec.get('active', defaults.get('active', True))
+    if not isinstance(doc['active'], bool):
+        raise ValueError('active must be true or false')
+    doc['settings'] = spec.get('settings', defaults.get('settings', {}))
+    if not isinstance(doc['settings'], dict):
+        raise ValueError('settings must be an object')
+    return doc
+
+
+def shard_collections(client, database_name):
+    """Shard the per-location collections on SHARD_KEYS (needs a mongos and the key indexes). Returns their names."""
+    client.admin.command('enableSharding', database_name)
+    for name, key in SHARD_KEYS.items():
+        client.admin.command('shardCollection', f'{database_name}.{name}', key=dict(key))
+    return list(SHARD_KEYS)
+
+
+class LocationDirectory:
+    def __init__(self, locations, served=None, ttl_seconds=30):
+        self.locations = locations
+        # Names this worker is pinned to, or None to serve every location
+        self.served = set(served) if served else None
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._docs = None
+        self._loaded = 0.0
+
+    def all(self):
+        """Location documents by name, in layout order (then by name); re-read at most every ``ttl_seconds``."""
+        now = time.monotonic()
+        docs = self._docs
+        if docs is not None and now - self._loaded < self.ttl_seconds:
+            return docs
+        ordered = sorted(self.locations.find({}), key=lambda doc: (doc.get('position', float('inf')), doc['_id']))
+        docs = {doc['_id']: doc for doc in ordered}
+        with self._lock:
+            self._docs = docs
+            self._loaded = now
+        return docs
+
+    def invalidate(self):
+        with self._lock:
+            self._docs = None
+
+    def get(self, name):
+        return self.all().get(name)
+
+    def names(self):
+        return list(self.all())
+
+    def serves(self, name):
+        """Whether requests for ``name`` belong to this worker (requests naming no location always do)."""
+        return self.served is None or not name or name in self.served
+
+    def accepts_bookings(self, name):
+        """False only for a stored location marked inactive; unknown names are left to the slot lookup."""
+        doc = self.get(name)
+        return doc is None or doc.get('active', True)
+
+    def scope(self, query=None, field='location'):
+        """``query`` restricted to the locations this worker serves (unchanged when it serves all of them)."""
+        query = dict(query or {})
+        if self.served is not None and field not in query:
+            query[field] = {'$in': sorted(self.served)}
+        return query
+
+    def capacity(self, location=None, floor=None):
+        """Slots in the stored layout of ``location`` (every location when None), optionally on ``floor``."""
+        total = 0
+        for name, doc in self.all().items():
+            if location and name != location:
+                continue
+            floors = [f for f in doc.get('floors', []) if floor is None or f == floor]
+            total += len(floors) * len(doc.get('rows', [])) * len(doc.get('numbers', []))
+        return total
@@ -0,0 +1,112 @@
+"""
+Password hashing for login and register.
+
+The scheme (bcrypt, pbkdf2 or scrypt) and its cost come from Config, and hashes
+made with other parameters are still accepted so they can be upgraded on the
+next successful login (``needs_rehash``). Hashing runs on a small thread pool:
+bcrypt and hashlib's pbkdf2/scrypt release the GIL while they work, so a burst of
+logins neither serializes on the interpreter nor ties up every request thread.
+The number of hashes waiting for the pool is bounded and callers past that get
+``HashingBusy``.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from werkzeug.security import check_password_hash, generate_password_hash
+
+SCHEMES = ('bcrypt', 'pbkdf2', 'scrypt')
+
+# Cost used when PASSWORD_HASH_COST is not set: bcrypt log2 rounds, pbkdf2 iterations, scrypt log2 N
+DEFAULT_COST = {'bcrypt': 12, 'pbkdf2': 600000, 'scrypt': 15}
+
+
+class HashingBusy(Exception):
+    """Too many password hashes are already queued; the client should retry."""
+
+
+def _method(scheme, cost):
+    if scheme == 'pbkdf2':
+        return f'pbkdf2:sha256:{cost}'
+    return f'scrypt:{2 ** cost}:8:1'
+
+
+def _hash(password, scheme, cost):
+    if scheme == 'bcrypt':
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=cost)).decode()
+    return generate_password_hash(password, method=_method(scheme, cost))
+
+
+def _verify(password, stored):
+    if stored.startswith('$2'):
+        return bcrypt.checkpw(password.encode(), stored.encode())
+    return check_password_hash(stored, password)
+
+
+def describe(stored):
+    """(scheme, cost) a stored hash was made with, or (None, None) if unrecognised."""
+    if stored.startswith('$2'):
+        # $2b$<rounds>$<salt+hash>
+        return 'bcrypt', int(stored.split('$')[2])
+    method = stored.split('$', 1)[0]
+    parts = method.split(':')
+    if parts[0] == 'pbkdf2':
+        # pbkdf2:<hash>:<iterations>; werkzeug omits iterations for its defaults
+        return 'pbkdf2', int(parts[2]) if len(parts) > 2 else None
+    if parts[0] == 'scrypt':
+        n = int(parts[1]) if len(parts) > 1 else 2 ** 15
+        return 'scrypt', n.bit_length() - 1
+    return None, None
+
+
+class PasswordHasher:
+    def __init__(self, scheme='bcrypt', cost=None, workers=2, max_pending=64, timeout_seconds=10):
+        if scheme not in SCHEMES:
+            raise ValueError(f'Unknown password hash scheme: {scheme}')
+        self.scheme = scheme
+        self.cost = cost or DEFAULT_COST[scheme]
+        self.workers = workers
+        self.timeout_seconds = timeout_seconds
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+
+    def _executor(self):
+        """Pool for this process; gunicorn forks after import, so each worker creates its own."""
+        if self._pid == os.getpid():
+            return self._pool
+        with self._lock:
+            if self._pid != os.getpid():
+                # Threads, not a forked process pool: forking a worker that already runs request,
+                # expiry and flush threads can copy their held locks (pymongo pool, logging) into
+                # the children and deadlock them
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+                self._pid = os.getpid()
+        return self._pool
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.timeout_seconds):
+            raise HashingBusy('Too many logins in progress, try again shortly')
+        try:
+            return self._executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, password, self.scheme, self.cost)
+
+    def verify(self, password, stored):
+        if not stored:
+            return False
+        return self._run(_verify, password, stored)
+
+    def needs_rehash(self, stored):
+        scheme, cost = describe(stored)
+        if scheme == 'pbkdf2' and cost is None:
+            return True
+        return (scheme, cost) != (self.scheme, self.cost)
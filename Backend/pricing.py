@@ -0,0 +1,208 @@
+"""
+Server-side booking prices.
+
+A rate table is plain JSON (see Config.PRICING_RATES):
+
+    {"currency": "INR", "hourly_rate": 20,
+     "packages": {"1": 20, "2": 35, "4": 60, "8": 100, "24": 200},
+     "long_stay_discounts": [[6, 0.85], [12, 0.75]],
+     "locations": {"Airport": 1.5}, "floors": {"2": 0.9},
+     "peak": [{"days": [0, 1, 2, 3, 4], "hours": [8, 9, 17, 18], "multiplier": 1.25}],
+     "max_hours": 720}
+
+``RateTable`` compiles it once: a base price per whole-hour duration (package
+price, else hourly rate with the long-stay discount, never more than a longer
+package), and prefix sums of the peak multiplier over the 168 hours of a week.
+A quote is then a handful of lookups whatever the duration:
+``base[hours] × location × floor × average peak multiplier over the window``.
+
+``PricingEngine`` keeps the table in the ``meta`` collection with a version
+number and caches the compiled table per worker, re-checking the version at
+most every ``check_seconds``.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime
+
+RATES_ID = 'rates'
+
+HOURS_PER_WEEK = 168
+
+
+def rates_fingerprint(rates):
+    return hashlib.md5(json.dumps(rates, sort_keys=True).encode()).hexdigest()
+
+
+def _as_amount(value):
+    amount = round(value, 2)
+    return int(amount) if amount == int(amount) else amount
+
+
+class RateTable:
+    def __init__(self, rates, version=0):
+        """Validate and compile ``rates``; raises ValueError describing the first problem found."""
+        if not isinstance(rates, dict):
+            raise ValueError('Rate table must be an object')
+        self.rates = rates
+        self.version = version
+        self.currency = rates.get('currency', 'INR')
+        self.max_hours = self._positive_int(rates.get('max_hours', 720), 'max_hours')
+        hourly = self._non_negative(rates.get('hourly_rate', 0), 'hourly_rate')
+
+        packages = {}
+        for hours, price in (rates.get('packages') or {}).items():
+            packages[self._positive_int(hours, 'package hours')] = self._non_negative(price, 'package price')
+        discounts = sorted(
+            (self._positive_int(hours, 'discount hours'), self._non_negative(factor, 'discount'))
+            for hours, factor in (rates.get('long_stay_discounts') or [])
+        )
+
+        # base[h] for h = 1..max_hours; a longer package caps the price of every shorter stay
+        base = [0.0] * (self.max_hours + 1)
+        for hours in range(1, self.max_hours + 1):
+            if hours in packages:
+                base[hours] = packages[hours]
+            else:
+                factor = 1.0
+                for threshold, discount in discounts:
+                    if hours >= threshold:
+                        factor = discount
+                base[hours] = hourly * hours * factor
+        cheapest = float('inf')
+        for hours in range(self.max_hours, 0, -1):
+            if hours in packages:
+                cheapest = min(cheapest, packages[hours])
+            base[hours] = min(base[hours], cheapest)
+        self.base = base
+
+        self.locations = {
+            str(name): self._non_negative(factor, 'location multiplier')
+            for name, factor in (rates.get('locations') or {}).items()
+        }
+        self.floors = {
+            str(floor): self._non_negative(factor, 'floor multiplier')
+            for floor, factor in (rates.get('floors') or {}).items()
+        }
+
+        # Peak multiplier per hour of the week (Monday 00:00 = 0); overlapping rules take the highest
+        week = [None] * HOURS_PER_WEEK
+        for rule in rates.get('peak') or []:
+            if not isinstance(rule, dict):
+                raise ValueError('peak rules must be objects')
+            multiplier = self._non_negative(rule.get('multiplier', 1), 'peak multiplier')
+            for day in rule.get('days', range(7)):
+                for hour in rule.get('hours', range(24)):
+                    if not (isinstance(day, int) and isinstance(hour, int) and 0 <= day < 7 and 0 <= hour < 24):
+                        raise ValueError('peak days must be 0-6 and hours 0-23')
+                    slot = day * 24 + hour
+                    week[slot] = multiplier if week[slot] is None else max(week[slot], multiplier)
+        week = [1.0 if multiplier is None else multiplier for multiplier in week]
+        # Two weeks of prefix sums so a window that wraps past Sunday night is one subtraction
+        self.week_total = sum(week)
+        self.prefix = [0.0]
+        for multiplier in week + week:
+            self.prefix.append(self.prefix[-1] + multiplier)
+
+    @staticmethod
+    def _positive_int(value, name):
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{name} must be a whole number')
+        if number <= 0:
+            raise ValueError(f'{name} must be positive')
+        return number
+
+    @staticmethod
+    def _non_negative(value, name):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            raise ValueError(f'{name} must be a non-negative number')
+        return value
+
+    def peak_factor(self, start_dt, hours):
+        """Average peak multiplier over the whole hours starting at ``start_dt``'s hour."""
+        start = start_dt.weekday() * 24 + start_dt.hour
+        weeks, rest = divmod(hours, HOURS_PER_WEEK)
+        weighted = weeks * self.week_total + self.prefix[start + rest] - self.prefix[start]
+        return weighted / hours
+
+    def quote(self, location, floor, start_dt, hours):
+        """Price of ``hours`` whole hours from ``start_dt`` at ``location``/``floor``, with its breakdown."""
+        if hours < 1:
+            raise ValueError('Duration must be positive')
+        if hours > self.max_hours:
+            raise ValueError(f'Duration must be at most {self.max_hours} hours')
+        base = self.base[hours]
+        location_multiplier = self.locations.get(str(location), 1)
+        floor_multiplier = self.floors.get(str(floor), 1)
+        peak = self.peak_factor(start_dt, hours)
+        return {
+            'amount': _as_amount(base * location_multiplier * floor_multiplier * peak),
+            'base': _as_amount(base),
+            'location_multiplier': location_multiplier,
+            'floor_multiplier': floor_multiplier,
+            'peak_multiplier': round(peak, 4),
+        }
+
+    def amount(self, location, floor, start_dt, hours):
+        return self.quote(location, floor, start_dt, hours)['amount']
+
+
+class PricingEngine:
+    def __init__(self, meta, default_rates, check_seconds=5):
+        self.meta = meta
+        self.default_rates = default_rates
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._table = None
+        self._checked = 0.0
+
+    def ensure_seeded(self):
+        """Store the configured table when it changed since it was last seeded. Returns whether it wrote."""
+        source = rates_fingerprint(self.default_rates)
+        doc = self.meta.find_one({'_id': RATES_ID}, {'source': 1})
+        if doc and doc.get('source') == source:
+            # Tables set through the admin API stay until the configured table itself changes
+            return False
+        RateTable(self.default_rates)
+        self.meta.update_one(
+            {'_id': RATES_ID},
+            {'$set': {'rates': self.default_rates, 'source': source, 'updated_at': datetime.utcnow()},
+             '$inc': {'version': 1}},
+            upsert=True
+        )
+        self._checked = 0.0
+        return True
+
+    def table(self):
+        """The compiled current table; the stored version is re-read at most every ``check_seconds``."""
+        now = time.monotonic()
+        table = self._table
+        if table is not None and now - self._checked < self.check_seconds:
+            return table
+        doc = self.meta.find_one({'_id': RATES_ID}, {'version': 1}) or {}
+        if table is None or doc.get('version', 0) != table.version:
+            doc = self.meta.find_one({'_id': RATES_ID}) or {}
+            table = RateTable(doc.get('rates', self.default_rates), doc.get('version', 0))
+        with self._lock:
+            self._table = table
+            self._checked = now
+        return table
+
+    def replace(self, rates):
+        """Validate and store a new table (admin API); every worker picks it up on its next version check."""
+        RateTable(rates)
+        doc = self.meta.find_one_and_update(
+            {'_id': RATES_ID},
+            {'$set': {'rates': rates, 'updated_at': datetime.utcnow()}, '$inc': {'version': 1}},
+            upsert=True,
+            return_document=True
+        )
+        table = RateTable(rates, doc['version'])
+        with self._lock:
+            self._table = table
+            self._checked = time.monotonic()
+        return table
@@ -0,0 +1,166 @@
+"""
+Rate limiting and load shedding.
+
+``RateLimiter`` keeps a token bucket per (budget, client): a budget such as
+``'10/60'`` allows a burst of 10 requests and refills at 10 per 60 seconds.
+Buckets live in a backend with one method,
+``take(key, capacity, rate, cost) -> (allowed, retry_after_seconds)``:
+``MemoryBackend`` keeps them per process in a bounded LRU, ``MongoBackend``
+shares them between workers with one atomic pipeline update per request.
+
+``LoadShedder`` is a pymongo CommandListener tracking a moving average of
+MongoDB command latency; while it is above the budget, routes that can wait
+(polling, quotes) are answered with 429 and Retry-After before they add to
+the database's load.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument, monitoring
+from pymongo.errors import DuplicateKeyError
+
+# Commands that legitimately wait server-side (tailing change streams, long cursors)
+UNTIMED_COMMANDS = ('getMore',)
+
+
+def parse_budget(value):
+    """(capacity, refill per second) for 'requests/seconds'; None when the budget is off ('0' or empty)."""
+    if not value or str(value).strip() == '0':
+        return None
+    try:
+        requests, seconds = str(value).split('/')
+        capacity, per = int(requests), float(seconds)
+    except ValueError:
+        raise ValueError(f"Rate limit budgets look like '10/60', got {value!r}")
+    if capacity <= 0 or per <= 0:
+        return None
+    return capacity, capacity / per
+
+
+class MemoryBackend:
+    # Buckets are only visible to this process
+    in_process = True
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> (tokens, monotonic time of the last take)
+        self._buckets = OrderedDict()
+
+    def take(self, key, capacity, rate, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            # Evicted clients start again with a full bucket
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return allowed, 0 if allowed else (cost - tokens) / rate
+
+
+class MongoBackend:
+    in_process = False
+
+    def __init__(self, collection):
+        # A TTL index on expires_at (see indexes.py) drops buckets once they would be full again
+        self.collection = collection
+
+    def take(self, key, capacity, rate, cost=1):
+        now = datetime.utcnow()
+        elapsed = {'$divide': [{'$subtract': [now, {'$ifNull': ['$updated_at', now]}]}, 1000]}
+        refilled = {'$min': [capacity, {'$add': [{'$ifNull': ['$tokens', capacity]}, {'$multiply': [elapsed, rate]}]}]}
+        pipeline = [
+            {'$set': {'tokens': refilled, 'updated_at': now}},
+            {'$set': {'allowed': {'$gte': ['$tokens', cost]}}},
+            {'$set': {
+                'tokens': {'$cond': ['$allowed', {'$subtract': ['$tokens', cost]}, '$tokens']},
+                'expires_at': now + timedelta(seconds=capacity / rate),
+            }},
+        ]
+        try:
+            doc = self._take(key, pipeline)
+        except DuplicateKeyError:
+            # Two workers created the same bucket at once; the loser retries against the winner's
+            doc = self._take(key, pipeline)
+        return doc['allowed'], 0 if doc['allowed'] else (cost - doc['tokens']) / rate
+
+    def _take(self, key, pipeline):
+        return self.collection.find_one_and_update(
+            {'_id': key}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+        )
+
+
+class RateLimiter:
+    def __init__(self, backend, budgets):
+        self.backend = backend
+        # budget name -> (capacity, rate) or None
+        self.budgets = {name: parse_budget(value) for name, value in budgets.items()}
+        self._lock = threading.Lock()
+        # budget name -> rejected requests
+        self.rejected = dict.fromkeys(self.budgets, 0)
+
+    def check(self, budget, client, cost=1):
+        """(allowed, retry_after_seconds) for one request of ``client`` against ``budget``."""
+        limits = self.budgets.get(budget)
+        if limits is None:
+            return True, 0
+        allowed, retry_after = self.backend.take(f'{budget}:{client}', *limits, cost=cost)
+        if not allowed:
+            with self._lock:
+                self.rejected[budget] = self.rejected.get(budget, 0) + 1
+        return allowed, retry_after
+
+
+class LoadShedder(monitoring.CommandListener):
+    def __init__(self, latency_budget_ms=250, window_seconds=5, alpha=0.1):
+        self.latency_budget = latency_budget_ms / 1000
+        self.window_seconds = window_seconds
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._average = 0.0
+        self._updated = time.monotonic()
+        self.shed = 0
+
+    def _decayed(self, now):
+        # Without new samples the average fades over the window, so shedding every request
+        # cannot keep it high forever
+        return self._average * math.exp(-(now - self._updated) / self.window_seconds)
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._observe(event)
+
+    def failed(self, event):
+        self._observe(event)
+
+    def _observe(self, event):
+        if event.command_name in UNTIMED_COMMANDS:
+            return
+        seconds = event.duration_micros / 1e6
+        now = time.monotonic()
+        with self._lock:
+            self._average = self._decayed(now) * (1 - self.alpha) + seconds * self.alpha
+            self._updated = now
+
+    def latency_ms(self):
+        with self._lock:
+            return self._decayed(time.monotonic()) * 1000
+
+    def retry_after(self):
+        """Seconds a sheddable request should wait, or 0 when the database is within budget."""
+        if self.latency_budget <= 0 or self.latency_ms() / 1000 <= self.latency_budget:
+            return 0
+        with self._lock:
+            self.shed += 1
+        return self.window_seconds
@@ -1,56 +1,128 @@
-#!/usr/bin/env python3
-"""
-Parking System Backend Server
-Run this script to start the Flask development server
-"""
-
-import os
-import sys
-from app import app, initialize_data
-
-def main():
-    """Main function to start the server"""
-    print("🚗 Starting Parking System Backend Server...")
-    print("=" * 50)
-    
-    # Initialize database with default data
-    print("📊 Initializing database...")
-    initialize_data()
-    print("✅ Database initialized successfully")
-    
-    # Get configuration
-    host = os.environ.get('FLASK_HOST', '0.0.0.0')
-    port = int(os.environ.get('FLASK_PORT', 5000))
-    debug = os.environ.get('FLASK_DEBUG', 'True').lower() == 'true'
-    
-    print(f"🌐 Server will run on: http://{host}:{port}")
-    print(f"🔧 Debug mode: {'ON' if debug else 'OFF'}")
-    print("=" * 50)
-    print("📋 Available endpoints:")
-    print("   POST /api/auth/login - User login")
-    print("   POST /api/auth/register - User registration")
-    print("   GET  /api/parking-slots - Get parking slots")
-    print("   GET  /api/bookings - Get bookings")
-    print("   POST /api/bookings - Create booking")
-    print("   GET  /api/admin/stats - Admin statistics")
-    print("   GET  /api/health - Health check")
-    print("=" * 50)
-    print("🔑 Default users:")
-    print("   Admin: admin / admin123")
-    print("   Customer: customer / customer123")
-    print("=" * 50)
-    print("🚀 Starting server...")
-    print("Press Ctrl+C to stop the server")
-    print("=" * 50)
-    
-    try:
-        app.run(host=host, port=port, debug=debug)
-    except KeyboardInterrupt:
-        print("\n🛑 Server stopped by user")
-    except Exception as e:
-        print(f"❌ Error starting server: {e}")
-        sys.exit(1)
-
-if __name__ == '__main__':
-    main()
-
+#!/usr/bin/env python3
+"""
+Parking System Backend Server
+Run this script to start the Flask development server
+"""
+
+import argparse
+import os
+import sys
+from app import DATABASE_NAME, analytics_rollups, app, db, initialize_data, mongo
+from config import Config
+from indexes import ensure_indexes, explain_route_queries
+from locations import SHARD_KEYS, shard_collections
+
+def report_index_usage():
+    """Print which index (if any) serves each route's query shape, via explain()"""
+    ensure_indexes(db)
+    report = explain_route_queries(db)
+    print("🔍 Index usage per route query:")
+    for entry in report:
+        mark = "✅" if entry['uses_index'] else "❌"
+        indexes = ', '.join(entry['indexes']) or 'none'
+        stages = ' <- '.join(s for s in entry['stages'] if s)
+        print(f"   {mark} {entry['route']} [{entry['collection']}] index: {indexes} ({stages})")
+    return all(entry['uses_index'] for entry in report)
+
+def backfill_analytics():
+    """Rebuild the analytics rollups from every booking (live and archived)"""
+    print("📈 Rebuilding analytics rollups...")
+    batches, documents = analytics_rollups.backfill()
+    # The rebuilt collection replaced the old one and its indexes
+    ensure_indexes(db)
+    print(f"✅ {documents} rollup documents from {batches} aggregation batches")
+
+def shard_by_location():
+    """Shard the per-location collections on their location-prefixed keys (run against a mongos)"""
+    ensure_indexes(db)
+    print(f"🧩 Sharding {DATABASE_NAME}...")
+    for name in shard_collections(mongo.client(), DATABASE_NAME):
+        key = ', '.join(field for field, _ in SHARD_KEYS[name])
+        print(f"   ✅ {name} on ({key})")
+
+def main():
+    """Main function to start the server"""
+    parser = argparse.ArgumentParser(description="Parking System Backend Server")
+    parser.add_argument('--explain-indexes', action='store_true',
+                        help="report index usage for each route's query shape and exit")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="serve the async API (asgi_app: Starlette + Motor) with uvicorn")
+    parser.add_argument('--backfill-analytics', action='store_true',
+                        help="rebuild the analytics rollups from all bookings and exit")
+    parser.add_argument('--shard-collections', action='store_true',
+                        help="shard slots and bookings by location on a sharded cluster and exit")
+    args = parser.parse_args()
+
+    if args.explain_indexes:
+        sys.exit(0 if report_index_usage() else 1)
+    if args.backfill_analytics:
+        backfill_analytics()
+        sys.exit(0)
+    if args.shard_collections:
+        shard_by_location()
+        sys.exit(0)
+
+    print("🚗 Starting Parking System Backend Server...")
+    print("=" * 50)
+    
+    # The database was initialized when app was imported; this only re-checks the schema version
+    print("📊 Initializing database...")
+    initialize_data()
+    print("✅ Database initialized successfully")
+    
+    # Get configuration
+    host = os.environ.get('FLASK_HOST', '0.0.0.0')
+    port = int(os.environ.get('FLASK_PORT', 5000))
+    debug = os.environ.get('FLASK_DEBUG', 'True').lower() == 'true'
+    
+    print(f"🌐 Server will run on: http://{host}:{port}")
+    print(f"🔧 Mode: {'async (ASGI, uvicorn)' if args.use_async else 'sync (WSGI)'}")
+    print(f"🔧 Debug mode: {'ON' if debug else 'OFF'}")
+    print("=" * 50)
+    print("📋 Available endpoints:")
+    print("   POST /api/auth/login - User login")
+    print("   POST /api/auth/register - User registration")
+    print("   GET  /api/locations - Locations with their layout and settings")
+    print("   GET  /api/parking-slots - Get parking slots")
+    print("   GET  /api/parking-slots/stream - Live slot updates (SSE)")
+    print("   GET  /api/availability - Free slots for a time window")
+    print("   GET  /api/parking-slots/suggest - Nearest free slots for a time window")
+    print("   POST /api/quotes - Price candidate booking windows")
+    print("   GET  /api/bookings - Get bookings")
+    print("   POST /api/bookings - Create booking")
+    print("   POST /api/bookings/fleet - Book neighbouring slots for several vehicles")
+    print("   POST /api/bookings:batch - Batch booking changes")
+    print("   GET  /api/waitlist - Waitlist entries")
+    print("   DELETE /api/waitlist/<id> - Leave the waitlist")
+    print("   POST /api/admin/slots:batch - Batch slot updates (admin)")
+    print("   GET  /api/admin/stats - Admin statistics")
+    print("   GET  /api/admin/analytics - Occupancy and revenue over time (admin)")
+    print("   PUT  /api/admin/rates - Replace the rate table (admin)")
+    print("   PUT  /api/admin/locations/<name> - Create or change a location (admin)")
+    print("   GET  /api/metrics - Prometheus metrics")
+    print("   GET  /api/health - Health check")
+    print("=" * 50)
+    print("🔑 Default users:")
+    print("   Admin: admin / admin123")
+    print("   Customer: customer / customer123")
+    print("=" * 50)
+    print("🚀 Starting server...")
+    print("Press Ctrl+C to stop the server")
+    print("=" * 50)
+    
+    try:
+        if args.use_async:
+            import uvicorn
+            uvicorn.run('asgi_app:app', host=host, port=port, reload=debug,
+                        proxy_headers=True, forwarded_allow_ips=Config.FORWARDED_ALLOW_IPS)
+        else:
+            app.run(host=host, port=port, debug=debug)
+    except KeyboardInterrupt:
+        print("\n🛑 Server stopped by user")
+    except Exception as e:
+        print(f"❌ Error starting server: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
+
@@ -0,0 +1,87 @@
+"""
+JSON provider for the Flask app.
+
+``FastJSONProvider`` serializes ObjectId (as its hex string) and datetime (as
+the same HTTP date Flask's default provider produces) itself, so routes can hand
+MongoDB documents over without converting them first. When orjson is installed
+(and ``JSON_ENCODER`` is not ``stdlib``) it encodes straight to bytes; otherwise
+it falls back to the stdlib encoder with the same output.
+"""
+
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+_DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def http_date(value):
+    """Same string as werkzeug's http_date for a datetime (naive means UTC), without the email.utils detour."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return (f'{_DAYS[value.weekday()]}, {value.day:02d} {_MONTHS[value.month - 1]} {value.year:04d} '
+            f'{value.hour:02d}:{value.minute:02d}:{value.second:02d} GMT')
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return http_date(value)
+    # Plain dates, Decimal, UUID, dataclasses: as Flask's own provider does
+    return DefaultJSONProvider.default(value)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    default = staticmethod(_default)
+    # 'auto' uses orjson when it is importable, 'stdlib' never does
+    encoder = 'auto'
+
+    @property
+    def uses_orjson(self):
+        return orjson is not None and self.encoder != 'stdlib'
+
+    def _orjson_options(self, indent=False):
+        # Datetimes go through _default so both encoders format them the same way
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps_bytes(self, obj, indent=False):
+        """``obj`` as UTF-8 JSON bytes."""
+        if self.uses_orjson:
+            try:
+                return orjson.dumps(obj, default=_default, option=self._orjson_options(indent))
+            except orjson.JSONEncodeError:
+                # e.g. integers beyond 64 bits, which only the stdlib encoder accepts
+                pass
+        return super().dumps(obj, indent=2 if indent else None).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        if self.uses_orjson and not kwargs:
+            return self.dumps_bytes(obj).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if self.uses_orjson and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if not self.uses_orjson:
+            return super().response(*args, **kwargs)
+        # Skip the str round-trip: orjson already produced the body bytes
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        body = self.dumps_bytes(self._prepare_response_obj(args, kwargs), indent) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
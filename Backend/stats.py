@@ -0,0 +1,173 @@
+"""
+Admin dashboard statistics.
+
+``compute`` gets every figure from one aggregation: bookings, archived
+bookings and parking_slots are combined with $unionWith and split again by
+$facet into per-(location, floor) groups. ``StatsStore`` can also keep those groups
+materialized in a single document that booking writes update with $inc, so
+the dashboard reads one document no matter how many bookings exist. Slot
+counts in it are tagged with the slot version counter every slot write bumps
+(see caching.py); a read that finds the version moved re-counts the slots
+first, so availability is never staler than the last slot write.
+"""
+
+from caching import SLOTS_VERSION_ID
+
+STATS_ID = 'dashboard'
+
+GROUP_FIELDS = ('total_bookings', 'active_bookings', 'revenue', 'total_slots', 'available_slots')
+
+
+def stats_pipeline(slots_collection_name, archive_collection_name=None):
+    group_id = {'location': '$location', 'floor': '$floor'}
+    booking_fields = {'$project': {'kind': {'$literal': 'booking'}, 'status': 1, 'amount': 1, 'location': 1, 'floor': 1}}
+    archived = []
+    if archive_collection_name:
+        archived = [{'$unionWith': {'coll': archive_collection_name, 'pipeline': [booking_fields]}}]
+    return [
+        booking_fields,
+        *archived,
+        {'$unionWith': {'coll': slots_collection_name, 'pipeline': [
+            {'$project': {'kind': {'$literal': 'slot'}, 'status': 1, 'location': 1, 'floor': 1}}
+        ]}},
+        {'$facet': {
+            'bookings': [
+                {'$match': {'kind': 'booking'}},
+                {'$group': {
+                    '_id': group_id,
+                    'total_bookings': {'$sum': 1},
+                    'active_bookings': {'$sum': {'$cond': [{'$eq': ['$status', 'active']}, 1, 0]}},
+                    'revenue': {'$sum': '$amount'},
+                }},
+            ],
+            'slots': [
+                {'$match': {'kind': 'slot'}},
+                {'$group': {
+                    '_id': group_id,
+                    'total_slots': {'$sum': 1},
+                    'available_slots': {'$sum': {'$cond': [{'$eq': ['$status', 'available']}, 1, 0]}},
+                }},
+            ],
+        }},
+    ]
+
+
+def as_amount(value):
+    """Booking amounts are priced server-side, but admin edits and older documents may hold anything; non-numeric counts as zero."""
+    return value if isinstance(value, (int, float)) else 0
+
+
+def summarize(groups):
+    """Turn {location: {floor: counters}} into the /api/admin/stats response."""
+    totals = dict.fromkeys(GROUP_FIELDS, 0)
+    by_location = {}
+    for location, floors in groups.items():
+        loc_totals = dict.fromkeys(GROUP_FIELDS, 0)
+        loc_floors = {}
+        for floor, counters in floors.items():
+            counters = {field: counters.get(field, 0) for field in GROUP_FIELDS}
+            loc_floors[str(floor)] = counters
+            for field in GROUP_FIELDS:
+                loc_totals[field] += counters[field]
+        for field in GROUP_FIELDS:
+            totals[field] += loc_totals[field]
+        by_location[location] = {**loc_totals, 'floors': loc_floors}
+
+    return {
+        'total_bookings': totals['total_bookings'],
+        'active_bookings': totals['active_bookings'],
+        'total_revenue': totals['revenue'],
+        'available_slots': totals['available_slots'],
+        'total_slots': totals['total_slots'],
+        'by_location': by_location,
+    }
+
+
+def fold_facets(result):
+    """Per-(location, floor) counters from the documents returned by ``stats_pipeline``."""
+    facets = result[0] if result else {'bookings': [], 'slots': []}
+    groups = {}
+    for row in facets['bookings'] + facets['slots']:
+        key = row['_id']
+        counters = groups.setdefault(str(key.get('location')), {}).setdefault(str(key.get('floor', 1)), {})
+        for field in GROUP_FIELDS:
+            if field in row:
+                counters[field] = as_amount(row[field])
+    return groups
+
+
+def booking_increments(location, floor, total_bookings=0, active_bookings=0, revenue=0):
+    """$inc paths on the materialized document for one booking write (empty when nothing changes)."""
+    prefix = f'groups.{location}.{floor or 1}'
+    inc = {
+        f'{prefix}.total_bookings': total_bookings,
+        f'{prefix}.active_bookings': active_bookings,
+        f'{prefix}.revenue': as_amount(revenue),
+    }
+    return {path: value for path, value in inc.items() if value}
+
+
+class StatsStore:
+    def __init__(self, stats, bookings, parking_slots, archive=None, counters=None):
+        self.stats = stats
+        self.bookings = bookings
+        self.parking_slots = parking_slots
+        self.archive = archive
+        # Holds the slot version counter; without it slot counts are only refreshed by refresh_slots
+        self.counters = counters
+
+    def _slots_version(self):
+        if self.counters is None:
+            return None
+        counter = self.counters.find_one({'_id': SLOTS_VERSION_ID})
+        return counter['value'] if counter else 0
+
+    def _groups(self):
+        """Per-(location, floor) counters straight from the collections (one aggregation)."""
+        archive_name = self.archive.name if self.archive is not None else None
+        return fold_facets(list(self.bookings.aggregate(stats_pipeline(self.parking_slots.name, archive_name))))
+
+    def compute(self):
+        return summarize(self._groups())
+
+    def rebuild(self):
+        """Recompute the materialized document from scratch."""
+        # Read before counting: a slot write in between leaves the document a version behind, not ahead
+        version = self._slots_version()
+        self.stats.replace_one({'_id': STATS_ID},
+                               {'_id': STATS_ID, 'groups': self._groups(), 'slots_version': version}, upsert=True)
+
+    def read(self):
+        doc = self.stats.find_one({'_id': STATS_ID})
+        if doc is None:
+            self.rebuild()
+            doc = self.stats.find_one({'_id': STATS_ID}) or {}
+        elif self.counters is not None and doc.get('slots_version') != self._slots_version():
+            self.refresh_slots()
+            doc = self.stats.find_one({'_id': STATS_ID}) or {}
+        return summarize(doc.get('groups', {}))
+
+    def record_many(self, changes):
+        """Apply several booking writes, given as (location, floor, total, active, revenue), in one update."""
+        inc = {}
+        for change in changes:
+            for path, value in booking_increments(*change).items():
+                inc[path] = inc.get(path, 0) + value
+        inc = {path: value for path, value in inc.items() if value}
+        if inc:
+            self.stats.update_one({'_id': STATS_ID}, {'$inc': inc})
+
+    def refresh_slots(self):
+        """Re-count slot availability into the materialized document (one aggregation over the slots only)."""
+        version = self._slots_version()
+        rows = self.parking_slots.aggregate([{'$group': {
+            '_id': {'location': '$location', 'floor': '$floor'},
+            'total_slots': {'$sum': 1},
+            'available_slots': {'$sum': {'$cond': [{'$eq': ['$status', 'available']}, 1, 0]}},
+        }}])
+        updates = {'slots_version': version}
+        for row in rows:
+            prefix = f"groups.{row['_id'].get('location')}.{row['_id'].get('floor', 1)}"
+            updates[f'{prefix}.total_slots'] = row['total_slots']
+            updates[f'{prefix}.available_slots'] = row['available_slots']
+        self.stats.update_one({'_id': STATS_ID}, {'$set': updates})
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Booking concurrency stress test
+Fires many parallel POST /api/bookings at one slot and checks that exactly one wins,
+then closes the slot through the admin batch endpoint and checks it refuses bookings.
+
+    python stress_booking.py --requests 300 --workers 64              # uses MONGODB_URI
+    python stress_booking.py --requests 300 --workers 64 --mongomock  # in-memory stand-in
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def load_app(use_mongomock):
+    """Import the Flask app, optionally against an in-memory mongomock client"""
+    if use_mongomock:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("mongomock is not installed (pip install mongomock)")
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+        os.environ.setdefault('MONGODB_URI', 'mongodb://localhost:27017/')
+    os.environ.setdefault('EXPIRY_TICK_SECONDS', '0')
+    os.environ.setdefault('RATE_LIMITING', 'false')
+    import app as app_module
+    return app_module
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel booking stress test against one slot")
+    parser.add_argument('--requests', type=int, default=300, help="number of booking attempts")
+    parser.add_argument('--workers', type=int, default=64, help="concurrent client threads")
+    parser.add_argument('--location', default='CityMall')
+    parser.add_argument('--slot', default='F1-A1')
+    parser.add_argument('--mongomock', action='store_true', help="use an in-memory mongomock database")
+    args = parser.parse_args()
+
+    app_module = load_app(args.mongomock)
+    flask_app = app_module.app
+
+    # Start from a free slot with no active bookings on it, so the script can be rerun on one database
+    app_module.bookings_collection.delete_many(
+        {'location': args.location, 'slot': args.slot, 'status': 'active'}
+    )
+    # Bookings claim the slot through its reservations, so those go too (and a closed slot is reopened)
+    app_module.parking_slots_collection.update_one(
+        {'location': args.location, 'slot_id': args.slot},
+        {'$set': {'status': 'available', 'booked_by': None, 'reservations': [], 'closed': False}}
+    )
+    app_module._refresh_availability()
+    app_module._slots_changed()
+    if app_module.Config.STATS_MATERIALIZED:
+        app_module.stats_store.rebuild()
+
+    login = flask_app.test_client().post(
+        '/api/auth/login', json={'username': 'customer', 'password': 'customer123'}
+    )
+    headers = {'Authorization': f"Bearer {login.get_json()['access_token']}"}
+
+    def attempt(i):
+        client = flask_app.test_client()
+        started = time.perf_counter()
+        response = client.post('/api/bookings', headers=headers, json={
+            'slot': args.slot,
+            'location': args.location,
+            'name': f'Stress {i}',
+            'vehicle': f'ST{i:04d}',
+            'date': '2099-01-01',
+            'time': '10:00',
+            'duration': 1,
+            'amount': 20
+        })
+        return response.status_code, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(attempt, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    statuses = [status for status, _ in results]
+    wins = statuses.count(201)
+    rejected = statuses.count(400)
+    errors = len(statuses) - wins - rejected
+    active = app_module.bookings_collection.count_documents(
+        {'location': args.location, 'slot': args.slot, 'status': 'active'}
+    )
+    latencies = sorted(latency for _, latency in results)
+
+    print(f"🚗 {args.requests} booking attempts on {args.location}/{args.slot} with {args.workers} workers")
+    print(f"   201 created: {wins}  400 rejected: {rejected}  other: {errors}")
+    print(f"   active bookings on slot: {active}")
+    print(f"   throughput: {args.requests / elapsed:.1f} req/s  "
+          f"p50: {latencies[len(latencies) // 2] * 1000:.1f} ms  "
+          f"p99: {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms")
+
+    if wins != 1 or active != 1 or errors:
+        print("❌ Double booking or errors detected")
+        sys.exit(1)
+    print("✅ Exactly one booking won the slot")
+
+    # A slot closed by an admin takes no bookings, even for a window nothing else holds
+    admin_login = flask_app.test_client().post(
+        '/api/auth/login', json={'username': 'admin', 'password': 'admin123'}
+    )
+    admin_headers = {'Authorization': f"Bearer {admin_login.get_json()['access_token']}"}
+
+    def set_closed(closed):
+        return flask_app.test_client().post('/api/admin/slots:batch', headers=admin_headers, json={'operations': [
+            {'location': args.location, 'slot_id': args.slot, 'update': {'closed': closed}}
+        ]}).get_json()['results'][0]['ok']
+
+    closed_ok = set_closed(True)
+    closed_status = flask_app.test_client().post('/api/bookings', headers=headers, json={
+        'slot': args.slot,
+        'location': args.location,
+        'name': 'Stress closed',
+        'vehicle': 'ST9999',
+        'date': '2099-01-02',
+        'time': '10:00',
+        'duration': 1
+    }).status_code
+    reopened_ok = set_closed(False)
+    print(f"   booking a closed slot: {closed_status}")
+    if not closed_ok or not reopened_ok or closed_status != 409:
+        print("❌ Closed slot did not refuse the booking")
+        sys.exit(1)
+    print("✅ Closed slot refused the booking")
+
+
+if __name__ == '__main__':
+    main()
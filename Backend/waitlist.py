@@ -0,0 +1,279 @@
+"""
+Waitlist for fully booked windows.
+
+POST /api/bookings with ``"waitlist": true`` queues the request when every slot
+on its floor is taken for the window. Entries live in the ``waitlist``
+collection, so any worker can promote them, and each worker mirrors the waiting
+ones in a heap per (location, floor, start_at, end_at) queue: highest priority
+first (0 unless an admin set one), then oldest. The ``max_per_window`` cap is
+held in a counter document per queue (``waitlist_queues``): a join takes a place
+with a conditional ``$inc`` before inserting its entry, so concurrent joins on
+any worker cannot overshoot it, and cancellations, promotions and expiry give
+places back.
+
+When a booking gives its slot back (cancelled, deleted, moved, or dropped by
+reconciliation), ``Waitlist.promote`` offers the freed window to the queues it
+overlaps, found by bisecting the location/floor's sorted queue windows. The best
+head among them is claimed in MongoDB, so no two workers promote the same entry,
+and booked through the ``book`` callback; taking it off its heap is O(log n).
+Every promotion is passed to the hooks registered with ``add_hook``; a hook that
+raises is logged and does not undo the booking.
+"""
+
+import heapq
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReplaceOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+WAITING = 'waiting'
+PROMOTING = 'promoting'
+PROMOTED = 'promoted'
+EXPIRED = 'expired'
+CANCELLED = 'cancelled'
+
+QUEUE_FIELDS = {'location': 1, 'floor': 1, 'start_at': 1, 'end_at': 1, 'priority': 1}
+
+
+def queue_key(entry):
+    return entry['location'], entry['floor'], entry['start_at'], entry['end_at']
+
+
+def _heap_item(entry):
+    return -entry.get('priority', 0), entry['_id']
+
+
+def _queue_id(key):
+    """_id of a queue's counter document (field order matters for equality)."""
+    location, floor, start_at, end_at = key
+    return {'location': location, 'floor': floor, 'start_at': start_at, 'end_at': end_at}
+
+
+class Waitlist:
+    def __init__(self, entries, queues, book, max_per_window=50, claim_seconds=60, logger=None):
+        self.entries = entries
+        # One {_id: queue, waiting: entries waiting or being promoted} document per queue
+        self.queues = queues
+        # book(entry) -> the booking document, or None when no slot is free for the entry's window
+        self.book = book
+        self.max_per_window = max_per_window
+        self.claim_seconds = claim_seconds
+        self.logger = logger
+        self._lock = threading.Lock()
+        # (location, floor, start_at, end_at) -> heap of (-priority, entry _id)
+        self._queues = {}
+        # (location, floor) -> sorted [(start_at, end_at)] of the queues there
+        self._windows = {}
+        self._hooks = []
+        self.promoted = 0
+
+    def add_hook(self, fn):
+        """Call ``fn(entry, booking)`` after every promotion."""
+        self._hooks.append(fn)
+
+    def _push(self, entry):
+        key = queue_key(entry)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = []
+            insort(self._windows.setdefault(key[:2], []), key[2:])
+        heapq.heappush(queue, _heap_item(entry))
+
+    def _drop(self, key, item):
+        queue = self._queues.get(key)
+        if not queue:
+            return
+        if queue[0] == item:
+            heapq.heappop(queue)
+        elif item in queue:
+            # Only cancellations remove from the middle of a queue
+            queue.remove(item)
+            heapq.heapify(queue)
+        if not queue:
+            del self._queues[key]
+            windows = self._windows[key[:2]]
+            windows.pop(bisect_left(windows, key[2:]))
+            if not windows:
+                del self._windows[key[:2]]
+
+    def load(self, scope=None, now=None):
+        """Rebuild the queues from the waiting entries in MongoDB (``scope`` narrows them, e.g. to served locations)."""
+        now = now or datetime.utcnow()
+        scope = scope or {}
+        # Claims left by a worker that stopped mid-promotion go back to waiting
+        self.entries.update_many(
+            {**scope, 'status': PROMOTING, 'claimed_at': {'$lt': now - timedelta(seconds=self.claim_seconds)}},
+            {'$set': {'status': WAITING}, '$unset': {'claimed_at': ''}}
+        )
+        waiting = list(self.entries.find({**scope, 'status': WAITING, 'start_at': {'$gt': now}}, QUEUE_FIELDS))
+        with self._lock:
+            self._queues, self._windows = {}, {}
+            for entry in waiting:
+                self._push(entry)
+        return len(waiting)
+
+    def expire(self, scope=None, now=None):
+        """Mark waiting entries whose window has started as expired. Returns how many."""
+        now = now or datetime.utcnow()
+        expired = self.entries.update_many(
+            {**(scope or {}), 'status': WAITING, 'start_at': {'$lte': now}},
+            {'$set': {'status': EXPIRED, 'finished_at': now}}
+        ).modified_count
+        # Those queues are closed for good, so their counters go
+        self.queues.delete_many({**(scope or {}), 'start_at': {'$lte': now}})
+        return expired
+
+    def recount(self, scope=None, now=None):
+        """Rebuild the queue counters from the entries (for entries queued before the counters existed)."""
+        now = now or datetime.utcnow()
+        groups = self.entries.aggregate([
+            {'$match': {**(scope or {}), 'status': {'$in': [WAITING, PROMOTING]}, 'start_at': {'$gt': now}}},
+            {'$group': {
+                '_id': {'location': '$location', 'floor': '$floor', 'start_at': '$start_at', 'end_at': '$end_at'},
+                'waiting': {'$sum': 1},
+            }},
+        ])
+        ops = [
+            ReplaceOne({'_id': group['_id']}, {'location': group['_id']['location'],
+                                               'start_at': group['_id']['start_at'], 'waiting': group['waiting']},
+                       upsert=True)
+            for group in groups
+        ]
+        if ops:
+            self.queues.bulk_write(ops, ordered=False)
+        return len(ops)
+
+    def _leave(self, key):
+        """Give back an entry's place in its queue's counter."""
+        self.queues.update_one({'_id': _queue_id(key)}, {'$inc': {'waiting': -1}})
+
+    def position(self, entry):
+        """1-based place of a waiting entry in its queue, across all workers."""
+        location, floor, start_at, end_at = queue_key(entry)
+        priority = entry.get('priority', 0)
+        return 1 + self.entries.count_documents({
+            'status': WAITING, 'location': location, 'floor': floor, 'start_at': start_at, 'end_at': end_at,
+            '$or': [{'priority': {'$gt': priority}}, {'priority': priority, '_id': {'$lt': entry['_id']}}],
+        })
+
+    def join(self, entry):
+        """Queue ``entry`` (booking fields plus location, floor, start_at, end_at, priority). None when its queue is full."""
+        key = queue_key(entry)
+        try:
+            self.queues.update_one(
+                {'_id': _queue_id(key), 'waiting': {'$lt': self.max_per_window}},
+                {'$inc': {'waiting': 1}, '$setOnInsert': {'location': key[0], 'start_at': key[2]}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # The counter exists but is at the cap, so the upsert collided with it
+            return None
+        entry = {**entry, '_id': ObjectId(), 'status': WAITING, 'created_at': datetime.utcnow()}
+        entry.setdefault('priority', 0)
+        try:
+            self.entries.insert_one(entry)
+        except Exception:
+            self._leave(key)
+            raise
+        with self._lock:
+            self._push(entry)
+        return entry
+
+    def cancel(self, entry_id, query=None):
+        """Cancel a waiting entry (matching ``query`` too). Returns it, or None when no such entry is waiting."""
+        entry = self.entries.find_one_and_update(
+            {**(query or {}), '_id': entry_id, 'status': WAITING},
+            {'$set': {'status': CANCELLED, 'finished_at': datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if entry:
+            self._leave(queue_key(entry))
+            with self._lock:
+                self._drop(queue_key(entry), _heap_item(entry))
+        return entry
+
+    def _best_head(self, location, floor, start_dt, end_dt, now, tried):
+        """(key, head) of the best queue whose window overlaps [start_dt, end_dt) and has not started."""
+        windows = self._windows.get((location, floor), [])
+        best = None
+        # Windows are sorted by start, so only the ones before this bisect can overlap
+        for window_start, window_end in windows[:bisect_left(windows, (end_dt,))]:
+            key = (location, floor, window_start, window_end)
+            if window_end <= start_dt or window_start <= now or key in tried:
+                continue
+            head = self._queues[key][0]
+            if best is None or head < best[1]:
+                best = (key, head)
+        return best
+
+    def _release_claim(self, entry):
+        self.entries.update_one(
+            {'_id': entry['_id'], 'status': PROMOTING},
+            {'$set': {'status': WAITING}, '$unset': {'claimed_at': ''}}
+        )
+
+    def promote(self, location, floor, start_dt, end_dt, now=None):
+        """
+        Offer capacity freed on ``location``/``floor`` over [start_dt, end_dt) to the entries waiting for
+        overlapping windows, best first, until none of them can be booked. Returns [(entry, booking)].
+        """
+        now = now or datetime.utcnow()
+        promoted = []
+        # Queues whose head could not be booked: the entries behind it want the same window
+        tried = set()
+        while True:
+            with self._lock:
+                best = self._best_head(location, floor, start_dt, end_dt, now, tried)
+            if best is None:
+                break
+            key, head = best
+            entry = self.entries.find_one_and_update(
+                {'_id': head[1], 'status': WAITING},
+                {'$set': {'status': PROMOTING, 'claimed_at': now}},
+                return_document=ReturnDocument.AFTER
+            )
+            if entry is None:
+                # Promoted, cancelled or expired elsewhere
+                with self._lock:
+                    self._drop(key, head)
+                continue
+            try:
+                booking = self.book(entry)
+            except Exception:
+                self._release_claim(entry)
+                raise
+            if booking is None:
+                self._release_claim(entry)
+                tried.add(key)
+                continue
+
+            self.entries.update_one(
+                {'_id': entry['_id']},
+                {'$set': {'status': PROMOTED, 'booking_id': booking['_id'], 'finished_at': now},
+                 '$unset': {'claimed_at': ''}}
+            )
+            entry.update(status=PROMOTED, booking_id=booking['_id'])
+            self._leave(key)
+            with self._lock:
+                self._drop(key, head)
+                self.promoted += 1
+            promoted.append((entry, booking))
+            for hook in self._hooks:
+                try:
+                    hook(entry, booking)
+                except Exception:
+                    # The booking is made either way; a failing hook must not undo it
+                    if self.logger:
+                        self.logger.exception('Waitlist hook %r failed for entry %s', hook, entry['_id'])
+        return promoted
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queues': len(self._queues),
+                'waiting': sum(len(queue) for queue in self._queues.values()),
+                'promoted': self.promoted,
+            }
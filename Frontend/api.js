@@ -80,6 +80,12 @@ class ParkingAPI {
         return await this.makeRequest(endpoint);
     }
 
+    // Live slot status deltas (server-sent events); returns the EventSource
+    streamParkingSlots(location = null) {
+        const qs = location ? `?location=${encodeURIComponent(location)}` : '';
+        return new EventSource(`${API_BASE_URL}/parking-slots/stream${qs}`);
+    }
+
     async updateParkingSlot(slotId, data) {
         return await this.makeRequest(`/parking-slots/${slotId}`, {
             method: 'PUT',
@@ -112,6 +118,14 @@ class ParkingAPI {
         });
     }
 
+    // Prices of booking windows, the same ones POST /bookings charges
+    async getQuotes(windows, location = null) {
+        return await this.makeRequest('/quotes', {
+            method: 'POST',
+            body: JSON.stringify({ location, windows })
+        });
+    }
+
     // Admin endpoints
     async getAdminStats() {
         return await this.makeRequest('/admin/stats');
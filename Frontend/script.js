@@ -8,8 +8,53 @@ let currentCustomer = null;
 let myBookings = [];
 let filteredBookings = [];
 
-// Cross-tab updates from Admin using BroadcastChannel
+// Live slot updates from the server (SSE). BroadcastChannel also relays admin changes made in
+// this browser, and the listing is polled while no stream can be opened.
 let updatesChannel = null;
+let slotStream = null;
+let slotStreamLocation = null;
+let slotPollTimer = null;
+const SLOT_POLL_INTERVAL_MS = 30000;
+
+function startSlotPolling() {
+    if (!slotPollTimer) slotPollTimer = setInterval(initializeParkingSlots, SLOT_POLL_INTERVAL_MS);
+}
+
+function stopSlotPolling() {
+    clearInterval(slotPollTimer);
+    slotPollTimer = null;
+}
+
+function connectSlotStream() {
+    if (slotStream) slotStream.close();
+    slotStream = null;
+    slotStreamLocation = selectedLocation;
+    if (typeof EventSource === 'undefined') {
+        startSlotPolling();
+        return;
+    }
+    const stream = api.streamParkingSlots(selectedLocation);
+    slotStream = stream;
+    stream.addEventListener('open', stopSlotPolling);
+    stream.addEventListener('error', function() {
+        // EventSource retries dropped connections itself, but gives up on an error response (404, 503)
+        if (stream.readyState === EventSource.CLOSED) startSlotPolling();
+    });
+    stream.addEventListener('slot', function(event) {
+        const delta = JSON.parse(event.data);
+        const slot = parkingSlots[delta.slot_id];
+        if (delta.location !== selectedLocation || !slot) return;
+        slot.status = delta.status;
+        slot.bookedBy = delta.booked_by;
+        updateParkingGrid();
+        updateAvailabilityStats();
+        updateSlotDropdown();
+    });
+    stream.addEventListener('reset', async function() {
+        await initializeParkingSlots();
+    });
+}
+
 try {
     updatesChannel = new BroadcastChannel('parking-updates');
     updatesChannel.onmessage = async function() {
@@ -36,6 +81,10 @@ async function initializeParkingSlots() {
         updateParkingGrid();
         updateAvailabilityStats();
         updateSlotDropdown();
+        // (Re)subscribe when the location changes
+        if (slotStreamLocation !== selectedLocation) {
+            connectSlotStream();
+        }
     } catch (error) {
         console.error('Error loading parking slots:', error);
         // Fallback to default slots if API fails
@@ -97,9 +146,10 @@ function setupEventListeners() {
     if (bookingForm) {
         bookingForm.addEventListener('submit', handleBookingSubmit);
         
-        // Duration change listener for price calculation
-        const durationSelect = document.getElementById('duration');
-        durationSelect.addEventListener('change', calculateTotal);
+        // The total is quoted again whenever the window or slot changes
+        ['duration', 'date', 'time', 'slot'].forEach(id => {
+            document.getElementById(id).addEventListener('change', calculateTotal);
+        });
 
         // Location/Floor change affects slot list
         const locationSelect = document.getElementById('location');
@@ -107,6 +157,7 @@ function setupEventListeners() {
             locationSelect.addEventListener('change', async function() {
                 selectedLocation = this.value;
                 await initializeParkingSlots();
+                calculateTotal();
             });
         }
 
@@ -115,6 +166,7 @@ function setupEventListeners() {
             floorSelect.addEventListener('change', async function() {
                 selectedFloor = parseInt(this.value, 10);
                 await initializeParkingSlots();
+                calculateTotal();
             });
         }
     }
@@ -279,23 +331,41 @@ function validateBookingForm(data) {
     return true;
 }
 
-function calculateTotal() {
-    const durationSelect = document.getElementById('duration');
-    const totalAmountSpan = document.getElementById('totalAmount');
-    
-    const duration = durationSelect.value;
-    let amount = 0;
-    
-    switch(duration) {
-        case '1': amount = 20; break;
-        case '2': amount = 35; break;
-        case '4': amount = 60; break;
-        case '8': amount = 100; break;
-        case '24': amount = 200; break;
-        default: amount = 0;
+// Floor of a slot id like F1-A1 (the selected floor when it has none)
+function slotFloor(slotId) {
+    const floor = /^F(\d+)-/.exec(slotId || '')?.[1];
+    return floor ? parseInt(floor, 10) : selectedFloor;
+}
+
+// Price of a booking window from POST /api/quotes, the same one the booking is charged;
+// null until the window is complete or when it cannot be priced
+async function quoteAmount(location, floor, date, time, duration) {
+    if (!location || !date || !time || !duration) return null;
+    try {
+        const result = await api.getQuotes([{ location, floor, date, time, duration: parseInt(duration, 10) }]);
+        const quote = result.quotes[0];
+        return quote && quote.ok ? quote.amount : null;
+    } catch (error) {
+        return null;
     }
-    
-    totalAmountSpan.textContent = amount;
+}
+
+// Only the latest quote is shown when the form changes faster than quotes come back
+let totalQuoteRequest = 0;
+
+async function calculateTotal() {
+    const totalAmountSpan = document.getElementById('totalAmount');
+    const slot = document.getElementById('slot').value;
+    const request = ++totalQuoteRequest;
+    const amount = await quoteAmount(
+        selectedLocation,
+        slotFloor(slot),
+        document.getElementById('date').value,
+        document.getElementById('time').value,
+        document.getElementById('duration').value
+    );
+    if (request !== totalQuoteRequest) return;
+    totalAmountSpan.textContent = amount === null ? 0 : amount;
 }
 
 function updateSlotDropdown() {
@@ -424,21 +494,15 @@ function renderSlotsGrid() {
 }
 
 // Payment Functions
-function updatePaymentSummary(data) {
+async function updatePaymentSummary(data) {
     document.getElementById('paymentSlot').textContent = data.slot;
     document.getElementById('paymentDuration').textContent = `${data.duration} hour${data.duration > 1 ? 's' : ''}`;
     document.getElementById('paymentDate').textContent = data.date;
     
-    let amount = 0;
-    switch(data.duration) {
-        case '1': amount = 20; break;
-        case '2': amount = 35; break;
-        case '4': amount = 60; break;
-        case '8': amount = 100; break;
-        case '24': amount = 200; break;
-    }
-    
-    document.getElementById('paymentTotal').textContent = `₹${amount}`;
+    const paymentTotal = document.getElementById('paymentTotal');
+    paymentTotal.textContent = '₹…';
+    const amount = await quoteAmount(data.location, slotFloor(data.slot), data.date, data.time, data.duration);
+    paymentTotal.textContent = amount === null ? '₹-' : `₹${amount}`;
 }
 
 function switchPaymentMethod(method) {
@@ -527,16 +591,6 @@ function processPayment() {
     
     setTimeout(async () => {
         try {
-            // Calculate amount
-            let amount = 0;
-            switch(bookingData.duration) {
-                case '1': amount = 20; break;
-                case '2': amount = 35; break;
-                case '4': amount = 60; break;
-                case '8': amount = 100; break;
-                case '24': amount = 200; break;
-            }
-
             // Ensure we are authenticated
             if (!api.token) {
                 // If user is not logged in, show login modal
@@ -564,7 +618,7 @@ function processPayment() {
                 }
             }
             
-            // Create booking via API
+            // Create booking via API; the server prices it (the total shown came from /api/quotes)
             const bookingData_api = {
                 name: bookingData.name,
                 vehicle: bookingData.vehicle,
@@ -572,8 +626,7 @@ function processPayment() {
                 location: bookingData.location || selectedLocation,
                 date: bookingData.date,
                 time: bookingData.time,
-                duration: parseInt(bookingData.duration),
-                amount: amount
+                duration: parseInt(bookingData.duration)
             };
             
             const newBooking = await api.createBooking(bookingData_api);
@@ -960,16 +1013,17 @@ function closeExtendModal() {
     document.getElementById('extendBookingModal').style.display = 'none';
 }
 
-function calculateExtendAmount() {
-    const duration = parseInt(document.getElementById('extendDuration').value);
-    let amount = 0;
-    switch(duration) {
-        case 1: amount = 20; break;
-        case 2: amount = 35; break;
-        case 4: amount = 60; break;
-        case 8: amount = 100; break;
-    }
-    document.getElementById('extendAmount').textContent = amount;
+// The extension costs the longer window's quote less what the booking already cost
+async function calculateExtendAmount() {
+    const bookingId = document.getElementById('extendBookingForm').getAttribute('data-booking-id');
+    const booking = myBookings.find(b => b._id === bookingId);
+    if (!booking) return;
+    const extendAmount = document.getElementById('extendAmount');
+    const duration = booking.duration + parseInt(document.getElementById('extendDuration').value, 10);
+    const amount = await quoteAmount(
+        booking.location, booking.floor || slotFloor(booking.slot), booking.date, booking.time, duration
+    );
+    extendAmount.textContent = amount === null ? '-' : Math.round((amount - (booking.amount || 0)) * 100) / 100;
 }
 
 async function handleExtendBooking(e) {
@@ -979,12 +1033,10 @@ async function handleExtendBooking(e) {
     if (!booking) return;
     
     const additionalDuration = parseInt(document.getElementById('extendDuration').value);
-    const additionalAmount = parseInt(document.getElementById('extendAmount').textContent);
     
     try {
-        // Calculate new duration and amount
+        // Calculate new duration; the server reprices the longer window
         const newDuration = booking.duration + additionalDuration;
-        const newAmount = booking.amount + additionalAmount;
         
         // Calculate new end time
         const bookingDate = new Date(`${booking.date} ${booking.time}`);
@@ -1000,7 +1052,6 @@ async function handleExtendBooking(e) {
         // Update booking
         await api.updateBooking(bookingId, {
             duration: newDuration,
-            amount: newAmount,
             end_at: newEndAt
         });
         